@@ -0,0 +1,348 @@
+"""Statistiques agrégées vectorisées (NumPy) sur les résultats d'analyse."""
+import csv
+from typing import Dict, List, Optional
+import numpy as np
+from config import Config
+
+# Quantile de la loi normale pour les intervalles de confiance à 95%
+Z_95 = 1.959964
+
+
+class ResultsFrame:
+    """Résultats d'analyse chargés en tableaux colonnaires.
+    
+    Les champs select sont encodés en indices dans les taxonomies Config (-1 = absent ou hors liste),
+    les champs multiselect en matrices booléennes (n_appels × n_valeurs).
+    """
+    
+    def __init__(
+        self,
+        call_reasons: np.ndarray,
+        sentiments: np.ndarray,
+        failures: np.ndarray,
+        call_tags: np.ndarray,
+        models: np.ndarray,
+        agents: np.ndarray,
+        timestamps: np.ndarray
+    ):
+        self.call_reasons = call_reasons
+        self.sentiments = sentiments
+        self.failures = failures
+        self.call_tags = call_tags
+        self.models = models
+        self.agents = agents
+        self.timestamps = timestamps
+        self.reason_values = Config.get_call_reasons_values()
+        self.sentiment_values = Config.get_user_sentiments_values()
+        self.error_tag_values = Config.get_error_tags_values()
+        self.call_tag_values = Config.get_call_tags_values()
+    
+    def __len__(self) -> int:
+        return len(self.call_reasons)
+    
+    @classmethod
+    def from_records(cls, records: List[dict]) -> "ResultsFrame":
+        """Construit le frame depuis des enregistrements result_records.
+        
+        Les échecs et les analyses partielles sans failure_reasons sont ignorés: comptés comme
+        "aucun échec", ils feraient baisser les taux.
+        """
+        records = [r for r in records if not r.get("error") and "failure_reasons" not in (r.get("missing_attributes") or [])]
+        n = len(records)
+        error_index = _index(Config.get_error_tags_values())
+        call_tag_index = _index(Config.get_call_tags_values())
+        failures = np.zeros((n, len(error_index)), dtype=bool)
+        call_tags = np.zeros((n, len(call_tag_index)), dtype=bool)
+        _fill_matrix(failures, [r.get("failure_reasons") or [] for r in records], error_index)
+        _fill_matrix(call_tags, [r.get("call_tags") or [] for r in records], call_tag_index)
+        return cls(
+            call_reasons=_encode([r.get("call_reason") for r in records], Config.get_call_reasons_values()),
+            sentiments=_encode([r.get("user_sentiment") for r in records], Config.get_user_sentiments_values()),
+            failures=failures,
+            call_tags=call_tags,
+            models=np.array([r.get("model_used") or "" for r in records], dtype=object),
+            agents=np.array([r.get("agent_id") or "" for r in records], dtype=object),
+            timestamps=np.array([str(r.get("analyzed_at") or "") for r in records], dtype=object)
+        )
+    
+    @classmethod
+    def from_database(cls, db, since: Optional[str] = None, until: Optional[str] = None, model: Optional[str] = None) -> "ResultsFrame":
+        """Charge les analyses d'une ResultsDatabase (une requête par table, remplissage vectorisé)."""
+        data = db.analysis_columns(since=since, until=until, model=model)
+        rows, failure_rows, tag_rows = data["rows"], data["failure_reasons"], data["call_tags"]
+        
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        columns = list(zip(*[tuple(row)[1:] for row in rows])) if rows else [()] * 5
+        frame = cls(
+            call_reasons=_encode(columns[0], Config.get_call_reasons_values()),
+            sentiments=_encode(columns[1], Config.get_user_sentiments_values()),
+            failures=_pairs_to_matrix(ids, failure_rows, Config.get_error_tags_values()),
+            call_tags=_pairs_to_matrix(ids, tag_rows, Config.get_call_tags_values()),
+            models=np.array([m or "" for m in columns[2]], dtype=object),
+            agents=np.array([a or "" for a in columns[3]], dtype=object),
+            timestamps=np.array(columns[4], dtype=object)
+        )
+        return frame
+    
+    @classmethod
+    def from_columnar(cls, store, start_date: Optional[str] = None, end_date: Optional[str] = None, models: Optional[List[str]] = None) -> "ResultsFrame":
+        """Charge un dataset Parquet (ColumnarResultsStore) en ne lisant que les colonnes utiles."""
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        
+        table = store.read(
+            columns=["call_reason", "user_sentiment", "failure_reasons", "call_tags", "model_used", "analyzed_at", "missing_attributes", "error"],
+            start_date=start_date,
+            end_date=end_date,
+            models=models
+        )
+        table = table.filter(pc.is_null(table["error"]))
+        # Analyses partielles sans failure_reasons: exclues comme dans from_records
+        missing = table["missing_attributes"].combine_chunks()
+        parents = pc.list_parent_indices(missing).to_numpy()
+        flags = pc.fill_null(pc.equal(pc.list_flatten(missing), "failure_reasons"), False).to_numpy(zero_copy_only=False)
+        extracted = np.ones(table.num_rows, dtype=bool)
+        extracted[parents[flags]] = False
+        table = table.filter(pa.array(extracted))
+        n = table.num_rows
+        
+        def codes(column: str, values: List[str]) -> np.ndarray:
+            index = pc.index_in(table[column], value_set=pa.array(values))
+            return pc.fill_null(index, -1).to_numpy().astype(np.int16)
+        
+        def matrix(column: str, values: List[str]) -> np.ndarray:
+            lists = table[column].combine_chunks()
+            result = np.zeros((n, len(values)), dtype=bool)
+            if n == 0:
+                return result
+            rows = pc.list_parent_indices(lists).to_numpy()
+            cols = pc.fill_null(pc.index_in(pc.list_flatten(lists), value_set=pa.array(values)), -1).to_numpy()
+            valid = cols >= 0
+            result[rows[valid], cols[valid]] = True
+            return result
+        
+        return cls(
+            call_reasons=codes("call_reason", Config.get_call_reasons_values()),
+            sentiments=codes("user_sentiment", Config.get_user_sentiments_values()),
+            failures=matrix("failure_reasons", Config.get_error_tags_values()),
+            call_tags=matrix("call_tags", Config.get_call_tags_values()),
+            models=np.array(table["model_used"].to_pylist(), dtype=object),
+            agents=np.full(n, "", dtype=object),
+            timestamps=np.array([str(t) for t in table["analyzed_at"].to_pylist()], dtype=object)
+        )
+    
+    @classmethod
+    def from_csv(cls, path: str, model: Optional[str] = None) -> "ResultsFrame":
+        """Charge un fichier analysis_results_*.csv (listes séparées par "; ").
+        
+        Le CSV ne contient pas de date d'analyse: seul le filtre sur le modèle est applicable.
+        """
+        records = []
+        with open(path, newline='', encoding='utf-8') as csvfile:
+            for row in csv.DictReader(csvfile):
+                if row.get("call_reason") == "ERROR" or (model and row.get("model_used") != model):
+                    continue
+                row["failure_reasons"] = [v.strip() for v in (row.get("failure_reasons") or "").split(";") if v.strip()]
+                row["call_tags"] = [v.strip() for v in (row.get("call_tags") or "").split(";") if v.strip()]
+                row["missing_attributes"] = [v.strip() for v in (row.get("missing_attributes") or "").split(";") if v.strip()]
+                records.append(row)
+        return cls.from_records(records)
+    
+    def filter(self, mask: np.ndarray) -> "ResultsFrame":
+        """Sous-ensemble des lignes sélectionnées par un masque booléen."""
+        return ResultsFrame(
+            self.call_reasons[mask],
+            self.sentiments[mask],
+            self.failures[mask],
+            self.call_tags[mask],
+            self.models[mask],
+            self.agents[mask],
+            self.timestamps[mask]
+        )
+
+
+def wilson_interval(successes: np.ndarray, totals: np.ndarray, z: float = Z_95) -> tuple:
+    """Intervalle de confiance de Wilson pour des proportions (vectorisé). Retourne (bas, haut)."""
+    successes = np.asarray(successes, dtype=float)
+    totals = np.asarray(totals, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = np.where(totals > 0, successes / totals, 0.0)
+        denominator = 1 + z ** 2 / totals
+        center = (p + z ** 2 / (2 * totals)) / denominator
+        half_width = z * np.sqrt(p * (1 - p) / totals + z ** 2 / (4 * totals ** 2)) / denominator
+    low = np.where(totals > 0, np.clip(center - half_width, 0, 1), 0.0)
+    high = np.where(totals > 0, np.clip(center + half_width, 0, 1), 0.0)
+    return low, high
+
+
+def failure_rates(frame: ResultsFrame) -> List[Dict]:
+    """Taux d'échec par tag d'erreur (ERROR_TAGS) avec intervalle de confiance à 95%."""
+    total = len(frame)
+    counts = frame.failures.sum(axis=0)
+    any_failure = int(frame.failures.any(axis=1).sum())
+    totals = np.full(len(counts), total)
+    low, high = wilson_interval(counts, totals)
+    rows = [
+        {"tag": tag, "count": int(c), "rate": (c / total) if total else 0.0, "ci_low": float(lo), "ci_high": float(hi)}
+        for tag, c, lo, hi in zip(frame.error_tag_values, counts, low, high)
+    ]
+    all_low, all_high = wilson_interval(np.array([any_failure]), np.array([total]))
+    rows.append({
+        "tag": "(au moins un échec)",
+        "count": any_failure,
+        "rate": (any_failure / total) if total else 0.0,
+        "ci_low": float(all_low[0]),
+        "ci_high": float(all_high[0])
+    })
+    return rows
+
+
+def contingency(row_codes: np.ndarray, n_rows: int, col_codes: np.ndarray, n_cols: int) -> np.ndarray:
+    """Table de contingence (n_rows × n_cols) de deux variables encodées (les codes -1 sont ignorés)."""
+    valid = (row_codes >= 0) & (col_codes >= 0)
+    flat = row_codes[valid].astype(np.int64) * n_cols + col_codes[valid]
+    return np.bincount(flat, minlength=n_rows * n_cols).reshape(n_rows, n_cols)
+
+
+def sentiment_by_reason(frame: ResultsFrame) -> Dict:
+    """Distribution des sentiments par motif d'appel (comptes et proportions par ligne)."""
+    counts = contingency(frame.call_reasons, len(frame.reason_values), frame.sentiments, len(frame.sentiment_values))
+    row_totals = counts.sum(axis=1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rates = np.where(row_totals > 0, counts / row_totals, 0.0)
+    return {"reasons": frame.reason_values, "sentiments": frame.sentiment_values, "counts": counts, "rates": rates}
+
+
+def failure_rates_by(frame: ResultsFrame, groups: np.ndarray) -> Dict:
+    """Taux d'échec par tag pour chaque groupe (ex: frame.models, frame.agents)."""
+    labels, group_codes = np.unique(groups.astype(str), return_inverse=True)
+    totals = np.bincount(group_codes, minlength=len(labels))
+    # Somme des lignes booléennes par groupe: (n_groupes × n_tags)
+    counts = np.zeros((len(labels), frame.failures.shape[1]), dtype=np.int64)
+    np.add.at(counts, group_codes, frame.failures.astype(np.int64))
+    any_counts = np.bincount(group_codes, weights=frame.failures.any(axis=1), minlength=len(labels)).astype(np.int64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rates = np.where(totals[:, None] > 0, counts / totals[:, None], 0.0)
+        any_rates = np.where(totals > 0, any_counts / totals, 0.0)
+    return {
+        "groups": labels.tolist(),
+        "tags": frame.error_tag_values,
+        "totals": totals,
+        "counts": counts,
+        "rates": rates,
+        "any_counts": any_counts,
+        "any_rates": any_rates
+    }
+
+
+def cooccurrence(matrix: np.ndarray) -> Dict[str, np.ndarray]:
+    """Matrice de co-occurrence (produit matriciel) et indice de Jaccard entre colonnes d'une matrice booléenne."""
+    m = matrix.astype(np.int32)
+    counts = m.T @ m
+    diagonal = np.diag(counts)
+    union = diagonal[:, None] + diagonal[None, :] - counts
+    with np.errstate(divide="ignore", invalid="ignore"):
+        jaccard = np.where(union > 0, counts / union, 0.0)
+    return {"counts": counts, "jaccard": jaccard}
+
+
+def _index(values: List[str]) -> Dict[str, int]:
+    return {value: i for i, value in enumerate(values)}
+
+
+def _encode(values, taxonomy: List[str]) -> np.ndarray:
+    """Encode une séquence de chaînes en indices dans la taxonomie (-1 si absente)."""
+    lookup = _index(taxonomy)
+    return np.fromiter((lookup.get(v, -1) for v in values), dtype=np.int16, count=len(values))
+
+
+def _fill_matrix(matrix: np.ndarray, lists: List[list], index: Dict[str, int]):
+    rows = [i for i, values in enumerate(lists) for v in values if v in index]
+    cols = [index[v] for values in lists for v in values if v in index]
+    matrix[rows, cols] = True
+
+
+def _pairs_to_matrix(ids: np.ndarray, pairs: list, taxonomy: List[str]) -> np.ndarray:
+    """Convertit des paires (analysis_id, valeur) en matrice booléenne alignée sur ids (trié)."""
+    matrix = np.zeros((len(ids), len(taxonomy)), dtype=bool)
+    if not pairs or len(ids) == 0:
+        return matrix
+    lookup = _index(taxonomy)
+    pair_ids = np.fromiter((p[0] for p in pairs), dtype=np.int64, count=len(pairs))
+    cols = np.fromiter((lookup.get(p[1], -1) for p in pairs), dtype=np.int64, count=len(pairs))
+    rows = np.searchsorted(ids, pair_ids)
+    valid = (cols >= 0) & (rows < len(ids))
+    valid[valid] &= ids[rows[valid]] == pair_ids[valid]
+    matrix[rows[valid], cols[valid]] = True
+    return matrix
+
+
+def print_report(frame: ResultsFrame):
+    """Affiche le rapport agrégé dans la console."""
+    print("=" * 70)
+    print(f"📊 RAPPORT D'ANALYSE - {len(frame)} appels")
+    print("=" * 70)
+    
+    print("\n❌ Taux d'échec par tag (IC 95%):")
+    for row in failure_rates(frame):
+        print(f"   {row['tag']:<26} {row['count']:>8}  {row['rate']:6.1%}  [{row['ci_low']:5.1%} - {row['ci_high']:5.1%}]")
+    
+    by_model = failure_rates_by(frame, frame.models)
+    if len(by_model["groups"]) > 1:
+        print("\n🤖 Appels avec échec par modèle:")
+        for group, total, rate in zip(by_model["groups"], by_model["totals"], by_model["any_rates"]):
+            print(f"   {group:<26} {total:>8}  {rate:6.1%}")
+    
+    table = sentiment_by_reason(frame)
+    print("\n😊 Sentiment par motif d'appel (% par ligne):")
+    header = "".join(f"{s[:9]:>10}" for s in table["sentiments"])
+    print(f"   {'':<22}{header}{'total':>8}")
+    for reason, counts, rates in zip(table["reasons"], table["counts"], table["rates"]):
+        cells = "".join(f"{r:>10.0%}" for r in rates)
+        print(f"   {reason:<22}{cells}{counts.sum():>8}")
+    
+    matrix = cooccurrence(frame.failures)["counts"]
+    print("\n🔗 Co-occurrences des tags d'erreur (paires les plus fréquentes):")
+    upper = np.triu_indices(len(frame.error_tag_values), k=1)
+    order = np.argsort(matrix[upper])[::-1][:10]
+    for k in order:
+        i, j = upper[0][k], upper[1][k]
+        if matrix[i, j] == 0:
+            break
+        print(f"   {frame.error_tag_values[i]} + {frame.error_tag_values[j]}: {matrix[i, j]}")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Rapport agrégé sur les résultats d'analyse")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--db", default=None, help="Base SQLite des résultats (défaut: RESULTS_DB_PATH)")
+    source.add_argument("--columnar", metavar="DIR", default=None, help="Dataset Parquet des résultats")
+    source.add_argument("--csv", default=None, help="Fichier analysis_results_*.csv")
+    parser.add_argument("--since", default=None, help="Date minimale (YYYY-MM-DD)")
+    parser.add_argument("--until", default=None, help="Date maximale (YYYY-MM-DD)")
+    parser.add_argument("--model", default=None, help="Filtre sur le modèle")
+    args = parser.parse_args()
+    
+    if args.columnar:
+        from results_store import ColumnarResultsStore
+        frame = ResultsFrame.from_columnar(
+            ColumnarResultsStore(args.columnar),
+            start_date=args.since,
+            end_date=args.until,
+            models=[args.model] if args.model else None
+        )
+    elif args.csv:
+        if args.since or args.until:
+            parser.error("--since/--until ne s'appliquent pas à --csv (le CSV ne contient pas de date d'analyse)")
+        frame = ResultsFrame.from_csv(args.csv, model=args.model)
+    else:
+        from results_db import ResultsDatabase
+        db_path = args.db or Config.RESULTS_DB_PATH
+        if not db_path:
+            parser.error("Source manquante (--db, --columnar, --csv ou RESULTS_DB_PATH)")
+        frame = ResultsFrame.from_database(ResultsDatabase(db_path), since=args.since, until=args.until, model=args.model)
+    
+    print_report(frame)
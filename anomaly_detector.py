@@ -0,0 +1,290 @@
+"""Détection en continu des pics de taux de tags d'erreur (par tag et par agent)."""
+import json
+import math
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from config import Config
+from models import AnomalyAlert, CallAnalysisRequest, DetailedAnalysis
+from client_registry import get_registry
+
+
+class EwmaRate:
+    """Taux d'occurrence d'un tag suivi par deux moyennes mobiles exponentielles.
+
+    La moyenne rapide reflète les derniers appels, la lente sert de référence.
+    Pendant le démarrage, alpha vaut au moins 1/n (moyenne cumulée) pour éviter le biais vers 0.
+    """
+    __slots__ = ("fast", "slow", "events", "alerting")
+
+    def __init__(self):
+        self.fast = 0.0
+        self.slow = 0.0
+        self.events = 0
+        self.alerting = False
+
+    def update(self, value: float, fast_alpha: float, slow_alpha: float, freeze_baseline: bool = False):
+        self.events += 1
+        self.fast += max(fast_alpha, 1.0 / self.events) * (value - self.fast)
+        if not freeze_baseline:
+            self.slow += max(slow_alpha, 1.0 / self.events) * (value - self.slow)
+
+    def z_score(self, fast_alpha: float, min_baseline: float) -> float:
+        """Écart de la moyenne rapide à la référence, en écarts-types d'une EWMA de Bernoulli."""
+        p = max(self.slow, min_baseline)
+        std = math.sqrt(p * (1 - p) * fast_alpha / (2 - fast_alpha))
+        return (self.fast - self.slow) / std if std > 0 else 0.0
+
+
+class FailureRateDetector:
+    """Détecteur en ligne, O(nombre de tags) par appel, des hausses anormales de tags d'erreur.
+
+    Chaque appel met à jour, pour chaque tag de Config.ERROR_TAGS, un taux global par modèle
+    et un taux par agent. Une alerte est émise quand le z-score dépasse le seuil, puis le
+    couple (périmètre, tag) n'est réarmé qu'une fois le z-score redescendu sous la moitié du seuil.
+    """
+
+    def __init__(
+        self,
+        sinks: Optional[List] = None,
+        z_threshold: float = 4.0,
+        fast_alpha: float = 0.05,
+        slow_alpha: float = 0.002,
+        min_events: int = 30,
+        min_rate: float = 0.15,
+        min_baseline: float = 0.01
+    ):
+        """
+        Args:
+            sinks: Destinations des alertes (objets exposant emit(alert))
+            z_threshold: Z-score à partir duquel une hausse est signalée
+            fast_alpha: Lissage de la moyenne récente (≈ 2/alpha derniers appels)
+            slow_alpha: Lissage de la moyenne de référence
+            min_events: Nombre d'appels observés avant toute alerte sur un périmètre
+            min_rate: Taux récent minimum pour alerter (ignore les occurrences isolées)
+            min_baseline: Plancher du taux de référence dans le calcul de variance
+        """
+        self.sinks = sinks if sinks is not None else [LogAlertSink()]
+        self.z_threshold = z_threshold
+        self.fast_alpha = fast_alpha
+        self.slow_alpha = slow_alpha
+        self.min_events = min_events
+        self.min_rate = min_rate
+        self.min_baseline = min_baseline
+        self.tags = [t["tag"] for t in Config.ERROR_TAGS]
+        self._rates: Dict[Tuple[str, Optional[str], str], EwmaRate] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, analysis: DetailedAnalysis, model: str, request: Optional[CallAnalysisRequest] = None):
+        """Listener de ResultsDatabase: prend en compte une analyse enregistrée."""
+        if analysis.statistics is None:
+            return
+        metadata = request.metadata if request else None
+        self.observe_tags(
+            analysis.statistics.failure_reasons or [],
+            model=model,
+            agent_id=metadata.agent_id if metadata else None,
+            call_id=analysis.call_id,
+            timestamp=metadata.timestamp if metadata else None
+        )
+
+    def observe_tags(
+        self,
+        failure_reasons: Iterable[str],
+        model: str,
+        agent_id: Optional[str] = None,
+        call_id: Optional[str] = None,
+        timestamp: Optional[str] = None
+    ) -> List[AnomalyAlert]:
+        """Met à jour les taux avec les tags d'un appel et émet les alertes déclenchées."""
+        present = set(failure_reasons)
+        scopes = [("global", None)]
+        if agent_id:
+            scopes.append(("agent", agent_id))
+
+        alerts = []
+        with self._lock:
+            for scope, scope_agent in scopes:
+                for tag in self.tags:
+                    key = (model, scope_agent, tag)
+                    rate = self._rates.get(key)
+                    if rate is None:
+                        rate = self._rates[key] = EwmaRate()
+                    # Une hausse en cours (pas encore signalée) ne contamine pas la référence;
+                    # une fois l'alerte émise, la référence suit à nouveau (changement de niveau durable)
+                    rising = (
+                        not rate.alerting
+                        and rate.events >= self.min_events
+                        and rate.z_score(self.fast_alpha, self.min_baseline) >= self.z_threshold / 2
+                    )
+                    rate.update(1.0 if tag in present else 0.0, self.fast_alpha, self.slow_alpha, freeze_baseline=rising)
+
+                    z = rate.z_score(self.fast_alpha, self.min_baseline)
+                    if rate.alerting:
+                        if z < self.z_threshold / 2:
+                            rate.alerting = False
+                        continue
+                    if rate.events >= self.min_events and z >= self.z_threshold and rate.fast >= self.min_rate:
+                        rate.alerting = True
+                        alerts.append(AnomalyAlert(
+                            tag=tag,
+                            scope=scope,
+                            agent_id=scope_agent,
+                            model=model,
+                            recent_rate=round(rate.fast, 4),
+                            baseline_rate=round(rate.slow, 4),
+                            z_score=round(z, 2),
+                            events=rate.events,
+                            call_id=call_id,
+                            timestamp=str(timestamp) if timestamp else datetime.now().isoformat(timespec="seconds")
+                        ))
+
+        # Émission hors verrou: un webhook lent ne bloque pas les autres threads
+        for alert in alerts:
+            for sink in self.sinks:
+                try:
+                    sink.emit(alert)
+                except Exception as e:
+                    print(f"⚠️  Échec d'envoi d'alerte via {type(sink).__name__}: {e}")
+        return alerts
+
+    def seed(self, totals: Dict[Tuple[str, str], Dict[str, int]]):
+        """Initialise les taux depuis des totaux historiques {(agent_id, modèle): {métrique: valeur}}.
+
+        Sans historique, chaque process (lot, worker) repart à froid et ne peut pas alerter
+        avant min_events appels par périmètre. Les deux moyennes partent du taux historique,
+        le nombre d'appels observés du volume historique.
+        """
+        scopes: Dict[Tuple[str, Optional[str]], Dict[str, int]] = {}
+        for (agent_id, model), metrics in totals.items():
+            keys = [(model, None)] + ([(model, agent_id)] if agent_id else [])
+            for key in keys:
+                merged = scopes.setdefault(key, {})
+                for metric, value in metrics.items():
+                    merged[metric] = merged.get(metric, 0) + value
+
+        with self._lock:
+            for (model, agent_id), metrics in scopes.items():
+                calls = metrics.get("calls", 0)
+                if calls <= 0:
+                    continue
+                for tag in self.tags:
+                    rate = self._rates.setdefault((model, agent_id, tag), EwmaRate())
+                    rate.fast = rate.slow = min(1.0, metrics.get(f"failure:{tag}", 0) / calls)
+                    rate.events = calls
+
+    def snapshot(self) -> List[dict]:
+        """État courant des taux (pour inspection)."""
+        with self._lock:
+            return [
+                {"model": model, "agent_id": agent_id, "tag": tag, "recent_rate": rate.fast,
+                 "baseline_rate": rate.slow, "events": rate.events, "alerting": rate.alerting}
+                for (model, agent_id, tag), rate in self._rates.items()
+            ]
+
+
+class LogAlertSink:
+    """Affiche les alertes sur la sortie standard."""
+
+    def emit(self, alert: AnomalyAlert):
+        where = f"agent {alert.agent_id}" if alert.agent_id else "global"
+        print(
+            f"🚨 Pic de '{alert.tag}' ({where}, {alert.model}): "
+            f"{alert.recent_rate:.0%} récemment contre {alert.baseline_rate:.0%} habituellement "
+            f"(z={alert.z_score}, appel {alert.call_id})"
+        )
+
+
+class FileAlertSink:
+    """Ajoute les alertes à un fichier JSON Lines."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def emit(self, alert: AnomalyAlert):
+        line = json.dumps(alert.dict(), ensure_ascii=False)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+class WebhookAlertSink:
+    """Envoie les alertes en POST JSON vers un webhook (ex: relais local vers Slack)."""
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        self.url = url
+        self.timeout = timeout
+
+    def emit(self, alert: AnomalyAlert):
+        session = get_registry().get_http_session("alerts")
+        response = session.post(self.url, json=alert.dict(), timeout=self.timeout)
+        response.raise_for_status()
+
+
+def build_detector() -> Optional[FailureRateDetector]:
+    """Construit le détecteur à partir de la configuration (None si désactivé)."""
+    if not Config.ANOMALY_DETECTION_ENABLED:
+        return None
+    sinks = [LogAlertSink()]
+    if Config.ANOMALY_ALERT_FILE:
+        sinks.append(FileAlertSink(Config.ANOMALY_ALERT_FILE))
+    if Config.ANOMALY_WEBHOOK_URL:
+        sinks.append(WebhookAlertSink(Config.ANOMALY_WEBHOOK_URL))
+    return FailureRateDetector(
+        sinks=sinks,
+        z_threshold=Config.ANOMALY_Z_THRESHOLD,
+        fast_alpha=Config.ANOMALY_FAST_ALPHA,
+        slow_alpha=Config.ANOMALY_SLOW_ALPHA,
+        min_events=Config.ANOMALY_MIN_EVENTS,
+        min_rate=Config.ANOMALY_MIN_RATE
+    )
+
+
+def attach_detector(results_db) -> Optional[FailureRateDetector]:
+    """Branche le détecteur configuré sur une ResultsDatabase (chaque nouvelle analyse l'alimente).
+
+    Les taux de référence sont initialisés depuis les agrégats des ANOMALY_SEED_DAYS derniers jours.
+    """
+    detector = build_detector()
+    if detector is not None and results_db is not None:
+        if Config.ANOMALY_SEED_DAYS > 0:
+            since = (datetime.now() - timedelta(days=Config.ANOMALY_SEED_DAYS)).strftime("%Y-%m-%d")
+            detector.seed(results_db.rollup_totals(since=since))
+        results_db.add_listener(detector.observe)
+    return detector
+
+
+if __name__ == "__main__":
+    import argparse
+    from results_db import ResultsDatabase
+
+    parser = argparse.ArgumentParser(description="Rejoue l'historique de la base pour calibrer la détection de pics")
+    parser.add_argument("--db", default=Config.RESULTS_DB_PATH, required=Config.RESULTS_DB_PATH is None, help="Chemin de la base SQLite")
+    parser.add_argument("--since", default=None, help="Date/heure minimale (ISO)")
+    parser.add_argument("--until", default=None, help="Date/heure maximale (ISO)")
+    parser.add_argument("--model", default=None, help="Filtre sur le modèle")
+    parser.add_argument("--z", type=float, default=Config.ANOMALY_Z_THRESHOLD, help="Seuil de z-score")
+    args = parser.parse_args()
+
+    db = ResultsDatabase(args.db)
+    rows = db.query(model=args.model, since=args.since, until=args.until, limit=None)
+    detector = FailureRateDetector(
+        z_threshold=args.z,
+        fast_alpha=Config.ANOMALY_FAST_ALPHA,
+        slow_alpha=Config.ANOMALY_SLOW_ALPHA,
+        min_events=Config.ANOMALY_MIN_EVENTS,
+        min_rate=Config.ANOMALY_MIN_RATE
+    )
+
+    alert_count = 0
+    # query() retourne les plus récents d'abord: on rejoue dans l'ordre chronologique
+    for row in reversed(rows):
+        alerts = detector.observe_tags(
+            row["failure_reasons"] or [],
+            model=row["model"],
+            agent_id=row["agent_id"],
+            call_id=row["call_id"],
+            timestamp=row["timestamp"]
+        )
+        alert_count += len(alerts)
+    print(f"📊 {len(rows)} analyses rejouées, {alert_count} alertes")
@@ -1,6 +1,19 @@
 """Application Streamlit pour l'analyse post-appel."""
 import streamlit as st
 from main import PostCallMonitoringSystem
+from config import Config
+from result_cache import TTLCache
+from results_db import ResultsDatabase
+from anomaly_detector import attach_detector
+from question_clusters import QuestionClusterer
+from analytics import ResultsFrame, failure_rates, failure_rates_by, sentiment_by_reason, cooccurrence
+import pandas as pd
+from result_records import CSV_FIELDNAMES, build_result_record, build_error_record, record_to_csv_row
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import csv
+import io
+import json
+import re
 import time
 import os
 from datetime import datetime
@@ -16,6 +29,74 @@ st.set_page_config(
     layout="wide"
 )
 
+# Libellés des attributs extraits (affichage progressif)
+QUESTION_LABELS = {
+    "call_reason": "Motif de l'appel",
+    "user_sentiment": "Score de Satisfaction",
+    "failure_reasons": "Erreurs détectées",
+    "failure_description": "Description de l'échec",
+    "call_tags": "Tags de suivi",
+    "user_questions": "Questions de l'appelant"
+}
+
+
+def format_attribute_value(value) -> str:
+    """Formate la valeur d'un attribut extrait pour un affichage markdown court."""
+    if value is None or value == []:
+        return "—"
+    if isinstance(value, list):
+        return ", ".join(f"`{v}`" for v in value)
+    return str(value)
+
+
+@st.cache_resource
+def get_results_db():
+    """Base des résultats partagée (None si RESULTS_DB_PATH n'est pas configuré)."""
+    if not Config.RESULTS_DB_PATH:
+        return None
+    results_db = ResultsDatabase(Config.RESULTS_DB_PATH)
+    attach_detector(results_db)
+    return results_db
+
+
+@st.cache_resource
+def get_question_clusterer():
+    """Clusters de questions construits depuis la base puis tenus à jour à chaque analyse enregistrée."""
+    results_db = get_results_db()
+    if results_db is None:
+        return None
+    clusterer = QuestionClusterer()
+    # Listener branché avant le chargement pour ne pas manquer un appel stocké entre-temps;
+    # add() ignore les call_id déjà vus, un appel reçu des deux côtés n'est compté qu'une fois
+    results_db.add_listener(clusterer.observe)
+    for row in results_db.query(limit=None):
+        clusterer.add(row["user_questions"], call_id=row["call_id"])
+    return clusterer
+
+
+@st.cache_resource
+def get_system(model: str) -> PostCallMonitoringSystem:
+    """Système d'analyse partagé par toutes les sessions pour un modèle."""
+    return PostCallMonitoringSystem(model_name=model, results_db=get_results_db())
+
+
+@st.cache_resource
+def get_result_cache() -> TTLCache:
+    """Cache des analyses partagé par toutes les sessions."""
+    return TTLCache(maxsize=Config.RESULT_CACHE_MAX_ENTRIES, ttl=Config.RESULT_CACHE_TTL_SECONDS)
+
+
+def lookup_analysis(call_id: str, model: str, cache: TTLCache, results_db=None):
+    """Cherche une analyse déjà calculée (cache mémoire puis base des résultats)."""
+    config_hash = Config.get_config_hash()
+    cached = cache.get((call_id, model, config_hash))
+    if cached is None and results_db is not None:
+        cached = results_db.get_analysis(call_id, model, config_hash)
+        if cached is not None:
+            cache.set((call_id, model, config_hash), cached)
+    return cached
+
+
 def main():
     """Application principale."""
     st.title("📞 Analyse Post-Appel")
@@ -49,12 +130,27 @@ GEMINI_API_KEY=votre_clé_google (optionnel)
             help="Choisissez le modèle à utiliser pour l'analyse"
         )
         
+        # Mode d'analyse
+        mode = st.radio(
+            "Mode",
+            options=["🔍 Appel unique", "📋 Lot d'appels", "📈 Statistiques"],
+            index=0,
+            help="Analysez un seul appel, un lot d'appels en parallèle, ou consultez les statistiques agrégées"
+        )
+        
         st.markdown("---")
         st.markdown("### ℹ️ Informations")
         st.info("""
         Cette application analyse les appels Call Rounded pour détecter automatiquement les problèmes et erreurs.
         """)
     
+    if mode == "📋 Lot d'appels":
+        batch_page(model)
+        return
+    if mode == "📈 Statistiques":
+        analytics_page()
+        return
+    
     # Zone de saisie du call_id
     st.header("🔍 Analyser un appel")
     
@@ -113,34 +209,56 @@ def analyze_call(call_id: str, model: str):
             error_container.error("❌ OPENAI_API_KEY non configurée")
             return
         
+        # Résultat déjà calculé pour ce couple (call_id, modèle) avec la même configuration
+        cache = get_result_cache()
+        cache_key = (call_id, model, Config.get_config_hash())
+        cached = lookup_analysis(call_id, model, cache, get_results_db())
+        if cached is not None:
+            st.session_state.last_analysis = cached
+            st.session_state.last_call_id = call_id
+            st.session_state.last_model = model
+            return
+        
         with st.spinner("🔍 Analyse en cours..."):
-            # Initialise le système
-            system = PostCallMonitoringSystem(model_name=model)
+            # Système partagé (clients LLM et HTTP déjà initialisés)
+            system = get_system(model)
             
             # Affiche la progression
             progress_bar = st.progress(0)
             status_text = st.empty()
             
             status_text.text("Récupération des données de l'appel...")
-            progress_bar.progress(0.2)
+            progress_bar.progress(0.05)
+            
+            # Un emplacement par attribut, rempli dès que son extraction se termine
+            live_container = st.container()
+            live_container.subheader("⏳ Résultats en cours")
+            placeholders = {}
+            for question in Config.EXTRACTION_QUESTIONS:
+                name = question["name"]
+                placeholders[name] = live_container.empty()
+                placeholders[name].caption(f"⏳ {QUESTION_LABELS.get(name, name)}...")
             
-            # Analyse l'appel avec logging
-            time.sleep(0.5)  # Simulation de délai pour l'UI
-            result = system.analyze_call_from_id(call_id, logger=status_text.text)
+            def on_question(name, value, completed, total):
+                placeholders[name].markdown(f"**{QUESTION_LABELS.get(name, name)} :** {format_attribute_value(value)}")
+                progress_bar.progress(0.1 + 0.9 * completed / total)
+                status_text.text(f"Extraction {completed}/{total} : {name}")
             
-            progress_bar.progress(0.8)
-            status_text.text("Finalisation de l'analyse...")
-            time.sleep(0.3)
+            # Analyse l'appel avec logging et affichage progressif
+            result = system.analyze_call_from_id(call_id, logger=status_text.text, on_question=on_question)
             
             if result:
+                if not result.partial:
+                    cache.set(cache_key, result)
+                
                 # Stocke les résultats dans la session
                 st.session_state.last_analysis = result
                 st.session_state.last_call_id = call_id
+                st.session_state.last_model = model
                 
                 progress_bar.progress(1.0)
                 status_text.text("✅ Analyse terminée!")
                 
-                time.sleep(0.5)
                 progress_bar.empty()
                 status_text.empty()
                 
@@ -182,6 +300,10 @@ def display_analysis(analysis, call_id: str):
     
     st.header("📊 Résultats de l'analyse")
     
+    if analysis.partial:
+        missing = ", ".join(QUESTION_LABELS.get(name, name) for name in analysis.missing_attributes)
+        st.warning(f"⏱️ Analyse partielle (échéance atteinte) - attributs manquants : {missing}")
+    
     # Métriques principales
     col1, col2, col3, col4 = st.columns(4)
     
@@ -341,17 +463,251 @@ def display_analysis(analysis, call_id: str):
             st.rerun()
     
     with col2:
-        if st.button("📥 Exporter les résultats"):
-            export_results(analysis, call_id)
+        render_bulk_export(
+            [{"call_id": call_id, "model": st.session_state.get("last_model", ""), "analysis": analysis}],
+            key="single"
+        )
+
+
+def parse_call_ids(text: str) -> list:
+    """Extrait les call IDs d'une liste collée ou d'un CSV avec une colonne call_id (ordre conservé, sans doublons)."""
+    text = text.strip()
+    if not text:
+        return []
+    
+    first_line = text.splitlines()[0]
+    header = [h.strip().strip('"').lower() for h in re.split(r"[,;\t]", first_line)]
+    if "call_id" in header:
+        # CSV avec en-tête: on ne garde que la colonne call_id
+        delimiter = max([",", ";", "\t"], key=first_line.count)
+        reader = csv.reader(io.StringIO(text), delimiter=delimiter)
+        column = header.index("call_id")
+        next(reader)
+        candidates = [row[column] for row in reader if len(row) > column]
+    else:
+        candidates = re.split(r"[\s,;]+", text)
+    
+    call_ids = [c.strip().strip('"\'') for c in candidates]
+    return list(dict.fromkeys(c for c in call_ids if c))
+
+
+def batch_page(model: str):
+    """Page d'analyse d'un lot d'appels en parallèle."""
+    st.header("📋 Analyser un lot d'appels")
+    
+    pasted = st.text_area(
+        "Call IDs",
+        height=200,
+        placeholder="Un call ID par ligne, ou un CSV collé avec une colonne call_id",
+        help="Les doublons sont ignorés"
+    )
+    uploaded = st.file_uploader("… ou importer un fichier CSV", type=["csv", "txt"])
+    
+    text = pasted
+    if uploaded is not None:
+        text += "\n" + uploaded.getvalue().decode("utf-8-sig")
+    call_ids = parse_call_ids(text)
+    
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        max_workers = st.slider(
+            "Analyses en parallèle",
+            min_value=1,
+            max_value=Config.BATCH_MAX_WORKERS,
+            value=min(4, Config.BATCH_MAX_WORKERS)
+        )
+    with col2:
+        st.markdown("<br>", unsafe_allow_html=True)  # Espacement vertical
+        run_button = st.button("🚀 Analyser le lot", type="primary", use_container_width=True, disabled=not call_ids)
+    st.caption(f"{len(call_ids)} appel(s) unique(s) détecté(s)")
+    
+    st.markdown("---")
+    
+    if run_button:
+        st.session_state.batch_results = run_batch(call_ids, model, max_workers)
+    elif st.session_state.get("batch_results"):
+        st.dataframe([batch_table_row(entry) for entry in st.session_state.batch_results], use_container_width=True, hide_index=True)
+    
+    if st.session_state.get("batch_results"):
+        render_bulk_export(st.session_state.batch_results, key="batch")
+
+
+def batch_table_row(entry: dict) -> dict:
+    """Ligne du tableau de suivi d'un lot."""
+    analysis = entry.get("analysis")
+    stats = analysis.statistics if analysis and analysis.statistics else None
+    return {
+        "call_id": entry["call_id"],
+        "statut": entry["status"],
+        "latence (s)": round(entry["latency"], 2) if entry.get("latency") is not None else None,
+        "motif": stats.call_reason if stats and stats.call_reason else "",
+        "sentiment": stats.user_sentiment if stats and stats.user_sentiment else "",
+        "erreurs": ", ".join(stats.failure_reasons) if stats and stats.failure_reasons else ""
+    }
+
+
+def run_batch(call_ids: list, model: str, max_workers: int) -> list:
+    """Analyse un lot d'appels avec un pool borné et met à jour le tableau en direct."""
+    system = get_system(model)
+    cache = get_result_cache()
+    results_db = get_results_db()
+    config_hash = Config.get_config_hash()
+    
+    entries = {
+        call_id: {"call_id": call_id, "model": model, "analysis": None, "latency": None, "status": "⏳ En attente"}
+        for call_id in call_ids
+    }
+    running = set()  # Renseigné depuis les workers, lu par le thread principal
+    
+    def analyze_one(call_id: str):
+        cache_key = (call_id, model, config_hash)
+        cached = lookup_analysis(call_id, model, cache, results_db)
+        if cached is not None:
+            return cached, 0.0, True
+        running.add(call_id)
+        start = time.perf_counter()
+        result = system.analyze_call_from_id(call_id)
+        if result and not result.partial:
+            cache.set(cache_key, result)
+        return result, time.perf_counter() - start, False
+    
+    progress_bar = st.progress(0.0)
+    table = st.empty()
+    completed = 0
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        future_to_call_id = {executor.submit(analyze_one, call_id): call_id for call_id in call_ids}
+        pending = set(future_to_call_id)
+        while pending:
+            done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            for future in done:
+                entry = entries[future_to_call_id[future]]
+                completed += 1
+                try:
+                    result, latency, from_cache = future.result()
+                    entry["analysis"] = result
+                    entry["latency"] = latency
+                    if not result:
+                        entry["status"] = "❌ Échec"
+                    elif from_cache:
+                        entry["status"] = "✅ Terminé (cache)"
+                    elif result.partial:
+                        entry["status"] = "⏱️ Partielle"
+                    else:
+                        entry["status"] = "⚠️ Problème" if result.problem_detected else "✅ Terminé"
+                except Exception as e:
+                    entry["status"] = f"❌ Erreur: {e}"
+            
+            for call_id in list(running):
+                if entries[call_id]["status"] == "⏳ En attente":
+                    entries[call_id]["status"] = "🔄 En cours"
+            
+            progress_bar.progress(completed / len(call_ids), text=f"{completed}/{len(call_ids)} appels analysés")
+            table.dataframe([batch_table_row(entries[c]) for c in call_ids], use_container_width=True, hide_index=True)
+    
+    return [entries[c] for c in call_ids]
 
 
-def export_results(analysis, call_id: str):
-    """Exporte les résultats au format JSON."""
-    import json
-    from datetime import datetime
+def analytics_page():
+    """Statistiques agrégées sur les analyses enregistrées en base."""
+    st.header("📈 Statistiques agrégées")
+    
+    results_db = get_results_db()
+    if results_db is None:
+        st.info("ℹ️ Configurez RESULTS_DB_PATH pour enregistrer les analyses et activer les statistiques.")
+        return
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        since = st.date_input("Depuis le", value=None)
+    with col2:
+        until = st.date_input("Jusqu'au", value=None)
+    
+    frame = ResultsFrame.from_database(
+        results_db,
+        since=since.isoformat() if since else None,
+        until=until.isoformat() if until else None
+    )
+    if len(frame) == 0:
+        st.info("Aucune analyse enregistrée sur cette période.")
+        return
+    
+    st.metric("📞 Appels analysés", len(frame))
+    
+    # Tendances lues dans les agrégats incrémentaux (coût proportionnel au nombre de périodes)
+    st.subheader("📉 Tendances")
+    granularity = st.radio(
+        "Granularité",
+        options=["day", "hour"],
+        format_func=lambda g: "Par jour" if g == "day" else "Par heure",
+        horizontal=True
+    )
+    series = results_db.rollup_series(
+        granularity,
+        since=since.isoformat() if since else None,
+        until=(until.isoformat() + "T23") if until else None
+    )
+    if series:
+        buckets = [point["bucket"] for point in series]
+        st.line_chart(pd.DataFrame({"taux d'échec": [point["failure_rate"] for point in series]}, index=buckets))
+        st.bar_chart(pd.DataFrame(
+            {s: [point["sentiments"].get(s, 0) for point in series] for s in Config.get_user_sentiments_values()},
+            index=buckets
+        ))
+    
+    st.subheader("❌ Taux d'échec par tag")
+    rates = pd.DataFrame(failure_rates(frame))
+    rates["IC 95%"] = [f"{low:.1%} - {high:.1%}" for low, high in zip(rates["ci_low"], rates["ci_high"])]
+    st.dataframe(
+        rates[["tag", "count", "rate", "IC 95%"]].style.format({"rate": "{:.1%}"}),
+        use_container_width=True,
+        hide_index=True
+    )
+    
+    st.subheader("😊 Sentiment par motif d'appel")
+    table = sentiment_by_reason(frame)
+    st.dataframe(
+        pd.DataFrame(table["rates"], index=table["reasons"], columns=table["sentiments"]).style.format("{:.0%}"),
+        use_container_width=True
+    )
     
-    export_data = {
-        "call_id": call_id,
+    by_agent = failure_rates_by(frame, frame.agents)
+    if len(by_agent["groups"]) > 1:
+        st.subheader("🤖 Appels avec échec par agent")
+        st.dataframe(
+            pd.DataFrame({"agent_id": by_agent["groups"], "appels": by_agent["totals"], "taux d'échec": by_agent["any_rates"]})
+            .style.format({"taux d'échec": "{:.1%}"}),
+            use_container_width=True,
+            hide_index=True
+        )
+    
+    st.subheader("🔗 Co-occurrences des tags d'erreur")
+    matrix = cooccurrence(frame.failures)["counts"]
+    st.dataframe(pd.DataFrame(matrix, index=frame.error_tag_values, columns=frame.error_tag_values), use_container_width=True)
+    
+    st.subheader("❓ Questions fréquentes (toutes périodes)")
+    clusters = get_question_clusterer().clusters(min_calls=2, top=20)
+    if clusters:
+        st.dataframe(
+            pd.DataFrame([
+                {"appels": c["calls"], "question": c["representative"], "variantes": c["variants"], "exemples": " | ".join(c["examples"])}
+                for c in clusters
+            ]),
+            use_container_width=True,
+            hide_index=True
+        )
+    else:
+        st.caption("Aucune question posée dans au moins deux appels.")
+
+
+def build_export_record(entry: dict) -> dict:
+    """Enregistre une analyse au format d'export JSON."""
+    analysis = entry.get("analysis")
+    if not analysis:
+        return {"call_id": entry["call_id"], "model_used": entry.get("model"), "error": entry.get("status")}
+    return {
+        "call_id": entry["call_id"],
+        "model_used": entry.get("model"),
         "timestamp": datetime.now().isoformat(),
         "problem_detected": analysis.problem_detected,
         "problem_type": analysis.problem_type,
@@ -361,17 +717,41 @@ def export_results(analysis, call_id: str):
         "recommendations": analysis.recommendations,
         "statistics": analysis.statistics.dict() if analysis.statistics else None
     }
+
+
+def render_bulk_export(entries: list, key: str):
+    """Boutons de téléchargement groupé (CSV et JSON) pour une liste d'analyses."""
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     
-    # Crée le JSON
-    json_str = json.dumps(export_data, indent=2, ensure_ascii=False)
+    csv_buffer = io.StringIO()
+    writer = csv.DictWriter(csv_buffer, fieldnames=CSV_FIELDNAMES)
+    writer.writeheader()
+    for entry in entries:
+        if entry.get("analysis"):
+            record = build_result_record(entry["call_id"], entry.get("model", ""), entry["analysis"])
+        else:
+            record = build_error_record(entry["call_id"], entry.get("model", ""), entry.get("status", "Erreur lors de l'analyse"))
+        writer.writerow(record_to_csv_row(record))
     
-    # Téléchargement
-    st.download_button(
-        label="📥 Télécharger JSON",
-        data=json_str,
-        file_name=f"analysis_{call_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-        mime="application/json"
-    )
+    json_str = json.dumps([build_export_record(entry) for entry in entries], indent=2, ensure_ascii=False)
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button(
+            label="📥 Exporter en CSV",
+            data=csv_buffer.getvalue(),
+            file_name=f"analysis_results_{timestamp}.csv",
+            mime="text/csv",
+            key=f"export_csv_{key}"
+        )
+    with col2:
+        st.download_button(
+            label="📥 Exporter en JSON",
+            data=json_str,
+            file_name=f"analysis_results_{timestamp}.json",
+            mime="application/json",
+            key=f"export_json_{key}"
+        )
 
 
 if __name__ == "__main__":
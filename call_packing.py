@@ -0,0 +1,156 @@
+"""Analyse groupée d'appels courts: une requête LLM par attribut pour plusieurs appels à la fois.
+
+Pour un appel de quelques tours, le prompt de base et les consignes de l'attribut pèsent plus
+que le transcript lui-même. Les appels courts sont donc regroupés (dans la limite d'un budget
+de tokens) et chaque attribut est extrait pour tout le groupe en une seule requête, dont la
+réponse JSON est indexée par call_id. Chaque valeur est ensuite validée individuellement.
+"""
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from config import Config
+from deadline import Deadline
+from detailed_analyzer import DetailedAnalyzer
+from llm_usage import in_context
+from models import CallAnalysisRequest, CallStatistics, DetailedAnalysis
+from token_budgets import estimate_tokens
+
+
+def request_tokens(analyzer: DetailedAnalyzer, request: CallAnalysisRequest) -> int:
+    """Taille estimée (tokens) du transcript et des résultats d'outils d'un appel."""
+    return estimate_tokens(analyzer._build_conversation_text(request) + analyzer._build_tools_text(request))
+
+
+def pack_requests(analyzer: DetailedAnalyzer, requests: List[CallAnalysisRequest],
+                  token_budget: Optional[int] = None, max_calls: Optional[int] = None,
+                  max_call_tokens: Optional[int] = None) -> tuple:
+    """Répartit les appels en groupes à analyser ensemble et appels analysés seuls.
+
+    Returns:
+        (groupes de plus d'un appel, appels trop longs ou restés seuls)
+    """
+    token_budget = token_budget or Config.PACK_TOKEN_BUDGET
+    max_calls = max_calls or Config.PACK_MAX_CALLS
+    max_call_tokens = max_call_tokens or Config.PACK_MAX_CALL_TOKENS
+
+    packs, singles = [], []
+    current, current_tokens = [], 0
+    for request in requests:
+        tokens = request_tokens(analyzer, request)
+        if tokens > max_call_tokens:
+            singles.append(request)
+            continue
+        if current and (current_tokens + tokens > token_budget or len(current) >= max_calls):
+            packs.append(current)
+            current, current_tokens = [], 0
+        current.append(request)
+        current_tokens += tokens
+    if current:
+        packs.append(current)
+
+    # Un groupe d'un seul appel n'apporte rien: analyse classique
+    singles.extend(pack[0] for pack in packs if len(pack) == 1)
+    return [pack for pack in packs if len(pack) > 1], singles
+
+
+class PackedAnalyzer:
+    """Extrait les attributs d'un groupe d'appels courts avec le LLM d'un DetailedAnalyzer."""
+
+    def __init__(self, analyzer: DetailedAnalyzer):
+        self.analyzer = analyzer
+
+    def analyze_pack(self, requests: List[CallAnalysisRequest], deadline: Optional[Deadline] = None) -> Dict[str, DetailedAnalysis]:
+        """Analyse un groupe d'appels (call_id distincts).
+
+        Les appels absents d'une réponse groupée (clé manquante, JSON invalide) sont réanalysés
+        individuellement pour l'attribut concerné. Les attributs non extraits avant l'échéance sont
+        listés dans missing_attributes de chaque appel (analyse partielle).
+        """
+        deadline = deadline or Deadline()
+        calls = {}
+        for request in requests:
+            calls[request.call_id] = {
+                "call_id": request.call_id,
+                "conversation_text": self.analyzer._build_conversation_text(request),
+                "tools_text": self.analyzer._build_tools_text(request),
+                "failure_note": self.analyzer.build_failure_note(request)
+            }
+        results = {
+            request.call_id: {name: value for name, (value, _) in self.analyzer.predict_locally(request).items()}
+            for request in requests
+        }
+        distilled = {call_id: list(values) for call_id, values in results.items()}
+
+        print(f"  📦 Extractions groupées ({len(requests)} appels):", end=" ", flush=True)
+        workers = max(1, min(self.analyzer.max_parallel_questions, len(Config.EXTRACTION_QUESTIONS)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = []
+            for question_config in Config.EXTRACTION_QUESTIONS:
+                name = question_config["name"]
+                pending = [calls[call_id] for call_id in calls if name not in results[call_id]]
+                if pending:
+                    futures.append((name, executor.submit(in_context(self._extract_packed_question), question_config, pending, deadline)))
+            for name, future in futures:
+                try:
+                    values = future.result()
+                except Exception:
+                    # Requête groupée interrompue par l'échéance: attribut manquant pour tout le groupe
+                    if not deadline.expired(margin=Deadline.MIN_TIMEOUT):
+                        raise
+                    continue
+                for call_id, value in values.items():
+                    results[call_id][name] = value
+                print(name, end=" ", flush=True)
+        print()
+
+        analyses = {}
+        for request in requests:
+            values = results[request.call_id]
+            statistics = CallStatistics(
+                call_reason=values.get("call_reason"),
+                user_questions=values.get("user_questions"),
+                user_sentiment=values.get("user_sentiment"),
+                failure_reasons=values.get("failure_reasons"),
+                failure_description=values.get("failure_description"),
+                call_tags=values.get("call_tags", [])
+            )
+            missing = [q["name"] for q in Config.EXTRACTION_QUESTIONS if q["name"] not in values]
+            analyses[request.call_id] = self.analyzer.build_analysis(request, statistics, missing, distilled[request.call_id])
+        return analyses
+
+    def _extract_packed_question(self, question_config: dict, calls: List[dict], deadline: Deadline) -> Dict[str, object]:
+        """Valeurs validées d'un attribut pour chaque appel du groupe (sans les appels non extraits avant l'échéance)."""
+        name = question_config["name"]
+        failure_question = name in ["failure_reasons", "failure_description"]
+        prompt_calls = [dict(call, failure_note=call["failure_note"] if failure_question else "") for call in calls]
+        system_prompt, user_prompt = Config.generate_packed_question_prompt(question_config, prompt_calls)
+
+        # Budget de la question multiplié par le nombre d'appels (plus l'enveloppe des clés)
+        max_tokens = sum(self.analyzer.token_budgets.budget(question_config) + 16 for _ in calls)
+        response, _ = self.analyzer.generate_json(user_prompt, system_prompt, max_tokens, f"{name} ×{len(calls)}", deadline)
+
+        answers = {}
+        try:
+            json_start = response.find('{')
+            json_end = response.rfind('}') + 1
+            if json_start >= 0 and json_end > json_start:
+                answers = json.loads(response[json_start:json_end])
+        except ValueError as e:
+            print(f"Erreur lors de l'extraction groupée de {name}: {e}")
+
+        values = {}
+        for call in prompt_calls:
+            answer = answers.get(call["call_id"]) if isinstance(answers, dict) else None
+            if isinstance(answer, dict) and name in answer:
+                values[call["call_id"]] = self.analyzer._validate_and_normalize_value(answer[name], question_config)
+            else:
+                # Réponse absente pour cet appel: extraction individuelle
+                try:
+                    values[call["call_id"]] = self.analyzer._extract_single_question(
+                        question_config, call["conversation_text"], call["tools_text"], call["failure_note"], deadline
+                    )
+                except Exception:
+                    # Extraction interrompue par l'échéance: attribut manquant pour cet appel
+                    if not deadline.expired(margin=Deadline.MIN_TIMEOUT):
+                        raise
+        return values
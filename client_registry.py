@@ -0,0 +1,111 @@
+"""Registre partagé des clients LLM et des transports HTTP."""
+import threading
+from typing import Any, Callable, Dict, Optional
+import requests
+from requests.adapters import HTTPAdapter
+from openai import OpenAI, DefaultHttpxClient as OpenAIHttpxClient
+from anthropic import Anthropic, DefaultHttpxClient as AnthropicHttpxClient
+from config import Config
+from gemini_transport import GeminiTransport
+
+
+class ClientRegistry:
+    """Crée chaque client provider et transport HTTP une seule fois par process.
+
+    Les clients sont synchrones et thread-safe : ils peuvent être partagés entre les
+    workers d'un ThreadPoolExecutor comme entre les boucles asyncio (via asyncio.to_thread).
+    Avec OUTBOUND_PROXY_URL, le proxy est passé explicitement aux transports (trust_env=False) :
+    os.environ n'est jamais modifié. Sans lui, HTTP(S)_PROXY / NO_PROXY de l'environnement
+    restent pris en compte.
+    """
+
+    def __init__(self, proxy_url: Optional[str] = None, pool_size: int = 32):
+        self.proxy_url = proxy_url
+        self.pool_size = pool_size
+        # Variables d'environnement du proxy ignorées seulement si un proxy explicite est fourni
+        self.trust_env = proxy_url is None
+        self._lock = threading.Lock()
+        self._clients: Dict[tuple, Any] = {}
+
+    def _get_or_create(self, key: tuple, factory: Callable[[], Any]) -> Any:
+        """Retourne le client associé à la clé, en le créant une seule fois."""
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = factory()
+                self._clients[key] = client
+        return client
+
+    def get_openai_client(self, api_key: str) -> OpenAI:
+        """Client OpenAI partagé pour une clé API donnée."""
+        return self._get_or_create(
+            ("openai", api_key),
+            lambda: OpenAI(
+                api_key=api_key,
+                http_client=OpenAIHttpxClient(proxy=self.proxy_url, trust_env=self.trust_env)
+            )
+        )
+
+    def get_anthropic_client(self, api_key: str) -> Anthropic:
+        """Client Anthropic partagé pour une clé API donnée."""
+        return self._get_or_create(
+            ("anthropic", api_key),
+            lambda: Anthropic(
+                api_key=api_key,
+                http_client=AnthropicHttpxClient(proxy=self.proxy_url, trust_env=self.trust_env)
+            )
+        )
+
+    def get_http_session(self, name: str = "default") -> requests.Session:
+        """Session requests partagée (pool keep-alive) pour un service donné."""
+        return self._get_or_create(("http", name), self._create_http_session)
+
+    def _create_http_session(self) -> requests.Session:
+        session = requests.Session()
+        session.trust_env = self.trust_env
+        if self.proxy_url:
+            session.proxies = {"http": self.proxy_url, "https": self.proxy_url}
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def get_gemini_transport(self) -> GeminiTransport:
+        """Transport Gemini partagé (HTTP/2 si disponible, sinon pool keep-alive requests)."""
+        return self._get_or_create(
+            ("gemini_transport",),
+            lambda: GeminiTransport(proxy_url=self.proxy_url, pool_size=self.pool_size, http2=Config.GEMINI_HTTP2)
+        )
+
+    def close(self):
+        """Ferme tous les clients et sessions créés."""
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            close = getattr(client, "close", None)
+            if close:
+                try:
+                    close()
+                except Exception as e:
+                    print(f"⚠️  Erreur lors de la fermeture d'un client: {e}")
+
+
+_registry: Optional[ClientRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ClientRegistry:
+    """Retourne le registre global du process (créé à la première utilisation)."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ClientRegistry(
+                    proxy_url=Config.OUTBOUND_PROXY_URL,
+                    pool_size=Config.HTTP_POOL_SIZE
+                )
+    return _registry
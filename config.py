@@ -1,5 +1,7 @@
 """Configuration pour le système d'analyse post-appel."""
 import os
+import json
+import hashlib
 from typing import Optional
 from dotenv import load_dotenv
 
@@ -17,6 +19,132 @@ class Config:
     ANTHROPIC_API_KEY: Optional[str] = os.getenv("ANTHROPIC_API_KEY")
     GEMINI_API_KEY: Optional[str] = os.getenv("GEMINI_API_KEY")
     
+    # Transport HTTP partagé (sans OUTBOUND_PROXY_URL, les variables HTTP(S)_PROXY de l'environnement sont utilisées)
+    OUTBOUND_PROXY_URL: Optional[str] = os.getenv("OUTBOUND_PROXY_URL") or None
+    HTTP_POOL_SIZE: int = int(os.getenv("HTTP_POOL_SIZE", "32"))
+    
+    # Transport Gemini: HTTP/2 (si httpx[http2] est installé) et préchauffage de la connexion au démarrage
+    GEMINI_HTTP2: bool = os.getenv("GEMINI_HTTP2", "true").lower() in ("1", "true", "yes")
+    GEMINI_WARM_UP: bool = os.getenv("GEMINI_WARM_UP", "true").lower() in ("1", "true", "yes")
+    
+    # Routage LLM: modèles équivalents utilisés en repli (JSON {"modèle": ["repli", ...]} dans MODEL_FALLBACKS,
+    # ex: {"gpt-4o": ["gpt-4.1", "claude-3-5-sonnet"]}). Désactivé par défaut: une réponse d'un modèle de
+    # repli (ou d'une requête doublée) est enregistrée sous le modèle demandé
+    MODEL_FALLBACKS: dict = json.loads(os.getenv("MODEL_FALLBACKS", "{}"))
+    CIRCUIT_FAILURE_THRESHOLD: int = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+    CIRCUIT_RESET_SECONDS: float = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+    LATENCY_WINDOW: int = int(os.getenv("LATENCY_WINDOW", "200"))
+    HEDGE_ENABLED: bool = os.getenv("HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+    HEDGE_MIN_DELAY_SECONDS: float = float(os.getenv("HEDGE_MIN_DELAY_SECONDS", "1.0"))
+    ROUTER_MAX_WORKERS: int = int(os.getenv("ROUTER_MAX_WORKERS", "32"))
+    
+    # Prix des modèles en USD par million de tokens (entrée, sortie), pour les coûts estimés
+    # du mode comparaison (JSON {"modèle": [entrée, sortie]} dans MODEL_PRICING)
+    MODEL_PRICING: dict = json.loads(os.getenv("MODEL_PRICING", "null")) or {
+        "gpt-4o": [2.50, 10.00],
+        "gpt-4.1": [2.00, 8.00],
+        "gpt-4.1-mini": [0.40, 1.60],
+        "gpt-5": [1.25, 10.00],
+        "gpt-5-mini": [0.25, 2.00],
+        "claude-3-5-sonnet": [3.00, 15.00],
+        "gemini-1.5-flash": [0.075, 0.30],
+        "gemini-2.0-flash": [0.10, 0.40],
+        "gemini-2.5-flash": [0.30, 2.50]
+    }
+    
+    # Timeouts réseau (secondes) et échéance globale optionnelle d'une analyse
+    HTTP_TIMEOUT_SECONDS: float = float(os.getenv("HTTP_TIMEOUT_SECONDS", "30"))
+    LLM_TIMEOUT_SECONDS: float = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+    CALL_DEADLINE_SECONDS: Optional[float] = float(os.getenv("CALL_DEADLINE_SECONDS")) if os.getenv("CALL_DEADLINE_SECONDS") else None
+    
+    # Nombre d'extractions (questions) lancées en parallèle pour un même appel
+    QUESTION_CONCURRENCY: int = int(os.getenv("QUESTION_CONCURRENCY", "6"))
+    
+    # Nombre maximum d'analyses simultanées pour le mode lot de l'interface
+    BATCH_MAX_WORKERS: int = int(os.getenv("BATCH_MAX_WORKERS", "8"))
+    
+    # Pipeline de generate_csv: workers par étape (récupération, transformation, analyse LLM)
+    # et taille des files entre étapes (avance maximale de la récupération sur l'analyse)
+    PIPELINE_FETCH_WORKERS: int = int(os.getenv("PIPELINE_FETCH_WORKERS", "4"))
+    PIPELINE_TRANSFORM_WORKERS: int = int(os.getenv("PIPELINE_TRANSFORM_WORKERS", "1"))
+    PIPELINE_ANALYZE_WORKERS: int = int(os.getenv("PIPELINE_ANALYZE_WORKERS", "8"))
+    PIPELINE_QUEUE_SIZE: int = int(os.getenv("PIPELINE_QUEUE_SIZE", "16"))
+    
+    # Ordonnancement par priorité (scheduling.py): les appels suspects d'échec sont analysés
+    # en premier, d'après des signaux peu coûteux (poids en JSON dans SCHEDULER_WEIGHTS);
+    # SCHEDULER_FAIRNESS retire des points par analyse d'avance d'un agent sur les autres
+    PRIORITY_SCHEDULING: bool = os.getenv("PRIORITY_SCHEDULING", "true").lower() in ("1", "true", "yes")
+    SCHEDULER_WEIGHTS: dict = json.loads(os.getenv("SCHEDULER_WEIGHTS", "null")) or {
+        "failed_tool": 10,
+        "error_mention": 3,
+        "failed_status": 6,
+        "long_call": 2
+    }
+    SCHEDULER_MAX_ERROR_MENTIONS: int = int(os.getenv("SCHEDULER_MAX_ERROR_MENTIONS", "3"))
+    SCHEDULER_FAILED_STATUSES: list = ["failed", "error", "erreur", "echec", "échec", "timeout"]
+    SCHEDULER_LONG_CALL_SECONDS: int = int(os.getenv("SCHEDULER_LONG_CALL_SECONDS", "300"))
+    SCHEDULER_FAIRNESS: float = float(os.getenv("SCHEDULER_FAIRNESS", "2.0"))
+    # Appels récupérés en attente d'analyse parmi lesquels choisir le plus prioritaire
+    SCHEDULER_WINDOW: int = int(os.getenv("SCHEDULER_WINDOW", "128"))
+    
+    # Base SQLite des résultats (vide = pas de stockage)
+    RESULTS_DB_PATH: Optional[str] = os.getenv("RESULTS_DB_PATH") or None
+    
+    # File de travail durable partagée par les workers (work_queue.py): durée des baux,
+    # tentatives avant dead-letter et délai (doublé à chaque échec) avant nouvelle tentative
+    QUEUE_DB_PATH: str = os.getenv("QUEUE_DB_PATH", "work_queue.db")
+    QUEUE_LEASE_SECONDS: float = float(os.getenv("QUEUE_LEASE_SECONDS", "300"))
+    QUEUE_MAX_ATTEMPTS: int = int(os.getenv("QUEUE_MAX_ATTEMPTS", "3"))
+    QUEUE_RETRY_DELAY_SECONDS: float = float(os.getenv("QUEUE_RETRY_DELAY_SECONDS", "30"))
+    QUEUE_POLL_SECONDS: float = float(os.getenv("QUEUE_POLL_SECONDS", "2"))
+    
+    # Cache des résultats d'analyse (interface Streamlit)
+    RESULT_CACHE_TTL_SECONDS: int = int(os.getenv("RESULT_CACHE_TTL_SECONDS", "3600"))
+    RESULT_CACHE_MAX_ENTRIES: int = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "256"))
+    
+    # Détection des pics de tags d'erreur (alimentée par la base de résultats)
+    ANOMALY_DETECTION_ENABLED: bool = os.getenv("ANOMALY_DETECTION_ENABLED", "true").lower() in ("1", "true", "yes")
+    ANOMALY_Z_THRESHOLD: float = float(os.getenv("ANOMALY_Z_THRESHOLD", "4.0"))
+    ANOMALY_FAST_ALPHA: float = float(os.getenv("ANOMALY_FAST_ALPHA", "0.05"))
+    ANOMALY_SLOW_ALPHA: float = float(os.getenv("ANOMALY_SLOW_ALPHA", "0.002"))
+    ANOMALY_MIN_EVENTS: int = int(os.getenv("ANOMALY_MIN_EVENTS", "30"))
+    ANOMALY_MIN_RATE: float = float(os.getenv("ANOMALY_MIN_RATE", "0.15"))
+    # Jours d'agrégats (rollups) utilisés pour initialiser les taux de référence au démarrage (0 = départ à froid)
+    ANOMALY_SEED_DAYS: int = int(os.getenv("ANOMALY_SEED_DAYS", "7"))
+    ANOMALY_ALERT_FILE: Optional[str] = os.getenv("ANOMALY_ALERT_FILE") or None
+    ANOMALY_WEBHOOK_URL: Optional[str] = os.getenv("ANOMALY_WEBHOOK_URL") or None
+    
+    # Classifieurs locaux distillés (vide = désactivés): le LLM n'est pas appelé pour ces
+    # attributs quand la probabilité calibrée atteint le seuil
+    DISTILLED_MODEL_DIR: Optional[str] = os.getenv("DISTILLED_MODEL_DIR") or None
+    DISTILLED_CONFIDENCE_THRESHOLD: float = float(os.getenv("DISTILLED_CONFIDENCE_THRESHOLD", "0.95"))
+    DISTILLED_ATTRIBUTES: list = ["call_reason", "user_sentiment"]
+    
+    # Budgets de tokens de sortie par question: "max_tokens" de chaque question, remplacé par le
+    # budget appris (percentile des réponses observées × marge) enregistré dans TOKEN_BUDGETS_PATH
+    TOKEN_BUDGETS_PATH: str = os.getenv("TOKEN_BUDGETS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "token_budgets.json"))
+    TOKEN_BUDGET_PERCENTILE: float = float(os.getenv("TOKEN_BUDGET_PERCENTILE", "99"))
+    TOKEN_BUDGET_MARGIN: float = float(os.getenv("TOKEN_BUDGET_MARGIN", "1.25"))
+    TOKEN_BUDGET_MIN_SAMPLES: int = int(os.getenv("TOKEN_BUDGET_MIN_SAMPLES", "50"))
+    TOKEN_BUDGET_MIN: int = 32
+    TOKEN_BUDGET_MAX: int = 1200
+    
+    # Options des questions select/multiselect présentées avec des codes numériques courts:
+    # le modèle répond avec les codes, reconvertis en valeurs Config au décodage
+    COMPACT_ENUM_CODES: bool = os.getenv("COMPACT_ENUM_CODES", "false").lower() in ("1", "true", "yes")
+    
+    # Regroupement des appels courts (generate_csv --pack): budget de tokens de transcript par
+    # requête groupée, nombre maximum d'appels par groupe et taille maximale d'un appel "court"
+    PACK_TOKEN_BUDGET: int = int(os.getenv("PACK_TOKEN_BUDGET", "6000"))
+    PACK_MAX_CALLS: int = int(os.getenv("PACK_MAX_CALLS", "8"))
+    PACK_MAX_CALL_TOKENS: int = int(os.getenv("PACK_MAX_CALL_TOKENS", "1000"))
+    
+    # Transcripts très longs: au-delà de LONG_CALL_TOKENS, extraction par fenêtres de tours
+    # (map) puis fusion des réponses partielles (reduce), voir long_transcript
+    LONG_CALL_TOKENS: int = int(os.getenv("LONG_CALL_TOKENS", "8000"))
+    LONG_CALL_WINDOW_TOKENS: int = int(os.getenv("LONG_CALL_WINDOW_TOKENS", "3000"))
+    LONG_CALL_OVERLAP_TURNS: int = int(os.getenv("LONG_CALL_OVERLAP_TURNS", "2"))
+    
     # Modèles disponibles
     DEFAULT_MODEL: str = "gpt-4.1"
     AVAILABLE_MODELS: dict = {
@@ -84,7 +212,8 @@ class Config:
             "response_type": "select",  # Single choice
             "required": True,
             "default_value": "other_requests",
-            "field_key": "reason"  # Clé pour extraire la valeur depuis les options dict
+            "field_key": "reason",  # Clé pour extraire la valeur depuis les options dict
+            "max_tokens": 64  # Budget de sortie par défaut (avant apprentissage)
         },
         {
             "name": "user_sentiment",
@@ -93,7 +222,8 @@ class Config:
             "response_type": "select",
             "required": False,
             "default_value": None,
-            "field_key": "sentiment"
+            "field_key": "sentiment",
+            "max_tokens": 64  # Budget de sortie par défaut (avant apprentissage)
         },
         {
             "name": "failure_reasons",
@@ -103,7 +233,8 @@ class Config:
             "required": False,
             "default_value": None,
             "field_key": "tag",
-            "nullable": True  # Peut être null si pas d'échec
+            "nullable": True,  # Peut être null si pas d'échec
+            "max_tokens": 160  # Budget de sortie par défaut (avant apprentissage)
         },
         {
             "name": "failure_description",
@@ -112,7 +243,8 @@ class Config:
             "response_type": "text",
             "required": False,
             "default_value": None,
-            "nullable": True  # Peut être null si pas d'échec
+            "nullable": True,  # Peut être null si pas d'échec
+            "max_tokens": 300  # Budget de sortie par défaut (avant apprentissage)
         },
         {
             "name": "call_tags",
@@ -122,7 +254,8 @@ class Config:
             "required": True,
             "default_value": [],
             "field_key": "tag",
-            "nullable": False  # Doit toujours être une liste (même vide)
+            "nullable": False,  # Doit toujours être une liste (même vide)
+            "max_tokens": 250  # Budget de sortie par défaut (avant apprentissage)
         },
         {
             "name": "user_questions",
@@ -131,7 +264,8 @@ class Config:
             "response_type": "text_multiline",  # Texte multiligne
             "required": False,
             "default_value": None,
-            "nullable": True
+            "nullable": True,
+            "max_tokens": 600  # Budget de sortie par défaut (avant apprentissage)
         }
     ]
     
@@ -158,6 +292,28 @@ class Config:
         """Retourne la liste des valeurs de tags de suivi."""
         return [item["tag"] for item in Config.CALL_TAGS]
     
+    @staticmethod
+    def get_option_codes(question_config: dict) -> dict:
+        """Codes courts des options d'une question ("1", "2", ...) -> valeur exacte."""
+        options = question_config.get("options") or []
+        field_key = question_config.get("field_key")
+        return {str(index): option[field_key] for index, option in enumerate(options, 1)} if field_key else {}
+    
+    @staticmethod
+    def get_config_hash() -> str:
+        """Empreinte des questions et du prompt de base (invalide les résultats mis en cache)."""
+        payload = json.dumps(
+            {
+                # Les budgets de tokens n'influent pas sur les réponses attendues
+                "questions": [{k: v for k, v in q.items() if k != "max_tokens"} for q in Config.EXTRACTION_QUESTIONS],
+                "base_prompt": Config.BASE_SYSTEM_PROMPT,
+                "compact_enum_codes": Config.COMPACT_ENUM_CODES
+            },
+            sort_keys=True,
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+    
     
 
 
@@ -189,13 +345,11 @@ Ne réponds QU'EN JSON valide, sans aucun texte additionnel.
 """
 
     @staticmethod
-    def generate_minimal_question_prompt(question_config: dict, conversation_text: str, tools_text: str, failure_note: str = "") -> tuple[str, str]:
-        """Construit un prompt minimaliste par attribut en réutilisant un base prompt global.
-
-        Retourne (system_prompt, user_prompt)
+    def _question_format(question_config: dict) -> dict:
+        """Éléments de consigne d'une question (format JSON, instruction, options, règles),
+        communs aux prompts d'un appel et aux prompts groupés (call_packing).
         """
         name = question_config["name"]
-        description = question_config["description"]
         response_type = question_config["response_type"]
         nullable = question_config.get("nullable", False)
         options = question_config.get("options")
@@ -203,12 +357,24 @@ Ne réponds QU'EN JSON valide, sans aucun texte additionnel.
 
         # Construire la liste des valeurs exactes si des options sont disponibles
         valid_values_text = ""
-        if options and field_key:
+        compact = Config.COMPACT_ENUM_CODES and bool(options and field_key) and response_type in ("select", "multiselect")
+        if compact:
+            codes = Config.get_option_codes(question_config)
+            valid_values_text = "\n\nCODES AUTORISÉS (réponds avec le CODE, pas avec la valeur) :\n" + "\n".join(
+                f"{code} = {value}" for code, value in codes.items()
+            ) + "\n"
+        elif options and field_key:
             valid_values = [opt[field_key] for opt in options]
             valid_values_text = f"\n\nVALEURS EXACTES AUTORISÉES (utilise EXACTEMENT ces valeurs) :\n{', '.join(valid_values)}\n"
 
         # Format JSON attendu court et instruction brève
-        if response_type == "select":
+        if compact and response_type == "select":
+            json_format = f'"{name}": 1'
+            instruction = "Sélectionne UNE seule valeur et réponds avec son CODE numérique."
+        elif compact:
+            json_format = f'"{name}": [1, 2]' + (" | null" if nullable else "")
+            instruction = "Sélectionne toutes les valeurs pertinentes et réponds avec la liste de leurs CODES numériques (liste vide [] si aucune)."
+        elif response_type == "select":
             json_format = f'"{name}": "valeur"'
             instruction = f"Sélectionne UNE seule valeur EXACTE{(' parmi les valeurs autorisées' if valid_values_text else '')}."
         elif response_type == "multiselect":
@@ -230,13 +396,43 @@ Ne réponds QU'EN JSON valide, sans aucun texte additionnel.
             json_format = f'"{name}": null'
             instruction = "Retourne au bon format JSON."
 
-        system_prompt = Config.BASE_SYSTEM_PROMPT
-
         # Règle absolue seulement pour select/multiselect avec options
         absolute_rule = ""
-        if response_type in ("select", "multiselect") and valid_values_text:
+        if compact:
+            absolute_rule = "\nRÈGLE ABSOLUE: Utilise UNIQUEMENT les codes de la liste fournie.\n"
+        elif response_type in ("select", "multiselect") and valid_values_text:
             absolute_rule = "\nRÈGLE ABSOLUE: Copie-colle EXACTEMENT les valeurs depuis la liste fournie. Pas de variations, pas de reformulation.\n"
 
+        if compact:
+            options_reminder = "Les options sont désignées par des codes : réponds avec les CODES numériques, jamais avec les valeurs."
+        else:
+            options_reminder = "Si des options sont fournies, COPIE-COLLE EXACTEMENT les valeurs (casse/accents/underscores conservés)."
+
+        return {
+            "json_format": json_format,
+            "instruction": instruction,
+            "valid_values_text": valid_values_text,
+            "absolute_rule": absolute_rule,
+            "options_reminder": options_reminder
+        }
+
+    @staticmethod
+    def generate_minimal_question_prompt(question_config: dict, conversation_text: str, tools_text: str, failure_note: str = "") -> tuple[str, str]:
+        """Construit un prompt minimaliste par attribut en réutilisant un base prompt global.
+
+        Retourne (system_prompt, user_prompt)
+        """
+        name = question_config["name"]
+        description = question_config["description"]
+        question_format = Config._question_format(question_config)
+        json_format = question_format["json_format"]
+        instruction = question_format["instruction"]
+        valid_values_text = question_format["valid_values_text"]
+        absolute_rule = question_format["absolute_rule"]
+        options_reminder = question_format["options_reminder"]
+
+        system_prompt = Config.BASE_SYSTEM_PROMPT
+
         user_prompt = f"""Tâche: Extraire l'attribut: {name}
 But: {description}
 Consignes: {instruction}{valid_values_text}{absolute_rule}
@@ -244,7 +440,7 @@ Consignes: {instruction}{valid_values_text}{absolute_rule}
 Rappels obligatoires :
 - Réponds EXCLUSIVEMENT par un unique objet JSON valide (aucun texte hors JSON, aucun markdown, aucune explication).
 - N'ajoute AUCUNE clé supplémentaire au schéma demandé.
-- Si des options sont fournies, COPIE-COLLE EXACTEMENT les valeurs (casse/accents/underscores conservés).
+- {options_reminder}
 - Si l'information est incertaine, utilise null, [] ou la valeur par défaut selon la consigne.
 - Appuie-toi UNIQUEMENT sur le transcript et les résultats d'outils fournis (aucune invention).
 - Ne modifie pas les intitulés ni l'ordre des sections suivantes : "Tâche:", "But:", "Consignes:", "Conversation:", "Résultats d'outils:".
@@ -265,3 +461,75 @@ Résultats d'outils:
 
         return system_prompt, user_prompt
 
+
+    @staticmethod
+    def generate_packed_question_prompt(question_config: dict, calls: list) -> tuple[str, str]:
+        """Prompt d'un attribut pour plusieurs appels courts à la fois (voir call_packing).
+
+        Args:
+            calls: liste de dicts {"call_id", "conversation_text", "tools_text", "failure_note"}
+
+        Retourne (system_prompt, user_prompt); la réponse attendue est un objet JSON dont
+        chaque clé est un call_id et chaque valeur l'objet de réponse habituel de l'attribut.
+        """
+        name = question_config["name"]
+        question_format = Config._question_format(question_config)
+
+        blocks = []
+        for call in calls:
+            blocks.append(f"""### APPEL {call["call_id"]}
+Conversation:
+{call["conversation_text"]}
+
+Résultats d'outils:
+{call["tools_text"]}
+{call.get("failure_note") or ""}""".rstrip())
+        example_ids = [call["call_id"] for call in calls[:2]]
+        json_format = ",\n".join(f'    "{call_id}": {{{question_format["json_format"]}}}' for call_id in example_ids)
+
+        user_prompt = f"""Tâche: Extraire l'attribut: {name} pour CHACUN des {len(calls)} appels ci-dessous (indépendamment les uns des autres)
+But: {question_config["description"]}
+Consignes: {question_format["instruction"]}{question_format["valid_values_text"]}{question_format["absolute_rule"]}
+
+Rappels obligatoires :
+- Réponds EXCLUSIVEMENT par un unique objet JSON valide (aucun texte hors JSON, aucun markdown, aucune explication).
+- Une clé par appel: l'identifiant exact indiqué après "### APPEL", dans le même ordre, sans en omettre aucun.
+- {question_format["options_reminder"]}
+- Si l'information est incertaine, utilise null, [] ou la valeur par défaut selon la consigne.
+- Chaque appel est analysé UNIQUEMENT à partir de son propre transcript et de ses propres résultats d'outils.
+
+Format attendu (structure) :
+{{
+{json_format}{"," if len(calls) > len(example_ids) else ""}
+    ...
+}}
+
+{(chr(10) * 2).join(blocks)}"""
+
+        return Config.BASE_SYSTEM_PROMPT, user_prompt
+
+    @staticmethod
+    def generate_reduce_question_prompt(question_config: dict, partial_answers: list) -> tuple[str, str]:
+        """Prompt de synthèse des réponses partielles d'un attribut texte (extraction par fenêtres).
+
+        Retourne (system_prompt, user_prompt)
+        """
+        name = question_config["name"]
+        question_format = Config._question_format(question_config)
+        answers_text = "\n".join(f"[Extrait {index}] {answer}" for index, answer in enumerate(partial_answers, 1))
+
+        user_prompt = f"""Tâche: Fusionner les réponses partielles de l'attribut: {name}
+But: {question_config["description"]}
+Consignes: Les réponses ci-dessous ont été extraites d'extraits successifs d'un même appel. Produis UNE réponse unique pour l'appel entier: supprime les doublons, conserve chaque information distincte, reste concis. {question_format["instruction"]}
+
+Rappels obligatoires :
+- Réponds EXCLUSIVEMENT par un unique objet JSON valide (aucun texte hors JSON, aucun markdown, aucune explication).
+- N'ajoute AUCUNE information absente des réponses partielles.
+
+Format attendu (structure) :
+{{{question_format["json_format"]}}}
+
+Réponses partielles:
+{answers_text}"""
+
+        return Config.BASE_SYSTEM_PROMPT, user_prompt
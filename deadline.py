@@ -0,0 +1,44 @@
+"""Échéance globale d'une analyse, répartie entre la récupération de l'appel et les extractions."""
+import time
+from typing import Optional
+
+
+class DeadlineExceeded(TimeoutError):
+    """L'échéance est dépassée avant le début d'une étape."""
+
+
+class Deadline:
+    """Échéance absolue (horloge monotone). Deadline(None) signifie «pas d'échéance»."""
+
+    # Délai réseau minimal accordé à une étape lancée juste avant l'échéance
+    MIN_TIMEOUT = 0.5
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.expires_at = time.monotonic() + seconds if seconds is not None else None
+
+    @property
+    def bounded(self) -> bool:
+        return self.expires_at is not None
+
+    def remaining(self) -> Optional[float]:
+        """Secondes restantes (None sans échéance, peut être négatif)."""
+        if self.expires_at is None:
+            return None
+        return self.expires_at - time.monotonic()
+
+    def expired(self, margin: float = 0.0) -> bool:
+        """Vrai si l'échéance est atteinte (ou le sera dans moins de `margin` secondes)."""
+        return self.expires_at is not None and self.remaining() <= margin
+
+    def timeout(self, default: float) -> float:
+        """Timeout réseau d'une étape: le temps restant, borné par `default`.
+
+        Raises:
+            DeadlineExceeded: si l'échéance est déjà dépassée
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return default
+        if remaining <= 0:
+            raise DeadlineExceeded("Échéance de l'analyse dépassée")
+        return max(min(remaining, default), self.MIN_TIMEOUT)
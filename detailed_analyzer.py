@@ -1,30 +1,65 @@
 """Module d'analyse détaillée avec questions/réponses."""
-from typing import List, Any
+from typing import List, Any, Callable, Dict, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
 import json
 from models import (
     CallAnalysisRequest,
     DetailedAnalysis,
     CallStatistics
 )
-from llm_clients import LLMClient
+from llm_router import LLMRouter
 from config import Config
+from deadline import Deadline
+from distilled_classifier import load_classifiers
+from token_budgets import collect_response_tokens, get_token_budgets
+from long_transcript import MapReduceExtractor, failing_windows, is_long, split_windows
+from llm_usage import in_context, record_usage
+from scheduling import failure_signals, has_failure_signals
+
+
+# Callback appelé à chaque attribut extrait: (nom, valeur, nb terminés, nb total)
+QuestionCallback = Callable[[str, Any, int, int], None]
 
 
 class DetailedAnalyzer:
     """Effectue l'analyse détaillée des appels avec erreurs."""
     
-    def __init__(self, model_name: str = "gpt-4o"):
-        self.llm = LLMClient(model_name)
+    # Nombre maximum de continuations demandées pour une réponse JSON tronquée
+    MAX_CONTINUATIONS = 2
+    
+    def __init__(self, model_name: str = "gpt-4o", max_parallel_questions: int = None, fallbacks: Optional[List[str]] = None):
+        self.llm = LLMRouter(model_name, fallbacks)
         self.model_name = model_name
+        self.max_parallel_questions = max_parallel_questions or Config.QUESTION_CONCURRENCY
+        self.token_budgets = get_token_budgets()
+        self.map_reduce = MapReduceExtractor(self)
     
-    def analyze(self, request: CallAnalysisRequest) -> DetailedAnalysis:
-        """Effectue l'analyse détaillée de l'appel."""
-        statistics = self._extract_statistics(request)
+    def analyze(self, request: CallAnalysisRequest, on_question: Optional[QuestionCallback] = None,
+                deadline: Optional[Deadline] = None) -> DetailedAnalysis:
+        """Effectue l'analyse détaillée de l'appel.
         
+        Args:
+            request: Requête d'analyse
+            on_question: Callback optionnel appelé (dans le thread appelant) dès qu'un attribut est extrait
+            deadline: Échéance optionnelle; les attributs non extraits à temps sont listés dans missing_attributes
+        """
+        with collect_response_tokens() as response_tokens:
+            statistics, missing, distilled = self._extract_statistics(request, on_question, deadline or Deadline())
+        return self.build_analysis(request, statistics, missing, distilled, response_tokens)
+    
+    def build_analysis(self, request: CallAnalysisRequest, statistics: CallStatistics, missing: List[str],
+                       distilled: Optional[List[str]] = None, response_tokens: Optional[Dict[str, int]] = None) -> DetailedAnalysis:
+        """Construit la DetailedAnalysis à partir des attributs extraits.
+
+        distilled: attributs prédits localement; response_tokens: longueur des réponses brutes du LLM par attribut.
+        """
         problem_detected = bool(statistics.failure_reasons)
         problem_type = statistics.failure_reasons[0] if problem_detected else "none"
         tags = self._generate_tags_from_statistics(statistics)
-        summary = self._generate_summary_from_statistics(statistics)
+        if "failure_reasons" in missing and not problem_detected:
+            summary = f"Analyse partielle (échéance atteinte), attributs manquants: {', '.join(missing)}"
+        else:
+            summary = self._generate_summary_from_statistics(statistics)
 
         return DetailedAnalysis(
             call_id=request.call_id,
@@ -35,7 +70,11 @@ class DetailedAnalyzer:
             summary=summary,
             recommendations=[],
             confidence=None,
-            statistics=statistics
+            statistics=statistics,
+            partial=bool(missing),
+            missing_attributes=missing,
+            distilled_attributes=distilled or [],
+            response_tokens=dict(response_tokens or {})
         )
     
     def _generate_tags_from_statistics(self, statistics: CallStatistics) -> List[str]:
@@ -57,7 +96,8 @@ class DetailedAnalyzer:
             errors_list = ", ".join([r.replace('_', ' ').title() for r in statistics.failure_reasons])
             return f"Plusieurs erreurs détectées: {errors_list}"
     
-    def _extract_single_question(self, question_config: dict, conversation_text: str, tools_text: str, failure_note: str = "") -> Any:
+    def _extract_single_question(self, question_config: dict, conversation_text: str, tools_text: str, failure_note: str = "",
+                                 deadline: Optional[Deadline] = None) -> Any:
         """Extrait une seule question avec un appel LLM dédié."""
         name = question_config["name"]
         
@@ -66,8 +106,11 @@ class DetailedAnalyzer:
             question_config, conversation_text, tools_text, failure_note
         )
         
-        # Appel LLM
-        response = self.llm.generate(user_prompt, system_prompt, temperature=0.2, max_tokens=600)
+        response, _ = self.generate_json(user_prompt, system_prompt, self.token_budgets.budget(question_config), name, deadline)
+        # Longueur de la réponse finale, continuations comprises: les réponses qui dépassent le
+        # budget doivent aussi être échantillonnées pour que le budget appris puisse augmenter
+        if response.strip():
+            self.token_budgets.record(name, response)
         
         # Parser la réponse JSON
         try:
@@ -84,6 +127,84 @@ class DetailedAnalyzer:
             print(f"Réponse LLM: {response[:200]}")
             return question_config.get("default_value")
     
+    def generate_json(self, user_prompt: str, system_prompt: str, max_tokens: int, label: str,
+                      deadline: Optional[Deadline] = None) -> Tuple[str, bool]:
+        """Appel LLM attendant un objet JSON, complété par une continuation s'il est tronqué.
+        
+        Returns:
+            (réponse, tronquée) - tronquée vaut True si une continuation a été nécessaire
+        """
+        # Sous échéance, le timeout réseau est le temps restant
+        llm_kwargs = {"timeout": deadline.timeout(Config.LLM_TIMEOUT_SECONDS)} if deadline and deadline.bounded else {}
+        response = self.llm.generate(user_prompt, system_prompt, temperature=0.2, max_tokens=max_tokens, **llm_kwargs)
+        record_usage(system_prompt + user_prompt, response, mock=self.llm.is_mock)
+        if not self._is_truncated(response):
+            return response, False
+        
+        # Réponse coupée par le budget: on demande uniquement la suite au lieu de tout régénérer
+        print(f" ✂️ {label}", end="", flush=True)
+        for _ in range(self.MAX_CONTINUATIONS):
+            llm_kwargs = {"timeout": deadline.timeout(Config.LLM_TIMEOUT_SECONDS)} if deadline and deadline.bounded else {}
+            if not response.strip():
+                # Budget épuisé avant tout texte (tokens de réflexion): rien à continuer,
+                # nouvelle demande avec un budget doublé
+                max_tokens *= 2
+                response = self.llm.generate(user_prompt, system_prompt, temperature=0.2, max_tokens=max_tokens, **llm_kwargs)
+                record_usage(system_prompt + user_prompt, response, mock=self.llm.is_mock)
+            else:
+                continuation = self.llm.generate(
+                    user_prompt, system_prompt, temperature=0.2, max_tokens=max_tokens,
+                    continue_from=response, **llm_kwargs
+                )
+                record_usage(system_prompt + user_prompt + response, continuation, mock=self.llm.is_mock)
+                # Un modèle qui reprend l'objet depuis le début (tour "continue" OpenAI/Gemini) au lieu
+                # de poursuivre la chaîne: la continuation seule est alors la réponse
+                combined = response + continuation
+                if not self._parses(combined) and self._parses(continuation):
+                    combined = continuation
+                response = combined
+            if not self._is_truncated(response):
+                break
+        else:
+            print(f" ⚠️ {label} toujours tronquée", end="", flush=True)
+        return response, True
+    
+    @staticmethod
+    def _parses(response: str) -> bool:
+        """Vrai si la réponse contient un objet JSON complet et valide."""
+        json_start = response.find('{')
+        json_end = response.rfind('}') + 1
+        if json_start < 0 or json_end <= json_start:
+            return False
+        try:
+            json.loads(response[json_start:json_end])
+            return True
+        except ValueError:
+            return False
+    
+    @staticmethod
+    def _is_truncated(response: str) -> bool:
+        """Vrai si la réponse est vide ou contient un objet JSON commencé mais non terminé (budget atteint)."""
+        if not response.strip():
+            return True
+        json_start = response.find('{')
+        if json_start < 0:
+            return False
+        try:
+            json.JSONDecoder().raw_decode(response[json_start:])
+            return False
+        except ValueError:
+            return not response.rstrip().endswith('}')
+    
+    @staticmethod
+    def _decode_option_code(item: Any, codes: dict) -> Any:
+        """Valeur d'option correspondant à un code (1, "1" ou " 1 "), l'élément inchangé sinon."""
+        if isinstance(item, int) and not isinstance(item, bool):
+            item = str(item)
+        if isinstance(item, str):
+            return codes.get(item.strip(), item)
+        return item
+    
     def _validate_and_normalize_value(self, value: Any, question_config: dict) -> Any:
         """Valide une valeur selon la configuration de la question (vérifie le format et les options)."""
         response_type = question_config["response_type"]
@@ -96,6 +217,15 @@ class DetailedAnalyzer:
         if value is None or (isinstance(value, str) and value.lower() == "null"):
             return None if nullable else (default_value if default_value is not None else [])
         
+        # Codes courts (COMPACT_ENUM_CODES) reconvertis en valeurs; les valeurs complètes restent acceptées.
+        # Sans codes dans le prompt, un "1" ou "2" isolé reste une réponse invalide
+        if Config.COMPACT_ENUM_CODES and response_type in ("select", "multiselect") and options and field_key:
+            codes = Config.get_option_codes(question_config)
+            if isinstance(value, list):
+                value = [self._decode_option_code(item, codes) for item in value]
+            else:
+                value = self._decode_option_code(value, codes)
+        
         # Validation selon le type
         if response_type == "select":
             # Vérifier que la valeur est exactement dans les options
@@ -164,45 +294,96 @@ class DetailedAnalyzer:
         
         return value
     
-    def _extract_statistics(self, request: CallAnalysisRequest) -> CallStatistics:
-        """Extrait toutes les statistiques de l'appel - un appel LLM par question."""
+    def _extract_statistics(self, request: CallAnalysisRequest, on_question: Optional[QuestionCallback] = None,
+                            deadline: Optional[Deadline] = None) -> Tuple[CallStatistics, List[str], List[str]]:
+        """Extrait toutes les statistiques de l'appel - un appel LLM par question, en parallèle.
         
-        conversation_text = self._build_conversation_text(request)
-        tools_text = self._build_tools_text(request)
+        Returns:
+            (statistiques, attributs manquants faute de temps avant l'échéance, attributs prédits localement)
+        """
+        deadline = deadline or Deadline()
         
-        # Vérifier s'il y a des échecs pour guider le LLM
-        has_failure = (
-            any(not tool.success for tool in request.tool_results) or
-            any("erreur" in turn.content.lower() or "échec" in turn.content.lower() 
-                for turn in request.conversation)
-        )
+        tools_text = self._build_tools_text(request)
         
-        failure_note = "⚠️ ATTENTION: Un ou plusieurs outils ont échoué. Identifie les raisons d'échec." if has_failure else "✅ Aucun échec détecté. failure_reasons et failure_description doivent être null."
+        failure_note = self.build_failure_note(request)
         
         # Initialiser les résultats avec les valeurs par défaut
         results = {}
+        questions = Config.EXTRACTION_QUESTIONS
+        total = len(questions)
+        
+        # Transcript très long: chaque question est extraite par fenêtres puis fusionnée;
+        # l'indication d'échec n'est donnée qu'aux fenêtres qui contiennent les tours en échec
+        windows = None
+        if is_long(self, request):
+            windows = split_windows(self, request)
+            conversation_text = [self._build_conversation_text(request, start, end) for start, end in windows]
+            failing = failing_windows(request, windows)
+            if any(failing):
+                failure_note = [failure_note if window_failing else "" for window_failing in failing]
+            print(f"  📚 Transcript long: {len(request.conversation)} tours en {len(windows)} fenêtres")
+        else:
+            conversation_text = self._build_conversation_text(request)
         
-        # Extraire chaque question individuellement
         print("  Extractions:", end=" ", flush=True)
-        for idx, question_config in enumerate(Config.EXTRACTION_QUESTIONS):
-            question_name = question_config["name"]
-            if idx > 0:
+        
+        # Attributs prédits localement avec une confiance suffisante: pas d'appel LLM
+        distilled = []
+        for name, (value, probability) in self.predict_locally(request).items():
+            results[name] = value
+            distilled.append(name)
+            if len(results) > 1:
                 print(",", end=" ", flush=True)
-            print(f"{question_name}", end="", flush=True)
-            
-            value = self._extract_single_question(
-                question_config, 
-                conversation_text, 
-                tools_text, 
-                failure_note if question_name in ["failure_reasons", "failure_description"] else ""
-            )
+            print(f"{name} ⚡{probability:.2f}", end="", flush=True)
+            if on_question:
+                on_question(name, value, len(results), total)
+        questions = [q for q in questions if q["name"] not in results]
+        
+        # Extraire chaque question restante avec un appel dédié; les résultats sont remontés
+        # dans l'ordre d'arrivée pour permettre un affichage progressif
+        tasks = len(questions) * (len(windows) if windows else 1)
+        executor = ThreadPoolExecutor(max_workers=max(1, min(self.max_parallel_questions, tasks)))
+        try:
+            future_to_name = {}
+            for question_config in questions:
+                note = failure_note if question_config["name"] in ["failure_reasons", "failure_description"] else ""
+                if windows:
+                    future = self.map_reduce.submit_question(executor, question_config, conversation_text, tools_text, note, deadline)
+                else:
+                    future = executor.submit(in_context(self._extract_single_question), question_config, conversation_text, tools_text, note, deadline)
+                future_to_name[future] = question_config["name"]
             
-            results[question_name] = value
+            for future in as_completed(future_to_name, timeout=deadline.remaining()):
+                question_name = future_to_name[future]
+                try:
+                    value = future.result()
+                except Exception:
+                    # Une extraction interrompue par l'échéance devient un attribut manquant
+                    if not deadline.expired(margin=Deadline.MIN_TIMEOUT):
+                        raise
+                    continue
+                results[question_name] = value
+                
+                if len(results) > 1:
+                    print(",", end=" ", flush=True)
+                print(f"{question_name}", end="", flush=True)
+                
+                if on_question:
+                    on_question(question_name, value, len(results), total)
+        except FuturesTimeoutError:
+            pass
+        finally:
+            # Sans attendre les extractions encore en vol (leurs sockets sont bornées par l'échéance)
+            executor.shutdown(wait=False, cancel_futures=True)
+        
+        missing = [q["name"] for q in Config.EXTRACTION_QUESTIONS if q["name"] not in results]
+        if missing:
+            print(f"\n  ⏱️  Échéance atteinte, attributs manquants: {', '.join(missing)}", end="")
         
         print()  # Nouvelle ligne après les extractions
         
         # Construire CallStatistics avec les résultats
-        return CallStatistics(
+        statistics = CallStatistics(
             call_reason=results.get("call_reason"),
             user_questions=results.get("user_questions"),
             user_sentiment=results.get("user_sentiment"),
@@ -210,12 +391,35 @@ class DetailedAnalyzer:
             failure_description=results.get("failure_description"),
             call_tags=results.get("call_tags", [])
         )
+        return statistics, missing, distilled
+    
+    def predict_locally(self, request: CallAnalysisRequest) -> dict:
+        """Attributs prédits par les classifieurs distillés au-dessus du seuil: {nom: (valeur, probabilité)}.
+
+        Les modèles sont relus à chaque appel (rechargés seulement si le fichier a changé), pour
+        qu'un réentraînement soit pris en compte par les analyseurs mis en cache.
+        """
+        predictions = {}
+        for name, classifier in load_classifiers().items():
+            value, probability = classifier.predict_request(request)
+            if probability >= Config.DISTILLED_CONFIDENCE_THRESHOLD:
+                predictions[name] = (value, probability)
+        return predictions
+    
+    def build_failure_note(self, request: CallAnalysisRequest) -> str:
+        """Indication donnée au LLM pour failure_reasons/failure_description selon les échecs visibles."""
+        # Vérifier s'il y a des échecs pour guider le LLM
+        has_failure = has_failure_signals(failure_signals(request))
+        
+        return "⚠️ ATTENTION: Un ou plusieurs outils ont échoué. Identifie les raisons d'échec." if has_failure else "✅ Aucun échec détecté. failure_reasons et failure_description doivent être null."
     
-    def _build_conversation_text(self, request: CallAnalysisRequest) -> str:
-        """Construit le texte de la conversation pour les prompts."""
+    def _build_conversation_text(self, request: CallAnalysisRequest, start: int = 0, end: Optional[int] = None) -> str:
+        """Construit le texte de la conversation pour les prompts (tours start à end pour un extrait)."""
         text = "TRANSCRIPT DE LA CONVERSATION:\n"
+        if start or (end is not None and end < len(request.conversation)):
+            text += f"(EXTRAIT: tours {start + 1} à {min(end or len(request.conversation), len(request.conversation))} sur {len(request.conversation)})\n"
         text += "=" * 60 + "\n"
-        for idx, turn in enumerate(request.conversation, 1):
+        for idx, turn in enumerate(request.conversation[start:end], start + 1):
             # Identifie clairement l'appelant vs l'agent
             if turn.role == "user":
                 role_label = "APPELANT"
@@ -0,0 +1,333 @@
+"""Classifieur local (n-grammes hachés + régression logistique NumPy) appris sur les étiquettes du LLM.
+
+Il prédit les attributs de type select (call_reason, user_sentiment) à partir du transcript,
+avec une probabilité calibrée: DetailedAnalyzer n'appelle plus le LLM quand elle dépasse
+Config.DISTILLED_CONFIDENCE_THRESHOLD. Le réentraînement périodique se fait via la commande
+`train` (ex: tâche cron quotidienne), l'évaluation via `evaluate`.
+"""
+import os
+import re
+import threading
+import unicodedata
+import zlib
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from config import Config
+from models import CallAnalysisRequest
+from results_db import normalize_transcript
+
+# Dimension de l'espace des n-grammes hachés
+N_FEATURES = 2 ** 18
+
+# Seuils présentés dans le rapport d'évaluation (couverture / précision sélective)
+REPORT_THRESHOLDS = (0.5, 0.7, 0.8, 0.9, 0.95, 0.99)
+
+Features = Tuple[np.ndarray, np.ndarray]  # (indices, valeurs)
+
+
+def featurize(text: str, n_features: int = N_FEATURES) -> Features:
+    """Unigrammes et bigrammes de mots (minuscules, sans accents), hachés, TF log, norme L2."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    words = re.findall(r"\w+", text)
+    grams = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    if not grams:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    hashes = np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.int64, count=len(grams)) % n_features
+    indices, counts = np.unique(hashes, return_counts=True)
+    values = (1.0 + np.log(counts)).astype(np.float32)
+    values /= np.linalg.norm(values)
+    return indices, values
+
+
+def _stack(features: Sequence[Features]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Concatène un lot de vecteurs creux en (lignes, colonnes, valeurs)."""
+    rows = np.repeat(np.arange(len(features)), [len(f[0]) for f in features])
+    cols = np.concatenate([f[0] for f in features]) if features else np.zeros(0, dtype=np.int64)
+    vals = np.concatenate([f[1] for f in features]) if features else np.zeros(0, dtype=np.float32)
+    return rows, cols, vals
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    shifted = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(shifted)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+class DistilledClassifier:
+    """Régression logistique multinomiale sur n-grammes hachés, calibrée par température."""
+
+    def __init__(self, attribute: str, classes: List[str], n_features: int = N_FEATURES,
+                 weights: Optional[np.ndarray] = None, bias: Optional[np.ndarray] = None, temperature: float = 1.0,
+                 trained_until: Optional[str] = None):
+        self.attribute = attribute
+        self.classes = list(classes)
+        self.n_features = n_features
+        self.weights = weights if weights is not None else np.zeros((n_features, len(classes)), dtype=np.float32)
+        self.bias = bias if bias is not None else np.zeros(len(classes), dtype=np.float32)
+        self.temperature = temperature
+        self.trained_until = trained_until  # Horodatage du plus récent appel d'entraînement (ISO)
+
+    def _logits(self, features: Sequence[Features]) -> np.ndarray:
+        rows, cols, vals = _stack(features)
+        logits = np.empty((len(features), len(self.classes)), dtype=np.float64)
+        for k in range(len(self.classes)):
+            logits[:, k] = np.bincount(rows, weights=vals * self.weights[cols, k], minlength=len(features))
+        return logits + self.bias
+
+    def predict_proba(self, texts: Sequence[str]) -> np.ndarray:
+        """Probabilités calibrées (une ligne par texte, colonnes dans l'ordre de self.classes)."""
+        features = [featurize(t, self.n_features) for t in texts]
+        return _softmax(self._logits(features) / self.temperature)
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """Classe la plus probable et sa probabilité."""
+        proba = self.predict_proba([text])[0]
+        best = int(proba.argmax())
+        return self.classes[best], float(proba[best])
+
+    def predict_request(self, request: CallAnalysisRequest) -> Tuple[str, float]:
+        """Prédit à partir d'une requête d'analyse (même normalisation que les transcripts stockés)."""
+        return self.predict(normalize_transcript(request))
+
+    def fit(self, texts: Sequence[str], labels: Sequence[str], epochs: int = 8, learning_rate: float = 0.5,
+            l2: float = 1e-6, batch_size: int = 64, seed: int = 0) -> "DistilledClassifier":
+        """Entraîne par AdaGrad en mini-lots (seules les lignes de poids touchées sont mises à jour)."""
+        index = {c: i for i, c in enumerate(self.classes)}
+        targets = np.array([index[label] for label in labels])
+        features = [featurize(t, self.n_features) for t in texts]
+        accumulator = np.full_like(self.weights, 1e-8)
+        bias_accumulator = np.full_like(self.bias, 1e-8)
+        rng = np.random.default_rng(seed)
+
+        for _ in range(epochs):
+            order = rng.permutation(len(features))
+            for start in range(0, len(order), batch_size):
+                batch = order[start:start + batch_size]
+                batch_features = [features[i] for i in batch]
+                gradient = _softmax(self._logits(batch_features))
+                gradient[np.arange(len(batch)), targets[batch]] -= 1.0
+                gradient /= len(batch)
+
+                rows, cols, vals = _stack(batch_features)
+                touched, inverse = np.unique(cols, return_inverse=True)
+                weight_gradient = np.empty((len(touched), len(self.classes)), dtype=np.float32)
+                for k in range(len(self.classes)):
+                    weight_gradient[:, k] = np.bincount(inverse, weights=vals * gradient[rows, k], minlength=len(touched))
+                weight_gradient += l2 * self.weights[touched]
+                accumulator[touched] += weight_gradient ** 2
+                self.weights[touched] -= learning_rate * weight_gradient / np.sqrt(accumulator[touched])
+
+                bias_gradient = gradient.sum(axis=0)
+                bias_accumulator += bias_gradient ** 2
+                self.bias -= (learning_rate * bias_gradient / np.sqrt(bias_accumulator)).astype(np.float32)
+        return self
+
+    def calibrate(self, texts: Sequence[str], labels: Sequence[str]) -> float:
+        """Choisit la température minimisant la log-vraisemblance négative sur un jeu de validation."""
+        index = {c: i for i, c in enumerate(self.classes)}
+        known = [(t, index[label]) for t, label in zip(texts, labels) if label in index]
+        if not known:
+            return self.temperature
+        logits = self._logits([featurize(t, self.n_features) for t, _ in known])
+        targets = np.array([target for _, target in known])
+        best_nll = np.inf
+        for temperature in np.logspace(-1.5, 1, 60):
+            proba = _softmax(logits / temperature)
+            nll = -np.mean(np.log(proba[np.arange(len(targets)), targets] + 1e-12))
+            if nll < best_nll:
+                best_nll, self.temperature = nll, float(temperature)
+        return self.temperature
+
+    def save(self, path: str):
+        np.savez_compressed(
+            path,
+            attribute=self.attribute,
+            classes=np.array(self.classes),
+            n_features=self.n_features,
+            weights=self.weights,
+            bias=self.bias,
+            temperature=self.temperature,
+            trained_until=self.trained_until or ""
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "DistilledClassifier":
+        data = np.load(path)
+        return cls(
+            attribute=str(data["attribute"]),
+            classes=[str(c) for c in data["classes"]],
+            n_features=int(data["n_features"]),
+            weights=data["weights"],
+            bias=data["bias"],
+            temperature=float(data["temperature"]),
+            trained_until=(str(data["trained_until"]) or None) if "trained_until" in data.files else None
+        )
+
+
+def evaluate(classifier: DistilledClassifier, texts: Sequence[str], labels: Sequence[str]) -> Dict:
+    """Exactitude, calibration (ECE) et couverture/précision pour chaque seuil de confiance."""
+    proba = classifier.predict_proba(texts)
+    predicted = np.array(classifier.classes, dtype=object)[proba.argmax(axis=1)]
+    confidence = proba.max(axis=1)
+    correct = predicted == np.array(labels, dtype=object)
+
+    # Erreur de calibration attendue sur 10 intervalles de confiance
+    bins = np.minimum((confidence * 10).astype(int), 9)
+    counts = np.bincount(bins, minlength=10)
+    gaps = np.abs(np.bincount(bins, weights=correct, minlength=10) - np.bincount(bins, weights=confidence, minlength=10))
+    ece = float(gaps.sum() / max(len(labels), 1))
+
+    thresholds = []
+    for threshold in REPORT_THRESHOLDS:
+        covered = confidence >= threshold
+        thresholds.append({
+            "threshold": threshold,
+            "coverage": float(covered.mean()) if len(labels) else 0.0,
+            "accuracy": float(correct[covered].mean()) if covered.any() else None
+        })
+
+    per_class = []
+    for label in classifier.classes:
+        is_label, is_predicted = np.array(labels, dtype=object) == label, predicted == label
+        true_positives = int((is_label & is_predicted).sum())
+        per_class.append({
+            "class": label,
+            "support": int(is_label.sum()),
+            "precision": true_positives / int(is_predicted.sum()) if is_predicted.any() else None,
+            "recall": true_positives / int(is_label.sum()) if is_label.any() else None
+        })
+
+    return {
+        "examples": len(labels),
+        "accuracy": float(correct.mean()) if len(labels) else None,
+        "ece": ece,
+        "bins": counts.tolist(),
+        "thresholds": thresholds,
+        "per_class": per_class
+    }
+
+
+def deduplicate_examples(examples: List[Dict]) -> List[Dict]:
+    """Un exemple par appel (labelled_transcripts en renvoie un par couple appel/modèle).
+
+    L'étiquette retenue est la plus fréquente parmi les modèles; un appel à égalité est écarté.
+    Sans cela, un même transcript peut tomber à la fois dans l'entraînement et la validation,
+    ce qui rend la calibration et l'exactitude mesurée trop optimistes.
+    """
+    by_call: Dict[str, List[Dict]] = {}
+    for example in examples:
+        by_call.setdefault(example["call_id"], []).append(example)
+    unique = []
+    for rows in by_call.values():
+        ranked = Counter(row["label"] for row in rows).most_common(2)
+        if len(ranked) > 1 and ranked[0][1] == ranked[1][1]:
+            continue
+        unique.append({**rows[0], "label": ranked[0][0], "timestamp": max(row["timestamp"] for row in rows)})
+    return unique
+
+
+def train_attribute(texts: Sequence[str], labels: Sequence[str], attribute: str,
+                    validation_split: float = 0.2, seed: int = 0) -> Tuple[DistilledClassifier, Dict]:
+    """Entraîne, calibre sur un jeu de validation tenu à l'écart et évalue un classifieur."""
+    order = np.random.default_rng(seed).permutation(len(texts))
+    n_validation = max(1, int(len(texts) * validation_split))
+    validation, train = order[:n_validation], order[n_validation:]
+
+    classes = sorted({labels[i] for i in train})
+    classifier = DistilledClassifier(attribute, classes)
+    classifier.fit([texts[i] for i in train], [labels[i] for i in train], seed=seed)
+    classifier.calibrate([texts[i] for i in validation], [labels[i] for i in validation])
+    return classifier, evaluate(classifier, [texts[i] for i in validation], [labels[i] for i in validation])
+
+
+def model_path(attribute: str, model_dir: Optional[str] = None) -> str:
+    return os.path.join(model_dir or Config.DISTILLED_MODEL_DIR, f"{attribute}.npz")
+
+
+_loaded: Dict[str, Tuple[float, DistilledClassifier]] = {}
+_loaded_lock = threading.Lock()
+
+
+def load_classifiers(model_dir: Optional[str] = None) -> Dict[str, DistilledClassifier]:
+    """Classifieurs disponibles pour Config.DISTILLED_ATTRIBUTES (rechargés si le fichier a changé)."""
+    model_dir = model_dir or Config.DISTILLED_MODEL_DIR
+    if not model_dir:
+        return {}
+    classifiers = {}
+    with _loaded_lock:
+        for attribute in Config.DISTILLED_ATTRIBUTES:
+            path = model_path(attribute, model_dir)
+            if not os.path.exists(path):
+                continue
+            mtime = os.path.getmtime(path)
+            cached = _loaded.get(path)
+            if cached is None or cached[0] != mtime:
+                cached = _loaded[path] = (mtime, DistilledClassifier.load(path))
+            classifiers[attribute] = cached[1]
+    return classifiers
+
+
+def print_report(attribute: str, report: Dict):
+    print(f"\n📊 {attribute}: {report['examples']} exemples, exactitude {report['accuracy']:.1%}, ECE {report['ece']:.3f}")
+    print("   seuil   couverture   exactitude")
+    for row in report["thresholds"]:
+        accuracy = f"{row['accuracy']:.1%}" if row["accuracy"] is not None else "-"
+        print(f"   {row['threshold']:<7} {row['coverage']:>9.1%}   {accuracy:>10}")
+    for row in report["per_class"]:
+        precision = f"{row['precision']:.0%}" if row["precision"] is not None else "-"
+        recall = f"{row['recall']:.0%}" if row["recall"] is not None else "-"
+        print(f"   {row['class']:<28} n={row['support']:<5} précision {precision:>4}  rappel {recall:>4}")
+
+
+if __name__ == "__main__":
+    import argparse
+    from results_db import ResultsDatabase
+
+    parser = argparse.ArgumentParser(description="Classifieurs locaux distillés des réponses du LLM")
+    parser.add_argument("--db", default=Config.RESULTS_DB_PATH, required=Config.RESULTS_DB_PATH is None, help="Chemin de la base SQLite")
+    parser.add_argument("--dir", default=Config.DISTILLED_MODEL_DIR, required=Config.DISTILLED_MODEL_DIR is None, help="Répertoire des modèles")
+    parser.add_argument("--attribute", action="append", default=None, help="Attribut (répétable, défaut: DISTILLED_ATTRIBUTES)")
+    parser.add_argument("--model", default=None, help="N'utilise que les étiquettes produites par ce modèle LLM")
+    parser.add_argument("--since", default=None, help="Date/heure minimale des appels (ISO)")
+    parser.add_argument("--until", default=None, help="Date/heure maximale des appels (ISO)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    train_parser = subparsers.add_parser("train", help="(Ré)entraîne les classifieurs sur les analyses stockées")
+    train_parser.add_argument("--min-examples", type=int, default=200, help="Nombre minimum d'exemples étiquetés")
+    subparsers.add_parser("evaluate", help="Évalue les classifieurs enregistrés sur les appels postérieurs à leur entraînement")
+    args = parser.parse_args()
+
+    db = ResultsDatabase(args.db)
+    attributes = args.attribute or Config.DISTILLED_ATTRIBUTES
+    for attribute in attributes:
+        examples = deduplicate_examples(db.labelled_transcripts(attribute, model=args.model, since=args.since, until=args.until))
+
+        if args.command == "train":
+            if len(examples) < args.min_examples:
+                print(f"⚠️  {attribute}: {len(examples)} exemples étiquetés (minimum {args.min_examples}), modèle non entraîné")
+                continue
+            texts = [e["transcript"] for e in examples]
+            labels = [e["label"] for e in examples]
+            classifier, report = train_attribute(texts, labels, attribute)
+            classifier.trained_until = max(e["timestamp"] for e in examples)
+            os.makedirs(args.dir, exist_ok=True)
+            classifier.save(model_path(attribute, args.dir))
+            print_report(attribute, report)
+            print(f"✅ Modèle enregistré: {model_path(attribute, args.dir)} (température {classifier.temperature:.2f})")
+        else:
+            path = model_path(attribute, args.dir)
+            if not os.path.exists(path):
+                print(f"⚠️  {attribute}: aucun modèle dans {args.dir}")
+                continue
+            classifier = DistilledClassifier.load(path)
+            # Seuls les appels postérieurs à l'entraînement sont des exemples non vus
+            if classifier.trained_until:
+                examples = [e for e in examples if e["timestamp"] > classifier.trained_until]
+                print(f"ℹ️  {attribute}: évaluation sur les appels après {classifier.trained_until}")
+            if not examples:
+                print(f"⚠️  {attribute}: aucun appel étiqueté postérieur à l'entraînement")
+                continue
+            texts = [e["transcript"] for e in examples]
+            labels = [e["label"] for e in examples]
+            print_report(attribute, evaluate(classifier, texts, labels))
@@ -0,0 +1,123 @@
+"""Transport HTTP dédié à l'API REST Gemini: pool persistant, préchauffage et fragments pré-sérialisés."""
+import json
+import threading
+from typing import Optional
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    # HTTP/2 (une seule connexion TLS multiplexée par hôte) si httpx et h2 sont installés
+    import httpx
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+
+# Fragments JSON statiques, sérialisés une seule fois par process
+_SAFETY_SETTINGS_JSON = json.dumps([
+    {"category": category, "threshold": "BLOCK_NONE"}
+    for category in (
+        "HARM_CATEGORY_HARASSMENT",
+        "HARM_CATEGORY_HATE_SPEECH",
+        "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+        "HARM_CATEGORY_DANGEROUS_CONTENT",
+    )
+], separators=(",", ":")).encode("utf-8")
+
+
+def encode_prompt(text: str, continue_from: Optional[str] = None, continue_instruction: str = "") -> bytes:
+    """Fragment "contents" du payload, encodé une seule fois.
+
+    Avec continue_from, la réponse tronquée est rejouée comme tour du modèle suivie de la
+    consigne de continuation: seule la fin de la réponse est générée.
+    """
+    contents = [{"role": "user", "parts": [{"text": text}]}]
+    if continue_from is not None:
+        contents.append({"role": "model", "parts": [{"text": continue_from}]})
+        contents.append({"role": "user", "parts": [{"text": continue_instruction}]})
+    return json.dumps(contents, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def build_body(contents: bytes, temperature: float, max_tokens: int) -> bytes:
+    """Assemble le corps de la requête generateContent sans re-sérialiser le prompt ni les safetySettings."""
+    generation_config = json.dumps({"temperature": temperature, "maxOutputTokens": max_tokens}, separators=(",", ":"))
+    return b"".join([
+        b'{"contents":', contents,
+        b',"generationConfig":', generation_config.encode("utf-8"),
+        b',"safetySettings":', _SAFETY_SETTINGS_JSON,
+        b"}"
+    ])
+
+
+class GeminiTransport:
+    """Connexions keep-alive vers generativelanguage.googleapis.com partagées par tout le process.
+
+    Avec httpx + h2, les requêtes concurrentes sont multiplexées sur une connexion HTTP/2;
+    sinon une session requests conserve un pool de connexions HTTP/1.1 réutilisées.
+    Le coût de la poignée de main TLS est ainsi payé une fois par worker (voire dès le
+    démarrage avec warm_up) et non à chaque question.
+    """
+
+    def __init__(self, proxy_url: Optional[str] = None, pool_size: int = 32, http2: bool = True):
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self._warm_up_started = False
+        self._lock = threading.Lock()
+        if self.http2:
+            self._client = httpx.Client(
+                http2=True,
+                proxy=proxy_url,
+                trust_env=proxy_url is None,
+                limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+            )
+        else:
+            self._client = requests.Session()
+            self._client.trust_env = proxy_url is None
+            if proxy_url:
+                self._client.proxies = {"http": proxy_url, "https": proxy_url}
+            self._client.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+
+    def generate_content(self, api_model: str, api_key: str, body: bytes, timeout: float) -> dict:
+        """POST generateContent et retourne la réponse JSON décodée.
+
+        Raises:
+            RuntimeError: en cas d'erreur réseau ou de statut HTTP d'erreur
+        """
+        url = f"{GEMINI_BASE_URL}/models/{api_model}:generateContent"
+        headers = {"Content-Type": "application/json", "x-goog-api-key": api_key}
+        try:
+            if self.http2:
+                response = self._client.post(url, content=body, headers=headers, timeout=timeout)
+            else:
+                response = self._client.post(url, data=body, headers=headers, timeout=timeout)
+            response.raise_for_status()
+        except (requests.exceptions.RequestException, *((httpx.HTTPError,) if HTTP2_AVAILABLE else ())) as e:
+            raise RuntimeError(f"Erreur lors de l'appel API Gemini: {e}")
+        return response.json()
+
+    def warm_up(self, api_key: str, timeout: float = 10.0):
+        """Ouvre la connexion TLS en arrière-plan (une seule fois par process).
+
+        Une requête légère (métadonnées d'un modèle) suffit à établir la connexion
+        qui restera ensuite dans le pool; un échec est sans conséquence.
+        """
+        with self._lock:
+            if self._warm_up_started:
+                return
+            self._warm_up_started = True
+
+        def run():
+            try:
+                self._client.get(
+                    f"{GEMINI_BASE_URL}/models/gemini-2.0-flash",
+                    headers={"x-goog-api-key": api_key},
+                    timeout=timeout
+                )
+            except Exception as e:
+                print(f"ℹ️  Préchauffage de la connexion Gemini impossible: {e}")
+
+        threading.Thread(target=run, name="gemini-warm-up", daemon=True).start()
+
+    def close(self):
+        self._client.close()
@@ -1,10 +1,29 @@
 """Script pour générer un CSV avec les analyses de tous les appels et modèles."""
 import csv
+import subprocess
 import sys
+import time
 from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from threading import Lock
 from main import PostCallMonitoringSystem
+from config import Config
+from results_db import ResultsDatabase
+from anomaly_detector import attach_detector
+from call_packing import pack_requests
+from deadline import Deadline
+from pipeline import Pipeline, Stage
+from scheduling import agent_of, priority_score
+from llm_usage import measure_usage
+from sharding import merge_records, part_filename, read_part, resolve_parts, select_shard, write_part
+from result_records import (
+    CSV_FIELDNAMES,
+    build_comparison_row,
+    comparison_fieldnames,
+    build_result_record,
+    build_error_record,
+    record_to_csv_row
+)
 from dotenv import load_dotenv
 
 # Charger les variables d'environnement
@@ -49,117 +68,359 @@ MODELS = [
 # Verrou pour l'affichage thread-safe
 print_lock = Lock()
 
+# Systèmes d'analyse partagés par modèle (clients LLM et HTTP créés une seule fois)
+_systems = {}
+_systems_lock = Lock()
 
-def format_list_field(value):
-    """Formate une liste pour le CSV (sépare par des points-virgules)."""
-    if value is None:
-        return ""
-    if isinstance(value, list):
-        return "; ".join(str(v) for v in value)
-    return str(value)
+# Base de résultats partagée (optionnelle, voir --db)
+_results_db = None
 
 
-def analyze_and_extract(call_id: str, model: str, task_num: int = None, total_tasks: int = None):
-    """Analyse un appel avec un modèle et extrait les données."""
-    task_info = f"[{task_num}/{total_tasks}] " if task_num and total_tasks else ""
+def get_system(model: str, routing: bool = True) -> PostCallMonitoringSystem:
+    """Retourne le système d'analyse partagé pour un modèle.
     
-    with print_lock:
-        print(f"\n{task_info}{'='*70}")
-        print(f"{task_info}Analyse: Call ID = {call_id}, Modèle = {model}")
-        print(f"{task_info}{'='*70}")
+    Sans routing, seul ce modèle est interrogé (ni repli ni requête doublée): ses réponses,
+    latences et coûts lui sont attribuables (mode comparaison).
+    """
+    with _systems_lock:
+        if (model, routing) not in _systems:
+            fallbacks = None if routing else []
+            _systems[(model, routing)] = PostCallMonitoringSystem(model_name=model, results_db=_results_db, fallbacks=fallbacks)
+        return _systems[(model, routing)]
+
+
+def analyze_pipelined(tasks: list, fetch_workers: int = None, transform_workers: int = None,
+                      analyze_workers: int = None, deadline_s: float = None, prioritize: bool = None) -> list:
+    """Analyse les tâches avec un pipeline récupération → transformation → analyse LLM → résultats.
     
-    try:
-        # Initialise le système avec le modèle
-        system = PostCallMonitoringSystem(model_name=model)
-        
-        # Analyse l'appel
-        result = system.analyze_call_from_id(call_id)
+    Chaque appel est récupéré une seule fois (même s'il est analysé avec plusieurs modèles) et
+    les récupérations prennent de l'avance sur les analyses, dans la limite des files entre étapes.
+    Avec prioritize (défaut: Config.PRIORITY_SCHEDULING), les appels récupérés qui présentent des
+    signes d'échec sont analysés en premier, avec équité entre agents (voir scheduling).
+    L'échéance deadline_s d'un appel couvre sa récupération et son analyse (l'attente dans les
+    files entre étapes n'est pas décomptée).
+    """
+    if prioritize is None:
+        prioritize = Config.PRIORITY_SCHEDULING
+    total_tasks = len(tasks)
+    by_call = {}
+    for call_id, model, num in tasks:
+        by_call.setdefault(call_id, []).append((model, num))
+    
+    def fetch(item):
+        call_id, models = item
+        deadline = Deadline(deadline_s)
+        raw_data = get_system(models[0][0]).rounded_api.get_call(call_id, timeout=deadline.timeout(Config.HTTP_TIMEOUT_SECONDS))
+        if not raw_data:
+            raise LookupError("Impossible de récupérer l'appel depuis l'API Call Rounded")
+        return [(call_id, models, raw_data, deadline.remaining())]
+    
+    def transform(item):
+        call_id, models, raw_data, budget = item
+        request = get_system(models[0][0]).build_request(raw_data)
+        return [(call_id, request, model, num, budget) for model, num in models]
+    
+    def analyze(item):
+        call_id, request, model, num, budget = item
+        with print_lock:
+            print(f"\n[{num}/{total_tasks}] Analyse: Call ID = {call_id}, Modèle = {model}")
+        result = get_system(model).analyze_call(request, deadline=Deadline(budget))
+        return [(call_id, model, num, result)]
+    
+    def schedule(item):
+        request = item[1]
+        return priority_score(request), agent_of(request)
+    
+    pipeline = Pipeline([
+        Stage("fetch", fetch, fetch_workers or Config.PIPELINE_FETCH_WORKERS),
+        Stage("transform", transform, transform_workers or Config.PIPELINE_TRANSFORM_WORKERS),
+        Stage(
+            "analyze", analyze, analyze_workers or Config.PIPELINE_ANALYZE_WORKERS,
+            schedule=schedule if prioritize else None,
+            queue_size=Config.SCHEDULER_WINDOW if prioritize else None
+        )
+    ], queue_size=Config.PIPELINE_QUEUE_SIZE)
+    
+    results = []
+    for outcome in pipeline.run(by_call.items()):
+        if outcome.error is not None:
+            # Échec de récupération/transformation: toutes les analyses de l'appel sont en erreur
+            if outcome.stage == "analyze":
+                call_id, _, model, num, _ = outcome.item
+                failed = [(call_id, model, num)]
+            else:
+                call_id, models = outcome.item[0], outcome.item[1]
+                failed = [(call_id, model, num) for model, num in models]
+            for call_id, model, num in failed:
+                with print_lock:
+                    print(f"❌ [{num}/{total_tasks}] Erreur pour {call_id} avec {model} ({outcome.stage}): {outcome.error}")
+                results.append(build_error_record(call_id, model, f"Exception: {str(outcome.error)}"))
+            continue
         
-        if not result:
+        call_id, model, num, result = outcome.value
+        with print_lock:
+            if result.partial:
+                print(f"⏱️  [{num}/{total_tasks}] Analyse partielle: {call_id} avec {model} (manquants: {', '.join(result.missing_attributes)})")
+            else:
+                print(f"✅ [{num}/{total_tasks}] Analyse réussie: {call_id} avec {model}")
+        results.append(build_result_record(call_id, model, result))
+    return results
+
+
+def compare_models(call_ids: list, models: list, fetch_workers: int = None, transform_workers: int = None,
+                   analyze_workers: int = None, deadline_s: float = None, filename: str = None) -> str:
+    """Mode comparaison: chaque appel est récupéré et transformé une fois, puis analysé par tous
+    les modèles en parallèle. Écrit une ligne par appel avec les réponses de chaque modèle côte à côte,
+    sa latence et son coût estimé. Retourne le nom du fichier écrit.
+    
+    Chaque modèle est interrogé sans routage (ni repli ni requête doublée) pour que réponses,
+    latences et coûts lui soient attribuables; le coût n'est pas estimé en mode analyse locale.
+    """
+    filename = filename or f"model_comparison_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    model_executor = ThreadPoolExecutor(max_workers=max(1, (analyze_workers or Config.PIPELINE_ANALYZE_WORKERS) * len(models)))
+    
+    def fetch(call_id):
+        deadline = Deadline(deadline_s)
+        raw_data = get_system(models[0], routing=False).rounded_api.get_call(call_id, timeout=deadline.timeout(Config.HTTP_TIMEOUT_SECONDS))
+        if not raw_data:
+            raise LookupError("Impossible de récupérer l'appel depuis l'API Call Rounded")
+        return [(call_id, raw_data, deadline.remaining())]
+    
+    def transform(item):
+        call_id, raw_data, budget = item
+        return [(call_id, get_system(models[0], routing=False).build_request(raw_data), budget)]
+    
+    def run_model(model, request, budget):
+        start = time.monotonic()
+        with measure_usage() as meter:
+            try:
+                result = get_system(model, routing=False).analyze_call(request, deadline=Deadline(budget))
+                record = build_result_record(request.call_id, model, result)
+            except Exception as e:
+                record = build_error_record(request.call_id, model, f"Exception: {str(e)}")
+        return {"record": record, "latency_s": time.monotonic() - start, "llm_requests": meter.requests, "cost_usd": meter.cost(model)}
+    
+    def analyze(item):
+        call_id, request, budget = item
+        futures = {model: model_executor.submit(run_model, model, request, budget) for model in models}
+        return [(call_id, {model: future.result() for model, future in futures.items()})]
+    
+    pipeline = Pipeline([
+        Stage("fetch", fetch, fetch_workers or Config.PIPELINE_FETCH_WORKERS),
+        Stage("transform", transform, transform_workers or Config.PIPELINE_TRANSFORM_WORKERS),
+        Stage("analyze", analyze, analyze_workers or Config.PIPELINE_ANALYZE_WORKERS)
+    ], queue_size=Config.PIPELINE_QUEUE_SIZE)
+    
+    rows = []
+    summary = {model: {"latencies": [], "cost": 0.0, "errors": 0} for model in models}
+    try:
+        for outcome in pipeline.run(call_ids):
+            if outcome.error is not None:
+                with print_lock:
+                    print(f"❌ {outcome.item}: {outcome.error}")
+                error = {"latency_s": 0.0, "llm_requests": 0, "cost_usd": None}
+                outcomes = {model: dict(error, record=build_error_record(outcome.item, model, f"Exception: {str(outcome.error)}")) for model in models}
+                rows.append(build_comparison_row(outcome.item, outcomes))
+                continue
+            call_id, outcomes = outcome.value
+            rows.append(build_comparison_row(call_id, outcomes))
+            for model, result in outcomes.items():
+                summary[model]["latencies"].append(result["latency_s"])
+                summary[model]["cost"] += result["cost_usd"] or 0.0
+                summary[model]["errors"] += bool(result["record"].get("error"))
             with print_lock:
-                print(f"{task_info}❌ Échec de l'analyse pour {call_id} avec {model}")
-            return {
-                "call_id": call_id,
-                "model_used": model,
-                "call_reason": "ERROR",
-                "user_sentiment": "ERROR",
-                "failure_reasons": "ERROR",
-                "failure_description": "Erreur lors de l'analyse",
-                "user_questions": "ERROR",
-                "call_tags": "ERROR"
-            }
-        
-        # Extrait les statistiques
-        stats = result.statistics
-        
-        # Prépare les données pour le CSV
-        data = {
-            "call_id": call_id,
-            "model_used": model,
-            "call_reason": stats.call_reason if stats.call_reason else "",
-            "user_sentiment": stats.user_sentiment if stats.user_sentiment else "",
-            "failure_reasons": format_list_field(stats.failure_reasons),
-            "failure_description": stats.failure_description if stats.failure_description else "",
-            "user_questions": stats.user_questions if stats.user_questions else "",
-            "call_tags": format_list_field(stats.call_tags)
-        }
+                print(f"📝 [{len(rows)}/{len(call_ids)}] {call_id}: " + ", ".join(
+                    f"{model} {result['latency_s']:.1f}s" for model, result in outcomes.items()
+                ))
+    finally:
+        model_executor.shutdown(wait=False)
+    
+    rows.sort(key=lambda row: row["call_id"])
+    with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=comparison_fieldnames(models), delimiter=',')
+        writer.writeheader()
+        writer.writerows(rows)
+    
+    print(f"\n{'='*70}")
+    print(f"✅ Comparaison générée: {filename} ({len(rows)} appels récupérés une seule fois)")
+    for model, stats in summary.items():
+        latencies = sorted(stats["latencies"])
+        if latencies:
+            p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+            print(f"   {model:<20} latence moyenne {sum(latencies) / len(latencies):.2f}s, p95 {p95:.2f}s, "
+                  f"coût estimé ${stats['cost']:.4f}, erreurs {stats['errors']}")
+    print(f"{'='*70}")
+    return filename
+
+
+def analyze_packed(tasks: list, max_workers: int, deadline_s: float = None) -> list:
+    """Analyse les tâches en regroupant les appels courts d'un même modèle (mode --pack).
+    
+    Chaque appel est récupéré une seule fois (même s'il est analysé avec plusieurs modèles);
+    les appels longs (ou restés seuls) suivent l'analyse classique. L'échéance deadline_s d'un
+    appel démarre avant sa récupération; un groupe suit l'échéance la plus proche de ses appels.
+    """
+    results = []
+    by_call = {}
+    for call_id, model, _ in tasks:
+        models = by_call.setdefault(call_id, [])
+        if model not in models:
+            models.append(model)
+    if not by_call:
+        return results
+    models = list(dict.fromkeys(model for call_models in by_call.values() for model in call_models))
+    total = sum(len(call_models) for call_models in by_call.values())
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        fetcher = get_system(models[0])
+        deadlines = {call_id: Deadline(deadline_s) for call_id in by_call}
+        requests_by_id = dict(zip(by_call, executor.map(lambda call_id: _fetch_request(fetcher, call_id, deadlines[call_id]), by_call)))
+        for call_id, request in requests_by_id.items():
+            if request is None:
+                results.extend(build_error_record(call_id, model, "Impossible de récupérer l'appel") for model in by_call[call_id])
         
-        with print_lock:
-            print(f"{task_info}✅ Analyse réussie: {call_id} avec {model}")
-        return data
+        # Les requêtes récupérées sont réparties entre les modèles qui les analysent
+        futures = {}
+        for model in models:
+            system = get_system(model)
+            fetched = [request for call_id, request in requests_by_id.items() if request is not None and model in by_call[call_id]]
+            packs, singles = pack_requests(system.detailed_analyzer, fetched)
+            print(f"📦 {model}: {sum(len(p) for p in packs)} appels courts en {len(packs)} groupes, {len(singles)} analysés seuls")
+            for pack in packs:
+                deadline = min((deadlines[request.call_id] for request in pack), key=_expiry)
+                futures[executor.submit(system.analyze_calls_packed, pack, deadline=deadline)] = (model, pack)
+            futures.update({executor.submit(system.analyze_call, request, None, deadlines[request.call_id]): (model, [request]) for request in singles})
         
+        for future in as_completed(futures):
+            model, requests = futures[future]
+            try:
+                outcome = future.result()
+            except Exception as e:
+                for request in requests:
+                    with print_lock:
+                        print(f"❌ Erreur pour {request.call_id} avec {model}: {e}")
+                    results.append(build_error_record(request.call_id, model, f"Exception: {str(e)}"))
+                continue
+            analyses = outcome if isinstance(outcome, dict) else {requests[0].call_id: outcome}
+            for call_id, analysis in analyses.items():
+                results.append(build_result_record(call_id, model, analysis))
+            with print_lock:
+                print(f"📝 {len(results)}/{total} résultats ({model})")
+    return results
+
+
+def _expiry(deadline: Deadline) -> float:
+    return deadline.expires_at if deadline.expires_at is not None else float("inf")
+
+
+def _fetch_request(system: PostCallMonitoringSystem, call_id: str, deadline: Deadline):
+    try:
+        return system.fetch_request(call_id, timeout=deadline.timeout(Config.HTTP_TIMEOUT_SECONDS))
     except Exception as e:
         with print_lock:
-            print(f"{task_info}❌ Erreur pour {call_id} avec {model}: {e}")
-        return {
-            "call_id": call_id,
-            "model_used": model,
-            "call_reason": "ERROR",
-            "user_sentiment": "ERROR",
-            "failure_reasons": "ERROR",
-            "failure_description": f"Exception: {str(e)}",
-            "user_questions": "ERROR",
-            "call_tags": "ERROR"
-        }
+            print(f"❌ Récupération impossible pour {call_id}: {e}")
+        return None
 
 
-def generate_csv(max_workers: int = None):
-    """Génère le fichier CSV avec toutes les analyses en parallèle."""
+def write_results(results: list, filename: str, columnar_dir: str = None) -> tuple:
+    """Écrit les enregistrements dédupliqués dans le CSV et, si demandé, dans le dataset colonnaire.
+    
+    Retourne (enregistrements uniques, nombre de doublons ignorés).
+    """
+    # Trie les résultats par call_id puis par model pour un ordre cohérent
+    results_sorted = sorted(results, key=lambda x: (x["call_id"], x["model_used"]))
+    
+    # Vérification finale des doublons avant écriture
+    final_seen = set()
+    unique_results = []
+    duplicates_count = 0
+    
+    for data in results_sorted:
+        result_key = (data["call_id"], data["model_used"])
+        if result_key not in final_seen:
+            final_seen.add(result_key)
+            unique_results.append(data)
+        else:
+            duplicates_count += 1
+            print(f"⚠️  Doublon final détecté et ignoré: {data['call_id']} - {data['model_used']}")
+    
+    with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=CSV_FIELDNAMES, delimiter=',')
+        writer.writeheader()
+        for data in unique_results:
+            writer.writerow(record_to_csv_row(data))
+    
+    if columnar_dir:
+        # Import local: pyarrow n'est requis que pour la sortie colonnaire
+        from results_store import ColumnarResultsStore
+        written = ColumnarResultsStore(columnar_dir).write(unique_results)
+        print(f"🗂️  {written} résultats ajoutés au dataset colonnaire: {columnar_dir}")
+    
+    return unique_results, duplicates_count
+
+
+def generate_csv(max_workers: int = None, columnar_dir: str = None, db_path: str = None, skip_existing: bool = False,
+                 deadline_s: float = None, pack: bool = False, fetch_workers: int = None, transform_workers: int = None,
+                 compare: bool = False, shard_index: int = None, num_shards: int = None, run_id: str = None,
+                 prioritize: bool = None):
+    """Génère le fichier CSV avec toutes les analyses en parallèle.
+    
+    Args:
+        max_workers: Nombre d'analyses LLM simultanées
+        columnar_dir: Répertoire du dataset Parquet partitionné (optionnel)
+        db_path: Base SQLite où chaque analyse est enregistrée (optionnel)
+        skip_existing: Réutilise les analyses déjà présentes en base avec la même configuration
+        deadline_s: Durée maximale par appel (au-delà, résultat partiel)
+        pack: Regroupe les appels courts dans des requêtes LLM communes (voir call_packing)
+        fetch_workers: Récupérations simultanées (défaut: Config.PIPELINE_FETCH_WORKERS)
+        transform_workers: Transformations simultanées (défaut: Config.PIPELINE_TRANSFORM_WORKERS)
+        compare: Mode comparaison des modèles (une ligne par appel, modèles côte à côte, voir compare_models)
+        shard_index: Shard à traiter (avec num_shards); écrit un fichier partiel à fusionner avec merge_parts
+        num_shards: Nombre total de shards
+        run_id: Préfixe des fichiers de sortie (défaut: analysis_results_<timestamp>)
+        prioritize: Analyse d'abord les appels suspects d'échec (défaut: Config.PRIORITY_SCHEDULING)
+    """
+    global _results_db
+    if db_path:
+        _results_db = ResultsDatabase(db_path)
+        attach_detector(_results_db)
+    
+    if compare:
+        print(f"⚖️  Comparaison de {len(MODELS)} modèles sur {len(CALL_IDS)} appels")
+        return compare_models(
+            list(dict.fromkeys(CALL_IDS)), list(dict.fromkeys(MODELS)),
+            fetch_workers, transform_workers, max_workers, deadline_s
+        )
+    
+    # Dédupliquer les call_ids et modèles
+    unique_call_ids = list(dict.fromkeys(CALL_IDS))  # Préserve l'ordre
+    unique_models = list(dict.fromkeys(MODELS))  # Préserve l'ordre
+    sharded = num_shards is not None
+    if sharded:
+        unique_call_ids = select_shard(unique_call_ids, shard_index, num_shards)
+    
     print("🚀 Génération du CSV d'analyse (mode parallèle)")
-    print(f"📞 Call IDs: {len(CALL_IDS)}")
+    if sharded:
+        print(f"🧩 Shard {shard_index + 1}/{num_shards}")
+    print(f"📞 Call IDs: {len(unique_call_ids)}")
     print(f"🤖 Modèles: {len(MODELS)}")
-    total_tasks = len(CALL_IDS) * len(MODELS)
+    total_tasks = len(unique_call_ids) * len(MODELS)
     print(f"📊 Total d'analyses: {total_tasks}")
     
     # Détermine le nombre de workers (par défaut: nombre de modèles × nombre de call_ids, max 20)
     if max_workers is None:
-        max_workers = min(total_tasks, 20)
-    print(f"🔄 Workers parallèles: {max_workers}\n")
+        max_workers = max(1, min(total_tasks, 20))
+    print(f"🔄 Workers: {fetch_workers or Config.PIPELINE_FETCH_WORKERS} récupération, "
+          f"{transform_workers or Config.PIPELINE_TRANSFORM_WORKERS} transformation, {max_workers} analyse\n")
     
     # Crée le nom du fichier avec timestamp
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"analysis_results_{timestamp}.csv"
-    
-    # Colonnes du CSV
-    fieldnames = [
-        "call_id",
-        "model_used",
-        "call_reason",
-        "user_sentiment",
-        "failure_reasons",
-        "failure_description",
-        "user_questions",
-        "call_tags"
-    ]
+    run_id = run_id or f"analysis_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    filename = part_filename(run_id, shard_index, num_shards) if sharded else f"{run_id}.csv"
     
     # Crée toutes les combinaisons call_id × model (avec déduplication)
     tasks_dict = {}  # Utilise un dict pour dédupliquer automatiquement
     task_num = 0
     
-    # Dédupliquer les call_ids et modèles
-    unique_call_ids = list(dict.fromkeys(CALL_IDS))  # Préserve l'ordre
-    unique_models = list(dict.fromkeys(MODELS))  # Préserve l'ordre
-    
     for call_id in unique_call_ids:
         for model in unique_models:
             task_key = (call_id, model)
@@ -175,79 +436,55 @@ def generate_csv(max_workers: int = None):
         print(f"⚠️  Déduplication détectée: {total_tasks} combinaisons → {actual_total} uniques")
         total_tasks = actual_total
     
+    # Réutilise les analyses déjà en base (même configuration) au lieu de les relancer
+    results = []
+    seen_keys = set()  # Pour détecter les doublons dans les résultats
+    if skip_existing and _results_db is not None:
+        config_hash = Config.get_config_hash()
+        remaining = []
+        for call_id, model, num in tasks:
+            if _results_db.has_result(call_id, model, config_hash):
+                results.append(_results_db.get_record(call_id, model))
+                seen_keys.add((call_id, model))
+            else:
+                remaining.append((call_id, model, num))
+        if len(remaining) != len(tasks):
+            print(f"⏭️  {len(tasks) - len(remaining)} analyses déjà en base, ignorées")
+        tasks = remaining
+        actual_total = total_tasks = len(tasks)
+    
     # Afficher les combinaisons qui seront traitées
     print(f"\n📋 Combinaisons à traiter ({actual_total}):")
     for call_id, model, num in tasks:
         print(f"   {num}. {call_id[:8]}... × {model}")
     print()
     
-    # Traitement en parallèle
-    results = []
-    seen_keys = set()  # Pour détecter les doublons dans les résultats
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Soumet toutes les tâches (garanties uniques)
-        future_to_task = {
-            executor.submit(analyze_and_extract, call_id, model, task_num, total_tasks): (call_id, model)
-            for call_id, model, task_num in tasks
-        }
-        
-        # Traite les résultats au fur et à mesure
-        completed = 0
-        for future in as_completed(future_to_task):
-            completed += 1
-            call_id, model = future_to_task[future]
-            try:
-                data = future.result()
-                
-                # Vérifier les doublons
-                result_key = (data["call_id"], data["model_used"])
-                if result_key in seen_keys:
-                    with print_lock:
-                        print(f"⚠️  [{completed}/{total_tasks}] DOUBLON DÉTECTÉ: {call_id} - {model} (ignoré)")
-                else:
-                    seen_keys.add(result_key)
-                    results.append(data)
-                    with print_lock:
-                        print(f"📝 [{completed}/{total_tasks}] Résultat reçu: {call_id} - {model}")
-            except Exception as e:
-                with print_lock:
-                    print(f"❌ [{completed}/{total_tasks}] Exception pour {call_id} - {model}: {e}")
-                results.append({
-                    "call_id": call_id,
-                    "model_used": model,
-                    "call_reason": "ERROR",
-                    "user_sentiment": "ERROR",
-                    "failure_reasons": "ERROR",
-                    "failure_description": f"Exception: {str(e)}",
-                    "user_questions": "ERROR",
-                    "call_tags": "ERROR"
-                })
-    
-    # Écrit tous les résultats dans le CSV
-    with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames, delimiter=',')
-        writer.writeheader()
-        
-        # Trie les résultats par call_id puis par model pour un ordre cohérent
-        results_sorted = sorted(results, key=lambda x: (x["call_id"], x["model_used"]))
-        
-        # Vérification finale des doublons avant écriture
-        final_seen = set()
-        unique_results = []
-        duplicates_count = 0
-        
-        for data in results_sorted:
-            result_key = (data["call_id"], data["model_used"])
-            if result_key not in final_seen:
-                final_seen.add(result_key)
-                unique_results.append(data)
-            else:
-                duplicates_count += 1
-                print(f"⚠️  Doublon final détecté et ignoré: {data['call_id']} - {data['model_used']}")
-        
-        for data in unique_results:
-            writer.writerow(data)
-        
+    if pack:
+        results.extend(analyze_packed(tasks, max_workers, deadline_s))
+        tasks = []
+    
+    # Pipeline récupération → transformation → analyse (les appels déjà traités en mode --pack sont exclus)
+    for data in analyze_pipelined(tasks, fetch_workers, transform_workers, max_workers, deadline_s, prioritize):
+        result_key = (data["call_id"], data["model_used"])
+        if result_key in seen_keys:
+            print(f"⚠️  DOUBLON DÉTECTÉ: {data['call_id']} - {data['model_used']} (ignoré)")
+            continue
+        seen_keys.add(result_key)
+        results.append(data)
+    
+    if sharded:
+        # Fichier partiel du shard: le CSV final et le dataset colonnaire sont produits par merge_parts
+        unique_results, duplicates_count = merge_records(results)
+        write_part(unique_results, filename)
+        print(f"\n{'='*70}")
+        print(f"✅ Fichier partiel généré: {filename}")
+        print(f"📊 {len(unique_results)} résultats uniques écrits")
+        print(f"{'='*70}")
+        return filename
+    
+    # Écrit tous les résultats dans le CSV (et le dataset colonnaire si demandé)
+    unique_results, duplicates_count = write_results(results, filename, columnar_dir)
+    
     print(f"\n{'='*70}")
     print(f"✅ CSV généré avec succès: {filename}")
     print(f"📊 {len(unique_results)} résultats uniques écrits")
@@ -257,6 +494,53 @@ def generate_csv(max_workers: int = None):
     return filename
 
 
+def merge_parts(paths: list, filename: str, columnar_dir: str = None) -> str:
+    """Fusionne les fichiers partiels des shards en CSV final (et dataset colonnaire si demandé).
+    
+    Un même (call_id, model_used) présent dans plusieurs fichiers (shard relancé, partitions
+    différentes) n'est gardé qu'une fois: résultat réussi de préférence, puis le plus récent.
+    """
+    if not paths:
+        raise ValueError("Aucun fichier partiel à fusionner")
+    records = []
+    for path in paths:
+        part = read_part(path)
+        print(f"🧩 {path}: {len(part)} résultats")
+        records.extend(part)
+    
+    unique_results, duplicates_count = merge_records(records)
+    write_results(unique_results, filename, columnar_dir)
+    
+    print(f"\n{'='*70}")
+    print(f"✅ CSV fusionné: {filename} ({len(paths)} fichiers partiels)")
+    print(f"📊 {len(unique_results)} résultats uniques écrits")
+    if duplicates_count > 0:
+        print(f"⚠️  {duplicates_count} doublons fusionnés")
+    print(f"{'='*70}")
+    return filename
+
+
+def run_local_shards(num_shards: int, shard_args: list, columnar_dir: str = None) -> str:
+    """Lance un process par shard sur cette machine puis fusionne leurs fichiers partiels.
+    
+    Args:
+        shard_args: Options transmises à chaque process (ex: ["--workers", "10"])
+    """
+    run_id = f"analysis_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    processes = []
+    for index in range(num_shards):
+        command = [sys.executable, __file__, "--num-shards", str(num_shards), "--shard-index", str(index),
+                   "--run-id", run_id] + shard_args
+        processes.append(subprocess.Popen(command))
+    print(f"🧩 {num_shards} process lancés (exécution {run_id})")
+    
+    failed = [index for index, process in enumerate(processes) if process.wait() != 0]
+    if failed:
+        raise RuntimeError(f"Shards en échec: {', '.join(str(index) for index in failed)}")
+    return merge_parts([part_filename(run_id, index, num_shards) for index in range(num_shards)],
+                       f"{run_id}.csv", columnar_dir)
+
+
 if __name__ == "__main__":
     import argparse
     
@@ -265,13 +549,152 @@ if __name__ == "__main__":
         "--workers",
         type=int,
         default=None,
-        help="Nombre de workers parallèles (défaut: min(total_tasks, 20))"
+        help="Nombre d'analyses LLM simultanées (défaut: min(total_tasks, 20))"
+    )
+    parser.add_argument(
+        "--fetch-workers",
+        type=int,
+        default=None,
+        help="Récupérations d'appels simultanées (défaut: PIPELINE_FETCH_WORKERS)"
+    )
+    parser.add_argument(
+        "--transform-workers",
+        type=int,
+        default=None,
+        help="Transformations simultanées (défaut: PIPELINE_TRANSFORM_WORKERS)"
+    )
+    parser.add_argument(
+        "--columnar",
+        metavar="DIR",
+        default=None,
+        help="Ajoute aussi les résultats au dataset Parquet partitionné par date et modèle"
+    )
+    
+    parser.add_argument(
+        "--db",
+        metavar="PATH",
+        default=Config.RESULTS_DB_PATH,
+        help="Base SQLite où enregistrer chaque analyse (défaut: RESULTS_DB_PATH)"
+    )
+    parser.add_argument(
+        "--skip-existing",
+        action="store_true",
+        help="Ne relance pas les analyses déjà présentes en base avec la même configuration"
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        metavar="SECONDES",
+        default=Config.CALL_DEADLINE_SECONDS,
+        help="Durée maximale par appel; au-delà l'analyse est partielle (défaut: CALL_DEADLINE_SECONDS)"
+    )
+    parser.add_argument(
+        "--pack",
+        action="store_true",
+        help="Regroupe les appels courts dans des requêtes LLM communes (PACK_TOKEN_BUDGET, PACK_MAX_CALLS)"
+    )
+    parser.add_argument(
+        "--compare",
+        action="store_true",
+        help="Compare les modèles: chaque appel est récupéré une fois et analysé par tous les modèles (latence et coût par modèle)"
+    )
+    
+    parser.add_argument(
+        "--no-priority",
+        action="store_true",
+        help="Analyse dans l'ordre de CALL_IDS au lieu de traiter d'abord les appels suspects d'échec"
+    )
+    parser.add_argument(
+        "--num-shards",
+        type=int,
+        default=None,
+        help="Nombre total de shards (avec --shard-index): les appels sont répartis par hash stable du call_id"
+    )
+    parser.add_argument(
+        "--shard-index",
+        type=int,
+        default=None,
+        help="Shard traité par ce process (0..N-1); écrit un fichier partiel <run-id>.part-I-of-N.jsonl"
+    )
+    parser.add_argument(
+        "--run-id",
+        default=None,
+        help="Préfixe commun des fichiers partiels d'une exécution (à fixer sur chaque machine)"
+    )
+    parser.add_argument(
+        "--local-shards",
+        type=int,
+        metavar="N",
+        default=None,
+        help="Lance N process (un par shard) sur cette machine puis fusionne les résultats"
+    )
+    parser.add_argument(
+        "--merge",
+        nargs="+",
+        metavar="PART",
+        default=None,
+        help="Fusionne des fichiers partiels, ou tous ceux d'un run-id, en CSV final (et dataset colonnaire avec --columnar)"
+    )
+    parser.add_argument(
+        "--output",
+        metavar="CSV",
+        default=None,
+        help="CSV produit par --merge (défaut: analysis_results_<timestamp>.csv)"
     )
     
     args = parser.parse_args()
+    if args.skip_existing and not args.db:
+        parser.error("--skip-existing nécessite --db ou RESULTS_DB_PATH")
+    if args.compare and (args.pack or args.skip_existing or args.columnar):
+        parser.error("--compare ne se combine pas avec --pack, --skip-existing ni --columnar")
+    if (args.num_shards is None) != (args.shard_index is None):
+        parser.error("--num-shards et --shard-index s'utilisent ensemble")
+    if args.num_shards is not None and not 0 <= args.shard_index < args.num_shards:
+        parser.error("--shard-index doit être compris entre 0 et --num-shards - 1")
+    if (args.num_shards is not None or args.local_shards) and args.compare:
+        parser.error("--compare ne se combine pas avec l'exécution par shards")
+    if args.num_shards is not None and args.columnar:
+        parser.error("--columnar s'applique à la fusion (--merge), pas à un shard")
     
     try:
-        filename = generate_csv(max_workers=args.workers)
+        if args.merge:
+            output = args.output or f"analysis_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+            filename = merge_parts(resolve_parts(args.merge), output, args.columnar)
+            print(f"\n📁 Fichier créé: {filename}")
+            sys.exit(0)
+        
+        if args.local_shards:
+            # Options reprises par chaque process de shard (la sortie colonnaire est écrite à la fusion)
+            shard_args = []
+            for flag, value in (("--deadline", args.deadline), ("--workers", args.workers), ("--fetch-workers", args.fetch_workers),
+                                ("--transform-workers", args.transform_workers), ("--db", args.db)):
+                if value:
+                    shard_args += [flag, str(value)]
+            if args.skip_existing:
+                shard_args.append("--skip-existing")
+            if args.pack:
+                shard_args.append("--pack")
+            if args.no_priority:
+                shard_args.append("--no-priority")
+            filename = run_local_shards(args.local_shards, shard_args, args.columnar)
+            print(f"\n📁 Fichier créé: {filename}")
+            sys.exit(0)
+        
+        filename = generate_csv(
+            max_workers=args.workers,
+            columnar_dir=args.columnar,
+            db_path=args.db,
+            skip_existing=args.skip_existing,
+            deadline_s=args.deadline,
+            pack=args.pack,
+            fetch_workers=args.fetch_workers,
+            transform_workers=args.transform_workers,
+            compare=args.compare,
+            shard_index=args.shard_index,
+            num_shards=args.num_shards,
+            run_id=args.run_id,
+            prioritize=False if args.no_priority else None
+        )
         print(f"\n📁 Fichier créé: {filename}")
         sys.exit(0)
     except KeyboardInterrupt:
@@ -1,9 +1,29 @@
 """Clients LLM pour les différents providers."""
 import os
 from typing import Dict, Any, List, Optional
-import requests
-from openai import OpenAI
-from anthropic import Anthropic
+import hashlib
+import json
+from client_registry import get_registry
+from config import Config
+from gemini_transport import build_body, encode_prompt
+from single_flight import SingleFlight
+
+# Requêtes LLM en cours, partagées entre toutes les instances de LLMClient
+_in_flight_prompts = SingleFlight()
+
+# Consigne envoyée après une réponse tronquée (kwarg continue_from): le modèle complète sa réponse
+CONTINUE_INSTRUCTION = "Ta réponse précédente a été tronquée. Continue-la EXACTEMENT là où elle s'est arrêtée, sans rien répéter ni ajouter avant."
+
+
+def has_api_key(model_name: str) -> bool:
+    """Indique si la clé API du provider de ce modèle est configurée."""
+    if model_name.startswith("gpt"):
+        return bool(os.getenv("OPENAI_API_KEY"))
+    if model_name.startswith("claude"):
+        return bool(os.getenv("ANTHROPIC_API_KEY"))
+    if model_name.startswith("gemini"):
+        return bool(os.getenv("GEMINI_API_KEY"))
+    return False
 
 
 class LLMClient:
@@ -24,22 +44,8 @@ class LLMClient:
                 if api_key:
                     # Nettoie la clé API des caractères d'escape potentiels
                     api_key = api_key.strip()
-                    # Temporairement retire les variables proxy pour éviter les erreurs
-                    old_proxies = {
-                        'http_proxy': os.environ.pop('HTTP_PROXY', None),
-                        'https_proxy': os.environ.pop('HTTPS_PROXY', None),
-                        'all_proxy': os.environ.pop('ALL_PROXY', None)
-                    }
-                    try:
-                        self.client = OpenAI(api_key=api_key)
-                    finally:
-                        # Restaure les variables d'environnement
-                        if old_proxies['http_proxy']:
-                            os.environ['HTTP_PROXY'] = old_proxies['http_proxy']
-                        if old_proxies['https_proxy']:
-                            os.environ['HTTPS_PROXY'] = old_proxies['https_proxy']
-                        if old_proxies['all_proxy']:
-                            os.environ['ALL_PROXY'] = old_proxies['all_proxy']
+                    # Client partagé par le registre (proxy explicite, pas de mutation de os.environ)
+                    self.client = get_registry().get_openai_client(api_key)
                 else:
                     print("ℹ️  OPENAI_API_KEY non configurée - utilisation du mode analyse locale.")
                     self.client = None
@@ -47,22 +53,7 @@ class LLMClient:
                 api_key = os.getenv("ANTHROPIC_API_KEY")
                 if api_key:
                     api_key = api_key.strip()
-                    # Temporairement retire les variables proxy pour éviter les erreurs
-                    old_proxies = {
-                        'http_proxy': os.environ.pop('HTTP_PROXY', None),
-                        'https_proxy': os.environ.pop('HTTPS_PROXY', None),
-                        'all_proxy': os.environ.pop('ALL_PROXY', None)
-                    }
-                    try:
-                        self.client = Anthropic(api_key=api_key)
-                    finally:
-                        # Restaure les variables d'environnement
-                        if old_proxies['http_proxy']:
-                            os.environ['HTTP_PROXY'] = old_proxies['http_proxy']
-                        if old_proxies['https_proxy']:
-                            os.environ['HTTPS_PROXY'] = old_proxies['https_proxy']
-                        if old_proxies['all_proxy']:
-                            os.environ['ALL_PROXY'] = old_proxies['all_proxy']
+                    self.client = get_registry().get_anthropic_client(api_key)
                 else:
                     print("⚠️  ANTHROPIC_API_KEY non configurée.")
                     self.client = None
@@ -72,6 +63,9 @@ class LLMClient:
                 api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GEMINI_API_KEY")
                 if api_key:
                     self.client = api_key.strip()
+                    # Connexion TLS ouverte dès le démarrage du worker, en arrière-plan
+                    if Config.GEMINI_WARM_UP:
+                        get_registry().get_gemini_transport().warm_up(self.client)
                 else:
                     print("⚠️  GEMINI_API_KEY ou GEMINI_API_KEY non configurée.")
                     self.client = None
@@ -90,6 +84,16 @@ class LLMClient:
         if self.client is None:
             return self._generate_mock(prompt, system_prompt, kwargs.get("context"))
         
+        # Une requête identique déjà en vol (même appel analysé en parallèle) est partagée;
+        # le timeout ne fait pas partie de la requête elle-même
+        params = {k: v for k, v in kwargs.items() if k != "timeout"}
+        key = hashlib.sha256(
+            json.dumps([self.model_name, system_prompt, prompt, params], sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+        return _in_flight_prompts.do(key, self._generate_with_provider, prompt, system_prompt, **kwargs)[0]
+    
+    def _generate_with_provider(self, prompt: str, system_prompt: str = "", **kwargs) -> str:
+        """Appelle l'API du provider correspondant au modèle."""
         try:
             # Modèles OpenAI
             if self.model_name in ["gpt-4o", "gpt-4.1", "gpt-4.1-mini", "gpt-5", "gpt-5-mini"]:
@@ -218,12 +222,25 @@ class LLMClient:
             
         return False
     
+    def _client_for(self, kwargs: dict):
+        """Client SDK (OpenAI/Anthropic) avec le timeout de la requête.
+        
+        Sous échéance (timeout explicite), pas de nouvelle tentative automatique du SDK:
+        chaque tentative consommerait à nouveau tout le budget restant.
+        """
+        if "timeout" in kwargs:
+            return self.client.with_options(timeout=kwargs["timeout"], max_retries=0)
+        return self.client.with_options(timeout=Config.LLM_TIMEOUT_SECONDS)
+    
     def _generate_openai(self, prompt: str, system_prompt: str, **kwargs) -> str:
         """Génère avec OpenAI."""
         messages = []
         if system_prompt:
             messages.append({"role": "system", "content": system_prompt})
         messages.append({"role": "user", "content": prompt})
+        if kwargs.get("continue_from") is not None:
+            messages.append({"role": "assistant", "content": kwargs["continue_from"]})
+            messages.append({"role": "user", "content": CONTINUE_INSTRUCTION})
         
         # Les modèles gpt-5 et gpt-5-mini utilisent reasoning_effort et verbosity
         # Pour les autres modèles, on utilise temperature
@@ -238,18 +255,26 @@ class LLMClient:
             request_params["verbosity"] = kwargs.get("verbosity", "low")
         else:
             request_params["temperature"] = kwargs.get("temperature", 0.3)
+            # Budget de sortie (non appliqué aux modèles de raisonnement, dont les tokens
+            # de réflexion sont décomptés du même budget)
+            if "max_tokens" in kwargs:
+                request_params["max_tokens"] = kwargs["max_tokens"]
         
-        response = self.client.chat.completions.create(**request_params)
+        response = self._client_for(kwargs).chat.completions.create(**request_params)
         return response.choices[0].message.content
     
     def _generate_anthropic(self, prompt: str, system_prompt: str, **kwargs) -> str:
         """Génère avec Anthropic Claude."""
-        response = self.client.messages.create(
+        messages = [{"role": "user", "content": prompt}]
+        if kwargs.get("continue_from") is not None:
+            # Préremplissage: le modèle poursuit directement la réponse tronquée
+            messages.append({"role": "assistant", "content": kwargs["continue_from"].rstrip()})
+        response = self._client_for(kwargs).messages.create(
             model="claude-3-5-sonnet-20241022",
             max_tokens=kwargs.get("max_tokens", 4096),
             temperature=kwargs.get("temperature", 0.3),
             system=system_prompt,
-            messages=[{"role": "user", "content": prompt}]
+            messages=messages
         )
         return response.content[0].text
     
@@ -262,7 +287,6 @@ class LLMClient:
         # Construction du prompt complet
         full_prompt = f"{system_prompt}\n\n{prompt}" if system_prompt else prompt
         
-        # URL de l'API Gemini REST
         # Mapper les noms de modèles aux modèles API disponibles
         model_map = {
             "gemini-1.5-flash": "gemini-1.5-flash",
@@ -270,58 +294,23 @@ class LLMClient:
             "gemini-2.5-flash": "gemini-2.5-flash",
         }
         api_model = model_map.get(self.model_name, "gemini-1.5-flash")
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/{api_model}:generateContent"
-        
-        # Headers
-        headers = {
-            "Content-Type": "application/json",
-            "x-goog-api-key": api_key
-        }
         
         # Configuration de génération
-        # Pour Gemini, augmenter la limite minimale si elle est trop faible
-        # Les modèles récents comme gemini-2.5-flash peuvent générer des réponses plus longues
+        # Les tokens de réflexion de gemini-2.5 sont décomptés de maxOutputTokens: limite minimale
+        # pour ces modèles uniquement (les autres respectent le budget demandé)
         max_tokens_requested = kwargs.get("max_tokens", 8192)
-        max_tokens_gemini = max(max_tokens_requested, 2048) if max_tokens_requested < 2048 else max_tokens_requested
+        max_tokens_gemini = max(max_tokens_requested, 2048) if api_model.startswith("gemini-2.5") else max_tokens_requested
+        temperature = kwargs.get("temperature", 0.3)
+        timeout = kwargs.get("timeout", Config.LLM_TIMEOUT_SECONDS)
         
-        payload = {
-                "contents": [{
-                    "parts": [{"text": full_prompt}]
-                }],
-                "generationConfig": {
-                    "temperature": kwargs.get("temperature", 0.3),
-                    "maxOutputTokens": max_tokens_gemini
-                },
-                "safetySettings": [
-                    {
-                        "category": "HARM_CATEGORY_HARASSMENT",
-                        "threshold": "BLOCK_NONE"
-                    },
-                    {
-                        "category": "HARM_CATEGORY_HATE_SPEECH",
-                        "threshold": "BLOCK_NONE"
-                    },
-                    {
-                        "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                        "threshold": "BLOCK_NONE"
-                    },
-                    {
-                        "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                        "threshold": "BLOCK_NONE"
-                    }
-                ]
-            }
+        # safetySettings pré-sérialisés par le transport
+        contents = encode_prompt(full_prompt, kwargs.get("continue_from"), CONTINUE_INSTRUCTION)
         
-        # Appel API REST
-        try:
-            response = requests.post(url, json=payload, headers=headers, timeout=60)
-            response.raise_for_status()
-        except requests.exceptions.RequestException as e:
-            raise RuntimeError(f"Erreur lors de l'appel API Gemini: {e}")
+        # Appel API REST (connexion persistante partagée, HTTP/2 si disponible)
+        transport = get_registry().get_gemini_transport()
+        data = transport.generate_content(api_model, api_key, build_body(contents, temperature, max_tokens_gemini), timeout)
         
         # Extraction de la réponse
-        data = response.json()
-        
         if "candidates" not in data or not data["candidates"]:
             # Afficher plus d'informations pour le débogage
             error_msg = f"La réponse de Gemini est vide. Réponse complète: {data}"
@@ -347,28 +336,14 @@ class LLMClient:
         
         # Vérifier si parts existe (peut être absent si bloqué ou si réponse vide)
         if "parts" not in content or not content.get("parts"):
-            # Si finishReason est MAX_TOKENS et qu'il n'y a pas de parts, 
-            # cela peut signifier que la réponse était trop longue même avec la limite augmentée
-            # ou que le format de réponse est différent
-            error_details = f"Pas de 'parts' dans le content. FinishReason: {finish_reason}"
+            # Budget épuisé avant tout texte (ex: tokens de réflexion de gemini-2.5): réponse vide,
+            # generate_json la traite comme tronquée plutôt que de renvoyer tout le prompt ici
             if finish_reason == "MAX_TOKENS":
-                error_details += " (Limite de tokens atteinte - essayez d'augmenter max_tokens)"
+                return ""
+            error_details = f"Pas de 'parts' dans le content. FinishReason: {finish_reason}"
             if "safetyRatings" in candidate:
                 error_details += f", safetyRatings: {candidate['safetyRatings']}"
             error_details += f", content: {content}"
-            # Pour MAX_TOKENS, essayer une fois de plus avec une limite plus élevée
-            if finish_reason == "MAX_TOKENS" and max_tokens_gemini < 8192:
-                # Essayer avec une limite plus élevée
-                payload["generationConfig"]["maxOutputTokens"] = 8192
-                retry_response = requests.post(url, json=payload, headers=headers, timeout=60)
-                retry_response.raise_for_status()
-                retry_data = retry_response.json()
-                if "candidates" in retry_data and retry_data["candidates"]:
-                    retry_candidate = retry_data["candidates"][0]
-                    if "content" in retry_candidate and "parts" in retry_candidate["content"]:
-                        parts = retry_candidate["content"]["parts"]
-                        if parts and len(parts) > 0 and isinstance(parts[0], dict) and "text" in parts[0]:
-                            return parts[0]["text"].strip()
             raise ValueError(f"Pas de 'parts' dans le content - peut-être bloqué par safety filters ou erreur API ({error_details})")
         
         parts = content["parts"]
@@ -379,7 +354,7 @@ class LLMClient:
             raise ValueError("Format de 'parts[0]' inattendu - pas de 'text'")
         
         text = parts[0]["text"].strip()
-        if not text:
+        if not text and finish_reason != "MAX_TOKENS":
             raise ValueError("Texte vide dans la réponse Gemini")
         
         return text
@@ -0,0 +1,293 @@
+"""Routage des requêtes LLM entre providers: disjoncteurs, bascule et requêtes doublées (hedging)."""
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+import numpy as np
+from config import Config
+from llm_clients import LLMClient, has_api_key
+
+
+class CircuitBreaker:
+    """Disjoncteur par provider: ouvert après N échecs consécutifs, une requête d'essai après le délai."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            return "half_open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def allow(self) -> bool:
+        """Indique si une requête peut être envoyée (une seule requête d'essai en demi-ouverture)."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+    def release(self):
+        """Fin d'une requête sans verdict sur le provider (ex: échéance de l'appelant): libère l'essai en cours."""
+        with self._lock:
+            self._probing = False
+
+
+class LatencyTracker:
+    """Latences récentes d'un provider (fenêtre glissante) pour estimer le p95."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def p95(self) -> Optional[float]:
+        """p95 des latences récentes (None tant que l'échantillon est trop petit)."""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            return float(np.percentile(self._samples, 95))
+
+
+class BackendHealth:
+    """État de santé partagé d'un modèle (toutes instances confondues)."""
+
+    def __init__(self):
+        self.breaker = CircuitBreaker(Config.CIRCUIT_FAILURE_THRESHOLD, Config.CIRCUIT_RESET_SECONDS)
+        self.latency = LatencyTracker(Config.LATENCY_WINDOW)
+
+
+_health: Dict[str, BackendHealth] = {}
+_health_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_health(model_name: str) -> BackendHealth:
+    with _health_lock:
+        if model_name not in _health:
+            _health[model_name] = BackendHealth()
+        return _health[model_name]
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _health_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=Config.ROUTER_MAX_WORKERS, thread_name_prefix="llm-router")
+        return _executor
+
+
+class LLMRouter:
+    """Même interface que LLMClient.generate, routée entre le modèle principal et ses équivalents.
+
+    - Un provider dont le disjoncteur est ouvert est ignoré, sauf s'il est le seul backend.
+      Un timeout dû à l'échéance de l'appelant n'est pas compté comme un échec du provider.
+    - En cas d'erreur, la requête bascule immédiatement sur le modèle équivalent suivant.
+    - Si la réponse tarde au-delà du p95 récent du provider, une requête doublée part vers le
+      suivant et la première réponse reçue est retenue (l'autre est annulée si elle n'est pas
+      encore partie, ignorée sinon).
+    - Bascule et hedging sont désactivés par défaut (Config.MODEL_FALLBACKS, Config.HEDGE_ENABLED).
+      Sans hedging, la requête s'exécute dans le thread appelant; le pool partagé n'est utilisé
+      que lorsqu'une requête doublée est possible.
+    """
+
+    def __init__(self, model_name: str, fallbacks: Optional[List[str]] = None):
+        self.model_name = model_name
+        self.primary = LLMClient(model_name)
+        fallbacks = Config.MODEL_FALLBACKS.get(model_name, []) if fallbacks is None else fallbacks
+        self._clients = {model_name: self.primary}
+        for fallback in fallbacks:
+            # Seuls les modèles dont la clé API est configurée servent de repli
+            if fallback != model_name and has_api_key(fallback):
+                self._clients[fallback] = LLMClient(fallback)
+
+    def _backends(self) -> List[str]:
+        """Modèles configurés (clé API présente), dans l'ordre de préférence.
+
+        Vide si le modèle principal n'est pas configuré: mode analyse locale, sans bascule silencieuse.
+        """
+        if self.primary.client is None or self.primary.initialization_error:
+            return []
+        return [name for name, client in self._clients.items() if client.client is not None and not client.initialization_error]
+
+    @property
+    def routing_key(self) -> tuple:
+        """Configuration de routage (backends utilisables, hedging): identifie les analyses partageables."""
+        return tuple(self._backends()), Config.HEDGE_ENABLED
+
+    @property
+    def is_mock(self) -> bool:
+        """Vrai en mode analyse locale (aucun backend configuré): réponses simulées, sans coût."""
+        return not self._backends()
+
+    def _call(self, model_name: str, prompt: str, system_prompt: str, kwargs: dict, started: dict) -> str:
+        """Appel d'un backend avec mise à jour de sa santé (latence ou échec).
+
+        started["at"] reçoit l'instant où l'appel commence à s'exécuter (hors attente dans le pool).
+        """
+        health = get_health(model_name)
+        start = started["at"] = time.monotonic()
+        budget = kwargs.get("timeout")
+        try:
+            result = self._clients[model_name].generate(prompt, system_prompt, **kwargs)
+        except Exception:
+            # Timeout réduit par l'échéance de l'appelant et épuisé: ce n'est pas une panne du provider
+            if budget is not None and budget < Config.LLM_TIMEOUT_SECONDS and time.monotonic() - start >= 0.9 * budget:
+                health.breaker.release()
+            else:
+                health.breaker.record_failure()
+            raise
+        health.breaker.record_success()
+        health.latency.record(time.monotonic() - start)
+        return result
+
+    def _generate_sequential(self, backends: List[str], prompt: str, system_prompt: str, kwargs: dict,
+                             ends_at: Optional[float]) -> str:
+        """Essaie les backends l'un après l'autre, sans passer par le pool du routeur.
+
+        Le disjoncteur n'écarte un backend que s'il en reste d'autres: un modèle sans repli est
+        toujours interrogé.
+        """
+        errors = []
+        for name in backends:
+            if len(backends) > 1 and not get_health(name).breaker.allow():
+                errors.append(f"{name}: disjoncteur ouvert")
+                continue
+            call_kwargs = dict(kwargs)
+            if ends_at is not None:
+                remaining = ends_at - time.monotonic()
+                if remaining <= 0:
+                    raise RuntimeError(f"Délai dépassé pour {self.model_name} ({'; '.join(errors) or 'aucune réponse'})")
+                call_kwargs["timeout"] = max(remaining, 0.1)
+            if errors:
+                print(f"↪️  Bascule vers {name} après échec")
+            try:
+                result = self._call(name, prompt, system_prompt, call_kwargs, {"at": None})
+            except Exception as e:
+                errors.append(f"{name}: {e}")
+                continue
+            if name != self.model_name:
+                print(f"↪️  Réponse fournie par {name} (au lieu de {self.model_name})")
+            return result
+        raise RuntimeError(f"Aucun provider n'a pu répondre ({'; '.join(errors)})")
+
+    def generate(self, prompt: str, system_prompt: str = "", **kwargs) -> str:
+        """Génère une réponse avec le premier backend sain, avec bascule et hedging."""
+        backends = self._backends()
+        if not backends:
+            # Mode analyse locale (aucune clé API) ou client en erreur: comportement de LLMClient
+            return self.primary.generate(prompt, system_prompt, **kwargs)
+
+        # Un timeout explicite (échéance de l'analyse) borne l'ensemble, bascules et doublons compris
+        ends_at = time.monotonic() + kwargs["timeout"] if kwargs.get("timeout") else None
+        if len(backends) == 1 or not Config.HEDGE_ENABLED:
+            # Pas de requête doublée possible: appel (et bascule éventuelle) dans le thread appelant
+            return self._generate_sequential(backends, prompt, system_prompt, kwargs, ends_at)
+
+        queue = list(backends)
+        pending = {}
+        started = {}
+        errors = []
+
+        def launch() -> bool:
+            while queue:
+                name = queue.pop(0)
+                if get_health(name).breaker.allow():
+                    call_kwargs = dict(kwargs)
+                    if ends_at is not None:
+                        call_kwargs["timeout"] = max(ends_at - time.monotonic(), 0.1)
+                    started[name] = {"at": None}
+                    future = _get_executor().submit(self._call, name, prompt, system_prompt, call_kwargs, started[name])
+                    pending[future] = name
+                    return True
+                errors.append(f"{name}: disjoncteur ouvert")
+            return False
+
+        try:
+            launch()
+            hedged = False
+            while pending:
+                timeout = None
+                hedge_at = None
+                if Config.HEDGE_ENABLED and not hedged and queue:
+                    name = next(iter(pending.values()))
+                    p95 = get_health(name).latency.p95()
+                    if p95 is not None:
+                        delay = max(p95, Config.HEDGE_MIN_DELAY_SECONDS)
+                        # Le p95 mesure l'exécution seule: le délai court à partir du début de l'appel,
+                        # pas de sa soumission (attente dans le pool sous charge)
+                        if started[name]["at"] is not None:
+                            hedge_at = started[name]["at"] + delay
+                            timeout = max(hedge_at - time.monotonic(), 0)
+                        else:
+                            timeout = Config.HEDGE_MIN_DELAY_SECONDS
+                if ends_at is not None:
+                    remaining = ends_at - time.monotonic()
+                    if remaining <= 0:
+                        raise RuntimeError(f"Délai dépassé pour {self.model_name} ({'; '.join(errors) or 'aucune réponse'})")
+                    timeout = remaining if timeout is None else min(timeout, remaining)
+
+                done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    if hedge_at is None or time.monotonic() < hedge_at:
+                        continue
+                    hedged = True
+                    if launch():
+                        print(f"⏱️  {self.model_name}: réponse lente, requête doublée vers {list(pending.values())[-1]}")
+                    continue
+
+                for future in done:
+                    name = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        errors.append(f"{name}: {e}")
+                        continue
+                    if name != self.model_name:
+                        print(f"↪️  Réponse fournie par {name} (au lieu de {self.model_name})")
+                    return result
+
+                # Tous les envois en cours ont échoué: bascule sur le backend suivant
+                if not pending and launch():
+                    print(f"↪️  Bascule vers {list(pending.values())[-1]} après échec")
+        finally:
+            # Requête perdante: annulée si elle attend encore dans le pool (une requête déjà
+            # envoyée se termine seule, bornée par son timeout, et sa réponse est ignorée)
+            for future in pending:
+                future.cancel()
+
+        raise RuntimeError(f"Aucun provider n'a pu répondre ({'; '.join(errors)})")
+
+    def health(self) -> List[dict]:
+        """État des disjoncteurs et latences des backends de ce routeur."""
+        return [
+            {"model": name, "state": get_health(name).breaker.state, "p95": get_health(name).latency.p95()}
+            for name in self._clients
+        ]
@@ -0,0 +1,60 @@
+"""Mesure de l'usage LLM (requêtes, tokens estimés, coût) pendant une analyse."""
+import contextvars
+import functools
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+from config import Config
+from token_budgets import estimate_tokens
+
+# Compteur de l'analyse en cours (propagé aux threads d'extraction via in_context)
+_current_meter: contextvars.ContextVar = contextvars.ContextVar("llm_usage_meter", default=None)
+
+
+class UsageMeter:
+    """Totaux d'usage LLM d'une analyse (tokens estimés: les providers ne sont pas tous interrogés sur l'usage réel)."""
+
+    def __init__(self):
+        self.requests = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.mock_requests = 0
+        self._lock = threading.Lock()
+
+    def add(self, input_tokens: int, output_tokens: int, mock: bool = False):
+        with self._lock:
+            self.requests += 1
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+            self.mock_requests += int(mock)
+
+    def cost(self, model_name: str) -> Optional[float]:
+        """Coût estimé en USD d'après Config.MODEL_PRICING (None si le modèle n'y figure pas ou en mode analyse locale)."""
+        pricing = Config.MODEL_PRICING.get(model_name)
+        if pricing is None or self.mock_requests:
+            return None
+        input_price, output_price = pricing
+        return (self.input_tokens * input_price + self.output_tokens * output_price) / 1_000_000
+
+
+@contextmanager
+def measure_usage() -> Iterator[UsageMeter]:
+    """Compte les requêtes LLM faites dans ce bloc (et dans les threads lancés via in_context)."""
+    meter = UsageMeter()
+    token = _current_meter.set(meter)
+    try:
+        yield meter
+    finally:
+        _current_meter.reset(token)
+
+
+def record_usage(prompt: str, response: str, mock: bool = False):
+    """Ajoute une requête au compteur courant (sans effet hors de measure_usage); mock: réponse simulée."""
+    meter = _current_meter.get()
+    if meter is not None:
+        meter.add(estimate_tokens(prompt), estimate_tokens(response), mock)
+
+
+def in_context(fn: Callable) -> Callable:
+    """fn exécutée dans une copie du contexte courant: à appeler dans le thread qui soumet la tâche."""
+    return functools.partial(contextvars.copy_context().run, fn)
@@ -0,0 +1,182 @@
+"""Extraction map-reduce pour les transcripts très longs.
+
+Le transcript est découpé en fenêtres de tours consécutifs bornées en tokens; chaque attribut
+est extrait sur chaque fenêtre en parallèle (map), puis les réponses partielles sont fusionnées
+de façon déterministe (reduce): union pour les multiselect, vote pour les select et un court
+appel de synthèse pour les textes.
+
+Les extractions des fenêtres partagent le pool de l'analyse (QUESTION_CONCURRENCY requêtes
+en vol au plus par appel), sans pool imbriqué par attribut.
+"""
+import json
+import threading
+from collections import Counter
+from concurrent.futures import CancelledError, Executor, Future
+from typing import Any, List, Optional, Tuple, Union
+from config import Config
+from deadline import Deadline
+from llm_usage import in_context
+from models import CallAnalysisRequest
+from scheduling import mentions_error
+from token_budgets import estimate_tokens
+
+
+def split_windows(analyzer, request: CallAnalysisRequest, window_tokens: Optional[int] = None,
+                  overlap_turns: Optional[int] = None) -> List[Tuple[int, int]]:
+    """Découpe la conversation en fenêtres (début, fin) alignées sur les tours.
+
+    Chaque fenêtre reprend les `overlap_turns` derniers tours de la précédente pour garder le
+    contexte d'une question et de sa réponse. Un tour plus long que la fenêtre forme une fenêtre à lui seul.
+    """
+    window_tokens = window_tokens or Config.LONG_CALL_WINDOW_TOKENS
+    overlap_turns = Config.LONG_CALL_OVERLAP_TURNS if overlap_turns is None else overlap_turns
+    turn_tokens = [
+        estimate_tokens(analyzer._build_conversation_text(request, index, index + 1))
+        for index in range(len(request.conversation))
+    ]
+
+    windows = []
+    start = 0
+    while start < len(turn_tokens):
+        end, tokens = start, 0
+        while end < len(turn_tokens) and (end == start or tokens + turn_tokens[end] <= window_tokens):
+            tokens += turn_tokens[end]
+            end += 1
+        windows.append((start, end))
+        if end >= len(turn_tokens):
+            break
+        start = max(end - overlap_turns, start + 1)
+    return windows
+
+
+def failing_windows(request: CallAnalysisRequest, windows: List[Tuple[int, int]]) -> List[bool]:
+    """Fenêtres contenant les tours en échec (indication d'échec à ne donner qu'à celles-ci).
+
+    Un tour est en échec s'il mentionne une erreur, ou s'il précède immédiatement un outil en
+    échec (d'après les horodatages). Un outil en échec non localisable (sans horodatage) rend
+    toutes les fenêtres concernées.
+    """
+    turns = request.conversation
+    failing = {index for index, turn in enumerate(turns) if mentions_error(turn.content)}
+    for tool in request.tool_results:
+        if tool.success:
+            continue
+        if not tool.timestamp or any(not turn.timestamp for turn in turns):
+            return [True] * len(windows)
+        before = [index for index, turn in enumerate(turns) if turn.timestamp <= tool.timestamp]
+        failing.add(before[-1] if before else 0)
+    return [any(start <= index < end for index in failing) for start, end in windows]
+
+
+def is_long(analyzer, request: CallAnalysisRequest) -> bool:
+    """Vrai si le transcript dépasse LONG_CALL_TOKENS (extraction par fenêtres)."""
+    return estimate_tokens(analyzer._build_conversation_text(request)) > Config.LONG_CALL_TOKENS
+
+
+class MapReduceExtractor:
+    """Extraction d'un attribut sur plusieurs fenêtres d'un même appel, avec le LLM d'un DetailedAnalyzer."""
+
+    def __init__(self, analyzer):
+        self.analyzer = analyzer
+
+    def submit_question(self, executor: Executor, question_config: dict, window_texts: List[str], tools_text: str,
+                        failure_note: Union[str, List[str]] = "", deadline: Optional[Deadline] = None) -> Future:
+        """Soumet l'extraction d'un attribut sur chaque fenêtre au pool de l'analyse.
+
+        failure_note est commune à toutes les fenêtres ou donnée par fenêtre. Retourne un Future
+        résolu avec la valeur fusionnée (même contrat que DetailedAnalyzer._extract_single_question).
+        """
+        notes = failure_note if isinstance(failure_note, list) else [failure_note] * len(window_texts)
+        result = Future()
+        partials: List[Any] = [None] * len(window_texts)
+        pending = [len(window_texts)]
+        lock = threading.Lock()
+        reduce = in_context(self.reduce)
+
+        def run_reduce():
+            try:
+                result.set_result(reduce(question_config, partials, deadline))
+            except Exception as e:
+                result.set_exception(e)
+
+        def on_done(index: int, future: Future):
+            with lock:
+                if result.done():
+                    return
+                if future.cancelled():
+                    result.set_exception(CancelledError())
+                    return
+                if future.exception() is not None:
+                    result.set_exception(future.exception())
+                    return
+                partials[index] = future.result()
+                pending[0] -= 1
+                if pending[0]:
+                    return
+            # La synthèse des textes peut appeler le LLM: elle passe aussi par le pool
+            try:
+                executor.submit(run_reduce)
+            except RuntimeError as e:
+                result.set_exception(e)
+
+        for index, (text, note) in enumerate(zip(window_texts, notes)):
+            future = executor.submit(in_context(self.analyzer._extract_single_question), question_config, text, tools_text, note, deadline)
+            future.add_done_callback(lambda future, index=index: on_done(index, future))
+        return result
+
+    def reduce(self, question_config: dict, partials: List[Any], deadline: Optional[Deadline] = None) -> Any:
+        """Fusionne les réponses partielles (dans l'ordre des fenêtres)."""
+        response_type = question_config["response_type"]
+        nullable = question_config.get("nullable", False)
+        default_value = question_config.get("default_value")
+
+        if response_type == "multiselect":
+            # Union, dans l'ordre des options
+            selected = {item for partial in partials if partial for item in partial}
+            options = question_config.get("options") or []
+            field_key = question_config.get("field_key")
+            ordered = [option[field_key] for option in options if option[field_key] in selected] if field_key else sorted(selected)
+            return ordered or (None if nullable else [])
+
+        if response_type == "select":
+            # Vote; la valeur par défaut ne compte que si aucune fenêtre ne donne autre chose;
+            # à égalité, la valeur apparue en premier (motif exprimé en début d'appel)
+            votes = [partial for partial in partials if partial is not None and partial != default_value]
+            if not votes:
+                return default_value if default_value in partials else None
+            counts = Counter(votes)
+            best = max(counts.values())
+            return next(vote for vote in votes if counts[vote] == best)
+
+        if response_type == "boolean":
+            values = [partial for partial in partials if partial is not None]
+            return any(values) if values else (None if nullable else default_value)
+
+        if response_type == "number":
+            values = [partial for partial in partials if partial is not None]
+            return max(values) if values else (None if nullable else default_value)
+
+        # Textes: une seule réponse non vide est reprise telle quelle, sinon synthèse par le LLM
+        texts = list(dict.fromkeys(partial for partial in partials if isinstance(partial, str) and partial.strip()))
+        if not texts:
+            return None if nullable else default_value
+        if len(texts) == 1:
+            return texts[0]
+        return self._reduce_texts(question_config, texts, deadline)
+
+    def _reduce_texts(self, question_config: dict, texts: List[str], deadline: Optional[Deadline]) -> Any:
+        name = question_config["name"]
+        system_prompt, user_prompt = Config.generate_reduce_question_prompt(question_config, texts)
+        response, _ = self.analyzer.generate_json(
+            user_prompt, system_prompt, self.analyzer.token_budgets.budget(question_config), f"{name} (synthèse)", deadline
+        )
+        try:
+            json_start = response.find('{')
+            json_end = response.rfind('}') + 1
+            if json_start >= 0 and json_end > json_start:
+                value = json.loads(response[json_start:json_end]).get(name)
+                return self.analyzer._validate_and_normalize_value(value, question_config)
+        except ValueError as e:
+            print(f"Erreur lors de la synthèse de {name}: {e}")
+        # Synthèse impossible: juxtaposition des réponses partielles
+        return "\n".join(texts)
@@ -1,57 +1,125 @@
 """Point d'entrée principal pour l'analyse post-appel."""
 import asyncio
-from typing import Optional
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from typing import Dict, List, Optional
 from models import CallAnalysisRequest, CallMetadata, ConversationTurn, ToolResult, DetailedAnalysis
 from detailed_analyzer import DetailedAnalyzer
+from call_packing import PackedAnalyzer
 from rounded_api import RoundedAPIClient
+from config import Config
 import json
+from single_flight import SingleFlight
+from deadline import Deadline
+
+# Analyses en cours par (call_id, modèle), partagées entre toutes les instances
+_in_flight_calls = SingleFlight()
 
 
 class PostCallMonitoringSystem:
     """Système principal d'analyse post-appel."""
     
-    def __init__(self, model_name: str = "gpt-4o"):
+    def __init__(self, model_name: str = "gpt-4o", results_db=None, fallbacks: Optional[List[str]] = None):
+        """
+        Args:
+            model_name: Modèle LLM utilisé pour l'analyse
+            results_db: ResultsDatabase optionnelle où chaque analyse est enregistrée
+            fallbacks: Modèles de repli du routeur (Config.MODEL_FALLBACKS par défaut, [] pour n'interroger que model_name)
+        """
         self.model_name = model_name
-        self.detailed_analyzer = DetailedAnalyzer(model_name)
+        self.detailed_analyzer = DetailedAnalyzer(model_name, fallbacks=fallbacks)
         self.rounded_api = RoundedAPIClient()
+        self.results_db = results_db
     
-    def analyze_call_from_id(self, call_id: str, logger=None) -> Optional[DetailedAnalysis]:
+    def analyze_call_from_id(self, call_id: str, logger=None, on_question=None,
+                             deadline_s: Optional[float] = None) -> Optional[DetailedAnalysis]:
         """Analyse un appel depuis son ID en utilisant l'API Call Rounded.
         
+        Si le même appel est déjà en cours d'analyse avec ce modèle et le même routage (autre thread,
+        autre session) et que son échéance tombe avant la nôtre, on attend son résultat au lieu de
+        relancer les requêtes. L'attente est bornée par notre propre échéance; si elle est dépassée,
+        ou si le résultat partagé est partiel alors qu'il nous reste du temps, l'appel est analysé
+        par cet appelant.
+        
         Args:
             call_id: ID de l'appel à analyser
             logger: Fonction de logging optionnelle (ex: st.warning)
+            on_question: Callback optionnel (nom, valeur, terminés, total) appelé à chaque attribut extrait
+            deadline_s: Durée totale allouée (récupération + extractions), Config.CALL_DEADLINE_SECONDS par défaut.
+                Une fois atteinte, l'analyse est retournée partielle (partial=True, missing_attributes)
         """
+        deadline = Deadline(deadline_s if deadline_s is not None else Config.CALL_DEADLINE_SECONDS)
+        
+        def on_wait():
+            print(f"⏳ Appel {call_id} déjà en cours d'analyse avec {self.model_name}, attente du résultat")
+            if logger:
+                logger("Analyse déjà en cours pour cet appel, attente du résultat...")
+        
+        def ends_first(leader: Deadline) -> bool:
+            # On ne rejoint que des analyses qui se terminent au plus tard à notre échéance
+            return deadline.expires_at is None or (leader.expires_at is not None and leader.expires_at <= deadline.expires_at)
+        
         try:
+            result, shared = _in_flight_calls.do(
+                (call_id, self.model_name, self.detailed_analyzer.llm.routing_key),
+                self._analyze_call_from_id, call_id, logger, on_question, deadline,
+                on_wait=on_wait, timeout=deadline.remaining(), context=deadline, join=ends_first
+            )
+        except FuturesTimeoutError:
+            print(f"⏱️  Appel {call_id}: l'analyse en cours n'a pas abouti avant l'échéance, analyse directe")
+            return self._analyze_call_from_id(call_id, logger, on_question, deadline)
+        if shared and result is not None and result.partial and not deadline.expired():
+            # Analyse partagée interrompue par une échéance plus courte que la nôtre
+            print(f"🔁 Appel {call_id}: résultat partagé partiel, analyse avec le temps restant")
+            return self._analyze_call_from_id(call_id, logger, on_question, deadline)
+        if shared and result is not None and result.statistics is not None and on_question:
+            # Rejoue la progression pour l'appelant qui a attendu
+            values = result.statistics.dict()
+            for index, question in enumerate(Config.EXTRACTION_QUESTIONS, 1):
+                on_question(question["name"], values.get(question["name"]), index, len(Config.EXTRACTION_QUESTIONS))
+        return result
+    
+    def fetch_request(self, call_id: str, logger=None, timeout: Optional[float] = None) -> Optional[CallAnalysisRequest]:
+        """Récupère un appel depuis Call Rounded et construit sa requête d'analyse (None si introuvable)."""
+        if logger:
+            logger(f"Récupération de l'appel {call_id}...")
+        
+        # Récupère les données depuis Call Rounded
+        raw_data = self.rounded_api.get_call(call_id, timeout=timeout or Config.HTTP_TIMEOUT_SECONDS)
+        if not raw_data:
+            error_msg = f"Impossible de récupérer l'appel {call_id} depuis l'API Call Rounded"
+            print(error_msg)
             if logger:
-                logger(f"Récupération de l'appel {call_id}...")
-            
-            # Récupère les données depuis Call Rounded
-            raw_data = self.rounded_api.get_call(call_id)
-            if not raw_data:
-                error_msg = f"Impossible de récupérer l'appel {call_id} depuis l'API Call Rounded"
-                print(error_msg)
-                if logger:
-                    logger(f"⚠️ {error_msg}")
+                logger(f"⚠️ {error_msg}")
+            return None
+        
+        return self.build_request(raw_data, logger)
+    
+    def build_request(self, raw_data: dict, logger=None) -> CallAnalysisRequest:
+        """Transforme les données brutes d'un appel en requête d'analyse (sans appel réseau)."""
+        if logger:
+            logger("Transformation des données...")
+        
+        # Transforme les données
+        call_data = self.rounded_api.transform_call_data(raw_data)
+        
+        if logger:
+            logger("Construction de la requête d'analyse...")
+        
+        # Construit la requête d'analyse
+        return self._build_analysis_request(call_data)
+    
+    def _analyze_call_from_id(self, call_id: str, logger=None, on_question=None, deadline: Optional[Deadline] = None) -> Optional[DetailedAnalysis]:
+        deadline = deadline or Deadline()
+        try:
+            request = self.fetch_request(call_id, logger, timeout=deadline.timeout(Config.HTTP_TIMEOUT_SECONDS))
+            if request is None:
                 return None
             
-            if logger:
-                logger("Transformation des données...")
-            
-            # Transforme les données
-            call_data = self.rounded_api.transform_call_data(raw_data)
-            
-            if logger:
-                logger("Construction de la requête d'analyse...")
-            
-            # Construit la requête d'analyse
-            request = self._build_analysis_request(call_data)
-            
             if logger:
                 logger("Lancement de l'analyse...")
             
             # Analyse l'appel
-            return self.analyze_call(request)
+            return self.analyze_call(request, on_question=on_question, deadline=deadline)
         except RuntimeError as e:
             error_msg = f"Erreur critique LLM: {e}"
             print(f"\n❌ {error_msg}")
@@ -65,12 +133,12 @@ class PostCallMonitoringSystem:
                 logger(f"❌ {error_msg}")
             return None
     
-    def analyze_call(self, request: CallAnalysisRequest) -> DetailedAnalysis:
-        """Analyse un appel avec la requête fournie."""
+    def analyze_call(self, request: CallAnalysisRequest, on_question=None, deadline: Optional[Deadline] = None) -> DetailedAnalysis:
+        """Analyse un appel avec la requête fournie (partielle si l'échéance est atteinte)."""
         try:
             # Analyse directe (inclut l'extraction des statistiques avec failure_reasons et failure_description)
             print("📊 Analyse en cours...")
-            detailed = self.detailed_analyzer.analyze(request)
+            detailed = self.detailed_analyzer.analyze(request, on_question=on_question, deadline=deadline)
             
             # Log concis du résultat (valeurs exactes)
             if detailed.problem_detected:
@@ -79,6 +147,13 @@ class PostCallMonitoringSystem:
             else:
                 print("✅ Analyse terminée - Aucun problème détecté")
             
+            # Une analyse partielle n'est pas enregistrée: elle sera refaite en entier
+            if self.results_db is not None and not detailed.partial:
+                try:
+                    self.results_db.store(detailed, self.model_name, request, config_hash=Config.get_config_hash())
+                except Exception as e:
+                    print(f"⚠️  Impossible d'enregistrer l'analyse en base: {e}")
+            
             return detailed
         except RuntimeError as e:
             print(f"\n❌ Erreur LLM: {e}")
@@ -87,6 +162,34 @@ class PostCallMonitoringSystem:
             print(f"\n❌ Erreur lors de l'analyse: {e}")
             raise
     
+    def analyze_calls_packed(self, requests: List[CallAnalysisRequest], deadline_s: Optional[float] = None,
+                             deadline: Optional[Deadline] = None) -> Dict[str, DetailedAnalysis]:
+        """Analyse un groupe d'appels courts avec des requêtes LLM groupées (voir call_packing).
+        
+        En cas d'échec de l'analyse groupée, chaque appel est analysé individuellement, sous la
+        même échéance. Comme pour analyze_call, les analyses partielles ne sont pas enregistrées.
+        
+        Args:
+            deadline: Échéance déjà entamée (ex: créée avant la récupération des appels);
+                à défaut, une échéance de deadline_s (Config.CALL_DEADLINE_SECONDS) démarre ici
+        """
+        if deadline is None:
+            deadline = Deadline(deadline_s if deadline_s is not None else Config.CALL_DEADLINE_SECONDS)
+        try:
+            analyses = PackedAnalyzer(self.detailed_analyzer).analyze_pack(requests, deadline=deadline)
+        except Exception as e:
+            print(f"⚠️  Analyse groupée impossible ({e}), analyse appel par appel")
+            return {request.call_id: self.analyze_call(request, deadline=deadline) for request in requests}
+        
+        by_id = {request.call_id: request for request in requests}
+        for call_id, detailed in analyses.items():
+            if self.results_db is not None and not detailed.partial:
+                try:
+                    self.results_db.store(detailed, self.model_name, by_id[call_id], config_hash=Config.get_config_hash())
+                except Exception as e:
+                    print(f"⚠️  Impossible d'enregistrer l'analyse en base: {e}")
+        return analyses
+    
     def _build_analysis_request(self, call_data: dict) -> CallAnalysisRequest:
         """Construit la requête d'analyse depuis les données brutes."""
         # Extrait la conversation depuis le transcript
@@ -138,7 +241,8 @@ class PostCallMonitoringSystem:
             duration=call_data.get("duration"),
             status=status_value,
             triggered_tool=call_data.get("metadata", {}).get("tool"),
-            timestamp=call_data.get("metadata", {}).get("timestamp")
+            timestamp=call_data.get("started_at") or call_data.get("metadata", {}).get("timestamp"),
+            agent_id=call_data.get("agent_id")
         )
         
         return CallAnalysisRequest(
@@ -86,6 +86,10 @@ class DetailedAnalysis(BaseModel):
     recommendations: List[str]
     confidence: Optional[float] = None  # Confiance de la détection (0.0 à 1.0)
     statistics: Optional[CallStatistics] = None  # Statistiques enrichies
+    partial: bool = False  # Échéance atteinte avant la fin de toutes les extractions
+    missing_attributes: List[str] = []  # Attributs non extraits (analyse partielle)
+    distilled_attributes: List[str] = []  # Attributs prédits par un classifieur distillé (sans LLM)
+    response_tokens: Dict[str, int] = {}  # Tokens estimés de la réponse brute du LLM par attribut (budgets)
 
 
 class InitialAnalysis(BaseModel):
@@ -96,3 +100,16 @@ class InitialAnalysis(BaseModel):
     confidence: float  # Entre 0 et 1
     context: Dict[str, Any]
 
+
+class AnomalyAlert(BaseModel):
+    """Alerte émise lorsqu'un tag d'erreur dépasse significativement son taux habituel."""
+    tag: str
+    scope: str  # "global" ou "agent"
+    agent_id: Optional[str] = None
+    model: Optional[str] = None
+    recent_rate: float  # Taux récent (EWMA rapide)
+    baseline_rate: float  # Taux de référence (EWMA lente)
+    z_score: float
+    events: int  # Nombre d'appels observés pour ce tag et ce périmètre
+    call_id: Optional[str] = None  # Appel ayant déclenché l'alerte
+    timestamp: str
@@ -0,0 +1,124 @@
+"""Pipeline à étages (threads) reliés par des files bornées.
+
+Chaque étage a son propre nombre de workers; les files bornées entre étages laissent les
+premiers étages (ex: récupération des appels) prendre de l'avance sur les suivants (analyse LLM)
+sans accumuler un retard illimité. Le débit est ainsi fixé par l'étage le plus lent et non
+par la somme des durées de chaque étape.
+
+Une étape peut être ordonnancée (schedule): ses éléments en attente sont alors servis par
+priorité, avec équité entre groupes (voir scheduling.FairPriorityQueue), et non dans l'ordre d'arrivée.
+"""
+import queue
+import threading
+from typing import Any, Callable, Hashable, Iterable, Iterator, List, Optional, Tuple
+from scheduling import FairPriorityQueue
+
+# Marqueur de fin de flux
+_DONE = object()
+
+
+class Stage:
+    """Étape du pipeline: fn(élément) retourne la liste des éléments transmis à l'étape suivante.
+
+    Avec schedule(élément) -> (priorité, groupe), les éléments en attente de l'étape (jusqu'à
+    queue_size, par défaut celle du pipeline) sont traités par priorité décroissante.
+    """
+
+    def __init__(self, name: str, fn: Callable[[Any], List[Any]], workers: int = 1,
+                 schedule: Optional[Callable[[Any], Tuple[float, Hashable]]] = None, queue_size: Optional[int] = None):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.schedule = schedule
+        self.queue_size = queue_size
+
+
+class PipelineResult:
+    """Élément sorti du pipeline: valeur de la dernière étape, ou erreur et étape en cause."""
+
+    def __init__(self, value: Any = None, error: Optional[BaseException] = None, stage: Optional[str] = None, item: Any = None):
+        self.value = value
+        self.error = error
+        self.stage = stage
+        self.item = item
+
+
+class Pipeline:
+    """Exécute des étapes en parallèle, chacune alimentée par une file bornée."""
+
+    def __init__(self, stages: List[Stage], queue_size: int = 16):
+        if not stages:
+            raise ValueError("Le pipeline doit contenir au moins une étape")
+        self.stages = stages
+        self.queue_size = queue_size
+
+    def run(self, items: Iterable[Any]) -> Iterator[PipelineResult]:
+        """Fait passer les éléments dans toutes les étapes; les résultats sont rendus dans l'ordre d'arrivée.
+
+        Une exception dans une étape n'arrête pas le pipeline: l'élément en cause est rendu
+        comme PipelineResult(error=...), les autres continuent.
+        """
+        queues = [self._input_queue(stage) for stage in self.stages]
+        output = queue.Queue(maxsize=self.queue_size)
+        threads = []
+
+        def feed():
+            for item in items:
+                queues[0].put(item)
+            for _ in range(self.stages[0].workers):
+                queues[0].put(_DONE)
+
+        for index, stage in enumerate(self.stages):
+            next_queue = queues[index + 1] if index + 1 < len(self.stages) else output
+            next_workers = self.stages[index + 1].workers if index + 1 < len(self.stages) else 1
+            remaining = [stage.workers]
+            lock = threading.Lock()
+            for number in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._work,
+                    args=(stage, queues[index], next_queue, output, next_workers, remaining, lock, index + 1 == len(self.stages)),
+                    name=f"pipeline-{stage.name}-{number}",
+                    daemon=True
+                )
+                thread.start()
+                threads.append(thread)
+        threading.Thread(target=feed, name="pipeline-feed", daemon=True).start()
+
+        while True:
+            result = output.get()
+            if result is _DONE:
+                break
+            yield result
+
+    def _input_queue(self, stage: Stage):
+        size = stage.queue_size or self.queue_size
+        if stage.schedule is None:
+            return queue.Queue(maxsize=size)
+        # La fin de flux passe après tous les éléments
+        return FairPriorityQueue(
+            key=lambda item: (float("-inf"), None) if item is _DONE else stage.schedule(item),
+            maxsize=size
+        )
+
+    @staticmethod
+    def _work(stage: Stage, in_queue: queue.Queue, next_queue: queue.Queue, output: queue.Queue,
+              next_workers: int, remaining: list, lock: threading.Lock, last: bool):
+        while True:
+            item = in_queue.get()
+            if item is _DONE:
+                break
+            try:
+                values = stage.fn(item)
+            except Exception as e:
+                output.put(PipelineResult(error=e, stage=stage.name, item=item))
+                continue
+            for value in values:
+                next_queue.put(PipelineResult(value=value, stage=stage.name, item=item) if last else value)
+
+        # Le dernier worker de l'étape propage la fin de flux à l'étape suivante
+        with lock:
+            remaining[0] -= 1
+            finished = remaining[0] == 0
+        if finished:
+            for _ in range(next_workers):
+                next_queue.put(_DONE)
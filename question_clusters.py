@@ -0,0 +1,236 @@
+"""Regroupement incrémental des questions quasi identiques des appelants (MinHash + LSH)."""
+import re
+import threading
+import unicodedata
+import zlib
+from typing import Dict, List, Optional
+import numpy as np
+from models import CallAnalysisRequest, DetailedAnalysis
+
+# Réponses du LLM signifiant l'absence de question
+_EMPTY_ANSWERS = {"aucune", "aucune question", "none", "null", "n/a", "na"}
+
+# Puces et numérotation en début de ligne ("- ", "• ", "1. ", "2) ")
+_BULLET = re.compile(r"^\s*(?:[-•*]|\d+[.)])\s*")
+
+
+def split_questions(text: Optional[str]) -> List[str]:
+    """Découpe le champ user_questions (multiligne) en questions individuelles."""
+    if not text:
+        return []
+    questions = []
+    for line in text.splitlines():
+        line = _BULLET.sub("", line).strip()
+        # Plusieurs questions sur une même ligne: on coupe après chaque "?"
+        for part in re.split(r"(?<=\?)\s+", line):
+            part = part.strip()
+            if part and normalize_question(part) not in _EMPTY_ANSWERS:
+                questions.append(part)
+    return questions
+
+
+def normalize_question(question: str) -> str:
+    """Minuscules, sans accents ni ponctuation, espaces compactés."""
+    text = unicodedata.normalize("NFKD", question.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(re.findall(r"\w+", text))
+
+
+def shingles(normalized: str, size: int = 4) -> set:
+    """Ensemble des n-grammes de caractères (robuste aux fautes et aux variantes de formulation)."""
+    if len(normalized) <= size:
+        return {normalized}
+    return {normalized[i:i + size] for i in range(len(normalized) - size + 1)}
+
+
+class MinHasher:
+    """Signatures MinHash vectorisées: une ligne de num_perm minima par ensemble de shingles.
+
+    Chaque permutation est un hachage multiply-shift: ((a * x + b) mod 2^64) >> 32, a impair.
+    """
+
+    def __init__(self, num_perm: int = 64, seed: int = 42):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(0, 2 ** 64, size=num_perm, dtype=np.uint64, endpoint=False) | np.uint64(1)
+        self.b = rng.integers(0, 2 ** 64, size=num_perm, dtype=np.uint64, endpoint=False)
+        self.num_perm = num_perm
+
+    def signature(self, shingle_set: set) -> np.ndarray:
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingle_set), dtype=np.uint64, count=len(shingle_set))
+        # Le dépassement uint64 est voulu (arithmétique modulo 2^64)
+        permuted = (self.a[:, None] * hashes[None, :] + self.b[:, None]) >> np.uint64(32)
+        return permuted.min(axis=1).astype(np.uint32)
+
+
+class QuestionClusterer:
+    """Clusters de questions mis à jour au fil de l'eau.
+
+    Les doublons exacts (après normalisation) sont comptés sans calcul. Les autres questions
+    sont comparées uniquement aux candidats partageant une bande LSH, puis rattachées au cluster
+    du candidat le plus proche si la similarité de Jaccard estimée dépasse le seuil.
+    """
+
+    def __init__(self, threshold: float = 0.5, num_perm: int = 64, bands: int = 16, max_bucket_size: int = 64):
+        """
+        Args:
+            threshold: Similarité de Jaccard (shingles) minimale pour regrouper deux questions
+            num_perm: Taille des signatures MinHash
+            bands: Nombre de bandes LSH (num_perm doit en être un multiple)
+            max_bucket_size: Nombre maximum de variantes conservées par seau LSH (borne le coût par ajout)
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm doit être un multiple de bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.max_bucket_size = max_bucket_size
+        self.hasher = MinHasher(num_perm)
+        self._by_text: Dict[str, int] = {}  # question normalisée -> id de variante
+        self._variants: List[dict] = []  # {"text", "count", "cluster"}
+        self._signatures = np.empty((1024, num_perm), dtype=np.uint32)  # Une ligne par variante
+        self._buckets: Dict[tuple, List[int]] = {}
+        self._clusters: Dict[int, dict] = {}  # id -> {"variants", "calls", "occurrences"}
+        self._seen_calls: set = set()  # Appels déjà ajoutés (réanalyses, autres modèles)
+        self._lock = threading.Lock()
+
+    def add(self, user_questions: Optional[str], call_id: Optional[str] = None) -> List[int]:
+        """Ajoute les questions d'un appel. Retourne les ids des clusters concernés.
+
+        Un appel déjà ajouté (même call_id, autre modèle ou réanalyse) est ignoré pour ne pas
+        gonfler les occurrences.
+        """
+        cluster_ids = []
+        with self._lock:
+            if call_id:
+                if call_id in self._seen_calls:
+                    return cluster_ids
+                self._seen_calls.add(call_id)
+            for question in split_questions(user_questions):
+                cluster_id = self._add_question(question)
+                cluster = self._clusters[cluster_id]
+                cluster["occurrences"] += 1
+                if call_id:
+                    cluster["calls"].add(call_id)
+                cluster_ids.append(cluster_id)
+        return cluster_ids
+
+    def _add_question(self, question: str) -> int:
+        normalized = normalize_question(question)
+        variant_id = self._by_text.get(normalized)
+        if variant_id is not None:
+            self._variants[variant_id]["count"] += 1
+            return self._variants[variant_id]["cluster"]
+
+        signature = self.hasher.signature(shingles(normalized))
+        band_keys = [
+            (band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+            for band in range(self.bands)
+        ]
+
+        best_id = None
+        candidates = {candidate for key in band_keys for candidate in self._buckets.get(key, ())}
+        if candidates:
+            candidate_ids = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+            similarities = (self._signatures[candidate_ids] == signature).mean(axis=1)
+            best = int(similarities.argmax())
+            if similarities[best] >= self.threshold:
+                best_id = int(candidate_ids[best])
+
+        variant_id = len(self._variants)
+        if variant_id == len(self._signatures):
+            self._signatures = np.concatenate([self._signatures, np.empty_like(self._signatures)])
+        self._signatures[variant_id] = signature
+        if best_id is None:
+            cluster_id = variant_id
+            self._clusters[cluster_id] = {"variants": [], "calls": set(), "occurrences": 0}
+        else:
+            cluster_id = self._variants[best_id]["cluster"]
+        self._clusters[cluster_id]["variants"].append(variant_id)
+        self._variants.append({"text": question, "count": 1, "cluster": cluster_id})
+        self._by_text[normalized] = variant_id
+        for key in band_keys:
+            bucket = self._buckets.setdefault(key, [])
+            # Un seau plein représente déjà un groupe dense: inutile d'y comparer chaque nouvelle variante
+            if len(bucket) < self.max_bucket_size:
+                bucket.append(variant_id)
+        return cluster_id
+
+    def observe(self, analysis: DetailedAnalysis, model: str, request: Optional[CallAnalysisRequest] = None):
+        """Listener de ResultsDatabase: ajoute les questions d'une analyse enregistrée."""
+        if analysis.statistics is not None:
+            self.add(analysis.statistics.user_questions, call_id=analysis.call_id)
+
+    @classmethod
+    def from_database(cls, results_db, since: Optional[str] = None, until: Optional[str] = None,
+                      model: Optional[str] = None, **kwargs) -> "QuestionClusterer":
+        """Construit les clusters à partir des analyses stockées."""
+        clusterer = cls(**kwargs)
+        for row in results_db.query(model=model, since=since, until=until, limit=None):
+            clusterer.add(row["user_questions"], call_id=row["call_id"])
+        return clusterer
+
+    def clusters(self, min_calls: int = 1, top: Optional[int] = None, examples: int = 3) -> List[dict]:
+        """Clusters classés par nombre d'appels distincts (puis d'occurrences).
+
+        La question représentative est la variante la plus fréquente (la plus courte à égalité).
+        """
+        with self._lock:
+            ranked = []
+            for cluster_id, cluster in self._clusters.items():
+                calls = len(cluster["calls"]) or cluster["occurrences"]
+                if calls < min_calls:
+                    continue
+                variants = sorted(
+                    (self._variants[v] for v in cluster["variants"]),
+                    key=lambda v: (-v["count"], len(v["text"]))
+                )
+                ranked.append({
+                    "cluster_id": cluster_id,
+                    "calls": calls,
+                    "occurrences": cluster["occurrences"],
+                    "variants": len(variants),
+                    "representative": variants[0]["text"],
+                    "examples": [v["text"] for v in variants[1:examples + 1]]
+                })
+        ranked.sort(key=lambda c: (-c["calls"], -c["occurrences"]))
+        return ranked[:top] if top else ranked
+
+    def __len__(self) -> int:
+        return len(self._clusters)
+
+
+if __name__ == "__main__":
+    import argparse
+    import csv
+    from config import Config
+    from results_db import ResultsDatabase
+
+    parser = argparse.ArgumentParser(description="Regroupe les questions des appelants pour la base de connaissances")
+    parser.add_argument("--db", default=Config.RESULTS_DB_PATH, required=Config.RESULTS_DB_PATH is None, help="Chemin de la base SQLite")
+    parser.add_argument("--since", default=None, help="Date/heure minimale (ISO)")
+    parser.add_argument("--until", default=None, help="Date/heure maximale (ISO)")
+    parser.add_argument("--model", default=None, help="Filtre sur le modèle")
+    parser.add_argument("--threshold", type=float, default=0.5, help="Similarité minimale (0-1)")
+    parser.add_argument("--min-calls", type=int, default=2, help="Nombre minimum d'appels par cluster")
+    parser.add_argument("--top", type=int, default=50, help="Nombre de clusters affichés")
+    parser.add_argument("--csv", default=None, help="Exporte tous les clusters retenus dans un fichier CSV")
+    args = parser.parse_args()
+
+    clusterer = QuestionClusterer.from_database(
+        ResultsDatabase(args.db), since=args.since, until=args.until, model=args.model, threshold=args.threshold
+    )
+    ranked = clusterer.clusters(min_calls=args.min_calls)
+    print(f"📊 {len(clusterer)} clusters, {len(ranked)} avec au moins {args.min_calls} appels")
+    for rank, cluster in enumerate(ranked[:args.top], 1):
+        print(f"\n{rank:>3}. [{cluster['calls']} appels, {cluster['variants']} variantes] {cluster['representative']}")
+        for example in cluster["examples"]:
+            print(f"       ≈ {example}")
+
+    if args.csv:
+        with open(args.csv, "w", newline="", encoding="utf-8") as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(["rank", "calls", "occurrences", "variants", "representative", "examples"])
+            for rank, cluster in enumerate(ranked, 1):
+                writer.writerow([rank, cluster["calls"], cluster["occurrences"], cluster["variants"],
+                                 cluster["representative"], " | ".join(cluster["examples"])])
+        print(f"\n✅ Clusters exportés: {args.csv}")
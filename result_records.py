@@ -0,0 +1,127 @@
+"""Enregistrements de résultats d'analyse (listes natives) et conversion en lignes CSV."""
+from datetime import datetime
+from typing import Optional
+from models import DetailedAnalysis
+
+# Colonnes du CSV
+CSV_FIELDNAMES = [
+    "call_id",
+    "model_used",
+    "call_reason",
+    "user_sentiment",
+    "failure_reasons",
+    "failure_description",
+    "user_questions",
+    "call_tags",
+    "missing_attributes"
+]
+
+
+def format_list_field(value):
+    """Formate une liste pour le CSV (sépare par des points-virgules)."""
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return "; ".join(str(v) for v in value)
+    return str(value)
+
+
+def build_result_record(call_id: str, model: str, result: DetailedAnalysis, analyzed_at: Optional[datetime] = None) -> dict:
+    """Construit l'enregistrement d'une analyse réussie (les champs multiselect restent des listes)."""
+    stats = result.statistics
+    return {
+        "call_id": call_id,
+        "model_used": model,
+        "analyzed_at": analyzed_at or datetime.now(),
+        "call_reason": stats.call_reason if stats else None,
+        "user_sentiment": stats.user_sentiment if stats else None,
+        "failure_reasons": list(stats.failure_reasons) if stats and stats.failure_reasons is not None else None,
+        "failure_description": stats.failure_description if stats else None,
+        "user_questions": stats.user_questions if stats else None,
+        "call_tags": list(stats.call_tags) if stats and stats.call_tags is not None else None,
+        "problem_detected": result.problem_detected,
+        "missing_attributes": list(result.missing_attributes),
+        "error": None
+    }
+
+
+def build_error_record(call_id: str, model: str, description: str, analyzed_at: Optional[datetime] = None) -> dict:
+    """Construit l'enregistrement d'une analyse en échec."""
+    return {
+        "call_id": call_id,
+        "model_used": model,
+        "analyzed_at": analyzed_at or datetime.now(),
+        "call_reason": None,
+        "user_sentiment": None,
+        "failure_reasons": None,
+        "failure_description": None,
+        "user_questions": None,
+        "call_tags": None,
+        "problem_detected": None,
+        "missing_attributes": None,
+        "error": description
+    }
+
+
+def record_to_csv_row(record: dict) -> dict:
+    """Aplatit un enregistrement en ligne CSV (listes jointes par "; ", "ERROR" pour les échecs)."""
+    if record.get("error"):
+        return {
+            "call_id": record["call_id"],
+            "model_used": record["model_used"],
+            "call_reason": "ERROR",
+            "user_sentiment": "ERROR",
+            "failure_reasons": "ERROR",
+            "failure_description": record["error"],
+            "user_questions": "ERROR",
+            "call_tags": "ERROR",
+            "missing_attributes": ""
+        }
+    return {
+        "call_id": record["call_id"],
+        "model_used": record["model_used"],
+        "call_reason": record["call_reason"] or "",
+        "user_sentiment": record["user_sentiment"] or "",
+        "failure_reasons": format_list_field(record["failure_reasons"]),
+        "failure_description": record["failure_description"] or "",
+        "user_questions": record["user_questions"] or "",
+        "call_tags": format_list_field(record["call_tags"]),
+        # Attributs non extraits avant l'échéance: une cellule vide n'y signifie pas "aucun échec"
+        "missing_attributes": format_list_field(record.get("missing_attributes"))
+    }
+
+
+# Colonnes par modèle du CSV de comparaison (préfixées par "<modèle>:")
+COMPARED_ATTRIBUTES = [
+    "call_reason",
+    "user_sentiment",
+    "failure_reasons",
+    "failure_description",
+    "user_questions",
+    "call_tags"
+]
+COMPARISON_FIELDS = COMPARED_ATTRIBUTES + ["missing_attributes", "latency_s", "llm_requests", "cost_usd", "error"]
+
+
+def comparison_fieldnames(models: list) -> list:
+    """Colonnes du CSV de comparaison: call_id puis les colonnes de chaque modèle côte à côte."""
+    return ["call_id"] + [f"{model}:{field}" for model in models for field in COMPARISON_FIELDS]
+
+
+def build_comparison_row(call_id: str, outcomes: dict) -> dict:
+    """Ligne de comparaison d'un appel.
+    
+    Args:
+        outcomes: {modèle: {"record": enregistrement, "latency_s", "llm_requests", "cost_usd"}}
+    """
+    row = {"call_id": call_id}
+    for model, outcome in outcomes.items():
+        csv_row = record_to_csv_row(outcome["record"])
+        for field in COMPARED_ATTRIBUTES:
+            row[f"{model}:{field}"] = "" if outcome["record"].get("error") else csv_row[field]
+        row[f"{model}:missing_attributes"] = csv_row["missing_attributes"]
+        row[f"{model}:latency_s"] = f"{outcome['latency_s']:.2f}"
+        row[f"{model}:llm_requests"] = outcome["llm_requests"]
+        row[f"{model}:cost_usd"] = f"{outcome['cost_usd']:.5f}" if outcome["cost_usd"] is not None else ""
+        row[f"{model}:error"] = outcome["record"].get("error") or ""
+    return row
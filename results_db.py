@@ -0,0 +1,728 @@
+"""Base SQLite indexée des résultats d'analyse, avec API de requête et CLI."""
+import json
+import re
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from models import CallAnalysisRequest, CallStatistics, DetailedAnalysis
+
+# Séparateur utilisé par GROUP_CONCAT pour reconstruire les listes
+_LIST_SEPARATOR = "\x1f"
+
+# Tables de tags dont l'ordre d'origine est conservé (failure_reasons[0] donne problem_type)
+_TAG_TABLES = ("failure_reasons", "call_tags")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    id INTEGER PRIMARY KEY,
+    call_id TEXT NOT NULL,
+    model TEXT NOT NULL,
+    analyzed_at TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    agent_id TEXT,
+    call_status TEXT,
+    call_duration INTEGER,
+    config_hash TEXT,
+    problem_detected INTEGER NOT NULL,
+    problem_type TEXT,
+    summary TEXT,
+    call_reason TEXT,
+    user_sentiment TEXT,
+    failure_description TEXT,
+    user_questions TEXT,
+    distilled_attributes TEXT,
+    response_tokens TEXT,
+    UNIQUE (call_id, model)
+);
+CREATE TABLE IF NOT EXISTS failure_reasons (
+    analysis_id INTEGER NOT NULL REFERENCES analyses(id) ON DELETE CASCADE,
+    tag TEXT NOT NULL,
+    position INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (analysis_id, tag)
+);
+CREATE TABLE IF NOT EXISTS call_tags (
+    analysis_id INTEGER NOT NULL REFERENCES analyses(id) ON DELETE CASCADE,
+    tag TEXT NOT NULL,
+    position INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (analysis_id, tag)
+);
+CREATE INDEX IF NOT EXISTS idx_analyses_model_timestamp ON analyses (model, timestamp);
+CREATE INDEX IF NOT EXISTS idx_analyses_timestamp ON analyses (timestamp);
+CREATE INDEX IF NOT EXISTS idx_analyses_agent_timestamp ON analyses (agent_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_analyses_sentiment ON analyses (user_sentiment, timestamp);
+CREATE INDEX IF NOT EXISTS idx_failure_reasons_tag ON failure_reasons (tag, analysis_id);
+CREATE INDEX IF NOT EXISTS idx_call_tags_tag ON call_tags (tag, analysis_id);
+CREATE TABLE IF NOT EXISTS search_documents (
+    id INTEGER PRIMARY KEY,
+    call_id TEXT NOT NULL,
+    model TEXT NOT NULL,
+    source TEXT NOT NULL,
+    timestamp TEXT,
+    UNIQUE (call_id, model, source)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+    content,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+CREATE TABLE IF NOT EXISTS rollups (
+    granularity TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    agent_id TEXT NOT NULL,
+    model TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    value INTEGER NOT NULL,
+    PRIMARY KEY (granularity, bucket, agent_id, model, metric)
+);
+CREATE INDEX IF NOT EXISTS idx_rollups_agent ON rollups (granularity, agent_id, bucket);
+"""
+
+# Sources indexées en plein texte
+SEARCH_SOURCES = ("transcript", "user_questions")
+
+# Granularités des agrégats: longueur du préfixe ISO de l'horodatage (YYYY-MM-DDTHH / YYYY-MM-DD)
+ROLLUP_GRANULARITIES = {"hour": 13, "day": 10}
+
+_SELECT_ANALYSES = f"""
+SELECT a.*,
+    (SELECT GROUP_CONCAT(tag, '{_LIST_SEPARATOR}') FROM (
+        SELECT tag FROM failure_reasons f WHERE f.analysis_id = a.id ORDER BY position, rowid
+    )) AS failure_reasons,
+    (SELECT GROUP_CONCAT(tag, '{_LIST_SEPARATOR}') FROM (
+        SELECT tag FROM call_tags t WHERE t.analysis_id = a.id ORDER BY position, rowid
+    )) AS call_tags
+FROM analyses a
+"""
+
+
+def normalize_timestamp(value: Any) -> Optional[str]:
+    """Convertit un horodatage (ISO, epoch en secondes ou datetime) en chaîne ISO UTC triable.
+    
+    Format YYYY-MM-DDTHH:MM:SS sans fuseau: les agrégats découpent la chaîne par position
+    (ROLLUP_GRANULARITIES). Les dates avec fuseau sont ramenées en UTC, celles sans fuseau sont
+    supposées déjà en UTC. Une chaîne non ISO est conservée telle quelle.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        value = datetime.fromtimestamp(value, tz=timezone.utc)
+    elif not isinstance(value, datetime):
+        text = str(value).strip()
+        if text.endswith(("Z", "z")):
+            text = text[:-1] + "+00:00"
+        try:
+            value = datetime.fromisoformat(text)
+        except ValueError:
+            return str(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.isoformat(timespec="seconds")
+
+
+def _bucket_bound(value: str, length: int, end_of_day: bool = False) -> str:
+    """Borne de période comparable aux buckets des agrégats (date seule: début ou fin de journée)."""
+    if end_of_day and len(value) == 10:
+        value += "T23:59:59"
+    return (normalize_timestamp(value) or "")[:length]
+
+
+def normalize_transcript(request: CallAnalysisRequest) -> str:
+    """Texte normalisé du transcript (un tour par ligne, espaces compactés) pour l'index plein texte."""
+    lines = []
+    for turn in request.conversation:
+        role = "APPELANT" if turn.role == "user" else "AGENT"
+        content = " ".join(turn.content.split())
+        if content:
+            lines.append(f"{role}: {content}")
+    return "\n".join(lines)
+
+
+def rollup_metrics(problem_detected: bool, failure_reasons: List[str], sentiment: Optional[str]) -> List[str]:
+    """Métriques incrémentées par une analyse dans les agrégats (calls, failed_calls, failure:<tag>, sentiment:<valeur>)."""
+    metrics = ["calls"]
+    if problem_detected:
+        metrics.append("failed_calls")
+    metrics.extend(f"failure:{tag}" for tag in failure_reasons)
+    if sentiment:
+        metrics.append(f"sentiment:{sentiment}")
+    return metrics
+
+
+def to_fts_query(text: str) -> str:
+    """Convertit une saisie libre en requête FTS5 (tous les mots requis, recherche par préfixe)."""
+    words = re.findall(r"\w+", text)
+    return " ".join(f'"{word}"*' for word in words)
+
+
+class ResultsDatabase:
+    """Stocke les DetailedAnalysis (une ligne par couple call_id × modèle) et les interroge.
+
+    Une seule connexion est partagée entre les threads, protégée par un verrou.
+    """
+
+    def __init__(self, path: str, busy_timeout: float = 30.0):
+        """
+        Args:
+            path: Fichier SQLite (":memory:" pour une base temporaire)
+            busy_timeout: Attente maximale (secondes) du verrou d'écriture tenu par un autre process
+                (shards ou workers partageant la base) avant l'erreur "database is locked"
+        """
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.execute("PRAGMA synchronous = NORMAL")
+        with self._lock, self._conn:
+            self._conn.executescript(SCHEMA)
+            # Bases créées avant la conservation de l'ordre des tags (les lignes existantes
+            # gardent l'ordre d'insertion via rowid)
+            for table in _TAG_TABLES:
+                columns = [row["name"] for row in self._conn.execute(f"PRAGMA table_info({table})")]
+                if "position" not in columns:
+                    self._conn.execute(f"ALTER TABLE {table} ADD COLUMN position INTEGER NOT NULL DEFAULT 0")
+            # Bases créées avant l'enregistrement de la provenance des valeurs et des longueurs de réponse
+            columns = [row["name"] for row in self._conn.execute("PRAGMA table_info(analyses)")]
+            for column in ("distilled_attributes", "response_tokens"):
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE analyses ADD COLUMN {column} TEXT")
+        self._listeners: List[Callable] = []
+
+    def add_listener(self, listener: Callable[[DetailedAnalysis, str, Optional[CallAnalysisRequest]], None]):
+        """Enregistre une fonction appelée après chaque store() validé: listener(analysis, model, request).
+
+        Seules les nouvelles analyses sont notifiées: le remplacement d'une analyse existante
+        (même call_id × modèle) n'est pas un nouvel appel pour les détecteurs et agrégateurs.
+        """
+        self._listeners.append(listener)
+
+    def close(self):
+        """Ferme la connexion."""
+        with self._lock:
+            self._conn.close()
+
+    def store(
+        self,
+        analysis: DetailedAnalysis,
+        model: str,
+        request: Optional[CallAnalysisRequest] = None,
+        config_hash: Optional[str] = None,
+        analyzed_at: Optional[datetime] = None
+    ) -> int:
+        """Enregistre (ou remplace) l'analyse d'un appel pour un modèle. Retourne l'id de la ligne."""
+        stats = analysis.statistics or CallStatistics()
+        metadata = request.metadata if request else None
+        analyzed_at_text = normalize_timestamp(analyzed_at or datetime.now())
+        timestamp = normalize_timestamp(metadata.timestamp if metadata else None) or analyzed_at_text
+
+        values = {
+            "call_id": analysis.call_id,
+            "model": model,
+            "analyzed_at": analyzed_at_text,
+            "timestamp": timestamp,
+            "agent_id": metadata.agent_id if metadata else None,
+            "call_status": metadata.status if metadata else None,
+            "call_duration": metadata.duration if metadata else None,
+            "config_hash": config_hash,
+            "problem_detected": int(analysis.problem_detected),
+            "problem_type": analysis.problem_type,
+            "summary": analysis.summary,
+            "call_reason": stats.call_reason,
+            "user_sentiment": stats.user_sentiment,
+            "failure_description": stats.failure_description,
+            "user_questions": stats.user_questions,
+            "distilled_attributes": _LIST_SEPARATOR.join(analysis.distilled_attributes) or None,
+            "response_tokens": json.dumps(analysis.response_tokens) if analysis.response_tokens else None
+        }
+        columns = ", ".join(values)
+        placeholders = ", ".join(f":{name}" for name in values)
+        updates = ", ".join(f"{name} = excluded.{name}" for name in values if name not in ("call_id", "model"))
+
+        with self._lock, self._conn:
+            # Retire la contribution de l'analyse remplacée des agrégats
+            previous = self._conn.execute(
+                "SELECT id, timestamp, agent_id, problem_detected, user_sentiment FROM analyses WHERE call_id = ? AND model = ?",
+                (analysis.call_id, model)
+            ).fetchone()
+            if previous:
+                previous_tags = [row[0] for row in self._conn.execute(
+                    "SELECT tag FROM failure_reasons WHERE analysis_id = ?", (previous["id"],)
+                )]
+                self._update_rollups(
+                    previous["timestamp"], previous["agent_id"], model,
+                    rollup_metrics(bool(previous["problem_detected"]), previous_tags, previous["user_sentiment"]),
+                    -1
+                )
+            self._update_rollups(
+                timestamp, values["agent_id"], model,
+                rollup_metrics(analysis.problem_detected, sorted(set(stats.failure_reasons or [])), stats.user_sentiment),
+                1
+            )
+
+            analysis_id = self._conn.execute(
+                f"INSERT INTO analyses ({columns}) VALUES ({placeholders}) "
+                f"ON CONFLICT (call_id, model) DO UPDATE SET {updates} RETURNING id",
+                values
+            ).fetchone()[0]
+            self._conn.execute("DELETE FROM failure_reasons WHERE analysis_id = ?", (analysis_id,))
+            self._conn.execute("DELETE FROM call_tags WHERE analysis_id = ?", (analysis_id,))
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO failure_reasons (analysis_id, tag, position) VALUES (?, ?, ?)",
+                [(analysis_id, tag, position) for position, tag in enumerate(stats.failure_reasons or [])]
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO call_tags (analysis_id, tag, position) VALUES (?, ?, ?)",
+                [(analysis_id, tag, position) for position, tag in enumerate(stats.call_tags or [])]
+            )
+
+            # Index plein texte: transcript (commun à tous les modèles) et questions extraites
+            if request is not None and request.conversation:
+                self._index_document(analysis.call_id, "", "transcript", timestamp, normalize_transcript(request))
+            self._index_document(analysis.call_id, model, "user_questions", timestamp, stats.user_questions)
+
+        if previous:
+            return analysis_id
+        for listener in self._listeners:
+            try:
+                listener(analysis, model, request)
+            except Exception as e:
+                print(f"⚠️  Erreur dans un listener de la base de résultats: {e}")
+        return analysis_id
+
+    def _update_rollups(self, timestamp: str, agent_id: Optional[str], model: str, metrics: List[str], delta: int):
+        """Ajoute delta aux métriques de chaque granularité (à appeler sous verrou/transaction)."""
+        # Les anciennes lignes peuvent contenir un horodatage non normalisé (fuseau, suffixe Z)
+        bucket = normalize_timestamp(timestamp) or ""
+        self._conn.executemany(
+            "INSERT INTO rollups (granularity, bucket, agent_id, model, metric, value) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (granularity, bucket, agent_id, model, metric) DO UPDATE SET value = value + excluded.value",
+            [
+                (granularity, bucket[:length], agent_id or "", model, metric, delta)
+                for granularity, length in ROLLUP_GRANULARITIES.items()
+                for metric in metrics
+            ]
+        )
+
+    def rebuild_rollups(self):
+        """Recalcule entièrement les agrégats depuis les analyses (migration d'une base existante)."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM rollups")
+            rows = self._conn.execute(_SELECT_ANALYSES).fetchall()
+            for row in rows:
+                data = self._row_to_dict(row)
+                self._update_rollups(
+                    data["timestamp"], data["agent_id"], data["model"],
+                    rollup_metrics(data["problem_detected"], data["failure_reasons"], data["user_sentiment"]),
+                    1
+                )
+
+    def rollup_totals(self, since: Optional[str] = None) -> Dict[Tuple[str, str], Dict[str, int]]:
+        """Totaux journaliers depuis une date, par (agent_id, modèle): {métrique: valeur} (agent_id "" si inconnu)."""
+        conditions, params = ["granularity = 'day'"], []
+        if since:
+            conditions.append("bucket >= ?")
+            params.append(_bucket_bound(since, ROLLUP_GRANULARITIES["day"]))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT agent_id, model, metric, SUM(value) FROM rollups WHERE {' AND '.join(conditions)} "
+                "GROUP BY agent_id, model, metric",
+                params
+            ).fetchall()
+        totals: Dict[Tuple[str, str], Dict[str, int]] = {}
+        for agent_id, model, metric, value in rows:
+            totals.setdefault((agent_id, model), {})[metric] = value
+        return totals
+
+    def rollup_series(
+        self,
+        granularity: str = "day",
+        agent_id: Optional[str] = None,
+        model: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Série temporelle des agrégats (lecture en O(buckets)), tous agents/modèles confondus sauf filtre.
+
+        Chaque point contient calls, failed_calls, failure_rate, failures {tag: n} et sentiments {valeur: n}.
+        """
+        if granularity not in ROLLUP_GRANULARITIES:
+            raise ValueError(f"Granularité non supportée: {granularity}")
+        length = ROLLUP_GRANULARITIES[granularity]
+        conditions, params = ["granularity = ?"], [granularity]
+        if agent_id is not None:
+            conditions.append("agent_id = ?")
+            params.append(agent_id)
+        if model is not None:
+            conditions.append("model = ?")
+            params.append(model)
+        if since:
+            conditions.append("bucket >= ?")
+            params.append(_bucket_bound(since, length))
+        if until:
+            conditions.append("bucket <= ?")
+            params.append(_bucket_bound(until, length, end_of_day=True))
+
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT bucket, metric, SUM(value) FROM rollups WHERE {' AND '.join(conditions)} "
+                "GROUP BY bucket, metric HAVING SUM(value) != 0 ORDER BY bucket",
+                params
+            ).fetchall()
+
+        series: Dict[str, Dict[str, Any]] = {}
+        for bucket, metric, value in rows:
+            point = series.setdefault(bucket, {"bucket": bucket, "calls": 0, "failed_calls": 0, "failures": {}, "sentiments": {}})
+            if metric in ("calls", "failed_calls"):
+                point[metric] = value
+            elif metric.startswith("failure:"):
+                point["failures"][metric[len("failure:"):]] = value
+            elif metric.startswith("sentiment:"):
+                point["sentiments"][metric[len("sentiment:"):]] = value
+        for point in series.values():
+            point["failure_rate"] = point["failed_calls"] / point["calls"] if point["calls"] else 0.0
+        return list(series.values())
+
+    def _index_document(self, call_id: str, model: str, source: str, timestamp: str, content: Optional[str]):
+        """Ajoute ou remplace un document dans l'index plein texte (à appeler sous verrou/transaction)."""
+        row = self._conn.execute(
+            "SELECT id FROM search_documents WHERE call_id = ? AND model = ? AND source = ?",
+            (call_id, model, source)
+        ).fetchone()
+        if row:
+            self._conn.execute("DELETE FROM search_index WHERE rowid = ?", (row[0],))
+            if not content:
+                self._conn.execute("DELETE FROM search_documents WHERE id = ?", (row[0],))
+                return
+            document_id = row[0]
+            self._conn.execute("UPDATE search_documents SET timestamp = ? WHERE id = ?", (timestamp, document_id))
+        elif not content:
+            return
+        else:
+            document_id = self._conn.execute(
+                "INSERT INTO search_documents (call_id, model, source, timestamp) VALUES (?, ?, ?, ?)",
+                (call_id, model, source, timestamp)
+            ).lastrowid
+        self._conn.execute("INSERT INTO search_index (rowid, content) VALUES (?, ?)", (document_id, content))
+
+    def search(self, text: str, source: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        """Recherche plein texte classée (bm25) dans les transcripts et les questions extraites.
+
+        Args:
+            text: Mots recherchés (tous requis, insensible aux accents, préfixes acceptés)
+            source: "transcript" ou "user_questions" (toutes les sources par défaut)
+            limit: Nombre maximum de résultats
+        """
+        fts_query = to_fts_query(text)
+        if not fts_query:
+            return []
+        sql = (
+            "SELECT d.call_id, d.model, d.source, d.timestamp, "
+            "snippet(search_index, 0, '[', ']', '…', 12) AS snippet, bm25(search_index) AS score "
+            "FROM search_index JOIN search_documents d ON d.id = search_index.rowid "
+            "WHERE search_index MATCH ?"
+        )
+        params: list = [fts_query]
+        if source:
+            sql += " AND d.source = ?"
+            params.append(source)
+        sql += " ORDER BY score LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def labelled_transcripts(
+        self,
+        attribute: str,
+        model: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Transcripts indexés et valeur extraite d'un attribut select (exemples d'entraînement).
+
+        Les valeurs prédites par un classifieur distillé sont exclues: le classifieur ne doit
+        pas être réentraîné sur ses propres prédictions.
+
+        Returns:
+            Liste de {"call_id", "model", "timestamp", "transcript", "label"} (analyses sans valeur exclues)
+        """
+        if attribute not in ("call_reason", "user_sentiment"):
+            raise ValueError(f"Attribut non stocké en colonne: {attribute}")
+        sql = (
+            f"SELECT a.call_id, a.model, a.timestamp, s.content AS transcript, a.{attribute} AS label "
+            "FROM analyses a "
+            "JOIN search_documents d ON d.call_id = a.call_id AND d.model = '' AND d.source = 'transcript' "
+            "JOIN search_index s ON s.rowid = d.id "
+            f"WHERE a.{attribute} IS NOT NULL "
+            "AND instr(:sep || COALESCE(a.distilled_attributes, '') || :sep, :sep || :attribute || :sep) = 0"
+        )
+        params: dict = {"sep": _LIST_SEPARATOR, "attribute": attribute}
+        if model:
+            sql += " AND a.model = :model"
+            params["model"] = model
+        if since:
+            sql += " AND a.timestamp >= :since"
+            params["since"] = since
+        if until:
+            sql += " AND a.timestamp <= :until"
+            params["until"] = until + "T23:59:59" if len(until) == 10 else until
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def query(
+        self,
+        call_id: Optional[str] = None,
+        model: Optional[str] = None,
+        agent_id: Optional[str] = None,
+        failure_tag: Optional[str] = None,
+        call_tag: Optional[str] = None,
+        sentiment: Optional[str] = None,
+        call_reason: Optional[str] = None,
+        problem_detected: Optional[bool] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        limit: Optional[int] = 100
+    ) -> List[Dict[str, Any]]:
+        """Recherche des analyses (filtres combinés en ET), les plus récentes d'abord.
+
+        since/until s'appliquent à l'horodatage de l'appel (ou de l'analyse à défaut), bornes incluses.
+        """
+        conditions, params = self._filters(
+            call_id=call_id, model=model, agent_id=agent_id, failure_tag=failure_tag, call_tag=call_tag,
+            sentiment=sentiment, call_reason=call_reason, problem_detected=problem_detected, since=since, until=until
+        )
+
+        sql = _SELECT_ANALYSES
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY a.timestamp DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def analysis_columns(self, since: Optional[str] = None, until: Optional[str] = None,
+                         model: Optional[str] = None) -> Dict[str, list]:
+        """Données brutes des analyses filtrées, pour les agrégats vectorisés (une requête par table).
+
+        Returns:
+            {"rows": [(id, call_reason, user_sentiment, model, agent_id, timestamp)] par id croissant,
+             "failure_reasons"/"call_tags": [(analysis_id, tag)]}
+        """
+        conditions, params = self._filters(model=model, since=since, until=until)
+        where = (" WHERE " + " AND ".join(conditions)) if conditions else ""
+        with self._lock:
+            data = {"rows": [tuple(row) for row in self._conn.execute(
+                f"SELECT a.id, a.call_reason, a.user_sentiment, a.model, a.agent_id, a.timestamp FROM analyses a{where} ORDER BY a.id",
+                params
+            )]}
+            for table in _TAG_TABLES:
+                data[table] = [tuple(row) for row in self._conn.execute(
+                    f"SELECT analysis_id, tag FROM {table} WHERE analysis_id IN (SELECT a.id FROM analyses a{where}) "
+                    "ORDER BY analysis_id, position, rowid",
+                    params
+                )]
+        return data
+
+    @staticmethod
+    def _filters(
+        call_id: Optional[str] = None,
+        model: Optional[str] = None,
+        agent_id: Optional[str] = None,
+        failure_tag: Optional[str] = None,
+        call_tag: Optional[str] = None,
+        sentiment: Optional[str] = None,
+        call_reason: Optional[str] = None,
+        problem_detected: Optional[bool] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None
+    ) -> tuple:
+        """Conditions SQL (sur l'alias a de la table analyses) et paramètres des filtres de recherche."""
+        conditions, params = [], []
+        for column, value in (
+            ("a.call_id", call_id),
+            ("a.model", model),
+            ("a.agent_id", agent_id),
+            ("a.user_sentiment", sentiment),
+            ("a.call_reason", call_reason)
+        ):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if problem_detected is not None:
+            conditions.append("a.problem_detected = ?")
+            params.append(int(problem_detected))
+        if since:
+            conditions.append("a.timestamp >= ?")
+            params.append(since)
+        if until:
+            # Une date seule inclut toute la journée
+            conditions.append("a.timestamp <= ?")
+            params.append(until + "T23:59:59" if len(until) == 10 else until)
+        if failure_tag:
+            conditions.append("a.id IN (SELECT analysis_id FROM failure_reasons WHERE tag = ?)")
+            params.append(failure_tag)
+        if call_tag:
+            conditions.append("a.id IN (SELECT analysis_id FROM call_tags WHERE tag = ?)")
+            params.append(call_tag)
+        return conditions, params
+
+    def get(self, call_id: str, model: str) -> Optional[Dict[str, Any]]:
+        """Retourne l'analyse stockée pour un couple call_id × modèle."""
+        rows = self.query(call_id=call_id, model=model, limit=1)
+        return rows[0] if rows else None
+
+    def has_result(self, call_id: str, model: str, config_hash: Optional[str] = None) -> bool:
+        """Indique si l'appel a déjà été analysé avec ce modèle (et cette configuration si fournie)."""
+        sql = "SELECT 1 FROM analyses WHERE call_id = ? AND model = ?"
+        params = [call_id, model]
+        if config_hash:
+            sql += " AND config_hash = ?"
+            params.append(config_hash)
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone() is not None
+
+    def get_analysis(self, call_id: str, model: str, config_hash: Optional[str] = None) -> Optional[DetailedAnalysis]:
+        """Reconstruit la DetailedAnalysis stockée (None si absente ou d'une autre configuration)."""
+        row = self.get(call_id, model)
+        if not row or (config_hash and row["config_hash"] != config_hash):
+            return None
+        statistics = CallStatistics(
+            call_reason=row["call_reason"],
+            user_questions=row["user_questions"],
+            user_sentiment=row["user_sentiment"],
+            failure_reasons=row["failure_reasons"] or None,
+            failure_description=row["failure_description"],
+            call_tags=row["call_tags"]
+        )
+        return DetailedAnalysis(
+            call_id=row["call_id"],
+            problem_type=row["problem_type"] or "none",
+            problem_detected=row["problem_detected"],
+            steps=[],
+            tags=row["failure_reasons"],
+            summary=row["summary"] or "",
+            recommendations=[],
+            confidence=None,
+            statistics=statistics,
+            distilled_attributes=row["distilled_attributes"],
+            response_tokens=row["response_tokens"]
+        )
+
+    def get_record(self, call_id: str, model: str) -> Optional[dict]:
+        """Retourne l'analyse stockée au format result_records (pour les sorties CSV/Parquet)."""
+        row = self.get(call_id, model)
+        if not row:
+            return None
+        return {
+            "call_id": row["call_id"],
+            "model_used": row["model"],
+            "analyzed_at": datetime.fromisoformat(row["analyzed_at"]),
+            "call_reason": row["call_reason"],
+            "user_sentiment": row["user_sentiment"],
+            "failure_reasons": row["failure_reasons"] or None,
+            "failure_description": row["failure_description"],
+            "user_questions": row["user_questions"],
+            "call_tags": row["call_tags"],
+            "problem_detected": row["problem_detected"],
+            "missing_attributes": [],
+            "error": None
+        }
+
+    def count(self) -> int:
+        """Nombre d'analyses stockées."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        data = dict(row)
+        data["problem_detected"] = bool(data["problem_detected"])
+        for key in _TAG_TABLES + ("distilled_attributes",):
+            data[key] = data[key].split(_LIST_SEPARATOR) if data[key] else []
+        data["response_tokens"] = json.loads(data["response_tokens"]) if data.get("response_tokens") else {}
+        return data
+
+
+if __name__ == "__main__":
+    import argparse
+    from config import Config
+
+    parser = argparse.ArgumentParser(description="Interroge la base des résultats d'analyse")
+    parser.add_argument("--db", default=Config.RESULTS_DB_PATH, help="Chemin de la base SQLite")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    query_parser = subparsers.add_parser("query", help="Recherche des analyses")
+    query_parser.add_argument("--call-id", default=None)
+    query_parser.add_argument("--model", default=None)
+    query_parser.add_argument("--agent", default=None, help="agent_id")
+    query_parser.add_argument("--failure-tag", default=None, help="Tag d'erreur (ex: patient_non_trouve)")
+    query_parser.add_argument("--call-tag", default=None, help="Tag de suivi (ex: anticoagulants)")
+    query_parser.add_argument("--sentiment", default=None)
+    query_parser.add_argument("--reason", default=None, help="Motif de l'appel")
+    query_parser.add_argument("--since", default=None, help="Date/heure minimale (ISO)")
+    query_parser.add_argument("--until", default=None, help="Date/heure maximale (ISO)")
+    query_parser.add_argument("--limit", type=int, default=50)
+    query_parser.add_argument("--json", action="store_true", help="Sortie JSON complète")
+
+    search_parser = subparsers.add_parser("search", help="Recherche plein texte (transcripts et questions)")
+    search_parser.add_argument("text", help="Mots recherchés (ex: anticoagulant)")
+    search_parser.add_argument("--source", choices=SEARCH_SOURCES, default=None)
+    search_parser.add_argument("--limit", type=int, default=20)
+
+    trends_parser = subparsers.add_parser("trends", help="Taux d'échec et sentiments par heure ou par jour")
+    trends_parser.add_argument("--granularity", choices=list(ROLLUP_GRANULARITIES), default="day")
+    trends_parser.add_argument("--agent", default=None, help="agent_id")
+    trends_parser.add_argument("--model", default=None)
+    trends_parser.add_argument("--since", default=None)
+    trends_parser.add_argument("--until", default=None)
+
+    subparsers.add_parser("rebuild-rollups", help="Recalcule les agrégats horaires et journaliers")
+
+    subparsers.add_parser("count", help="Nombre d'analyses stockées")
+
+    args = parser.parse_args()
+    if not args.db:
+        parser.error("Chemin de base manquant (--db ou RESULTS_DB_PATH)")
+    db = ResultsDatabase(args.db)
+
+    if args.command == "count":
+        print(db.count())
+    elif args.command == "rebuild-rollups":
+        db.rebuild_rollups()
+        print("✅ Agrégats recalculés")
+    elif args.command == "trends":
+        for point in db.rollup_series(args.granularity, agent_id=args.agent, model=args.model, since=args.since, until=args.until):
+            top = ", ".join(f"{tag}={n}" for tag, n in sorted(point["failures"].items(), key=lambda item: -item[1])[:3] if n)
+            print(f"{point['bucket']:<14} {point['calls']:>7} appels  {point['failure_rate']:6.1%} en échec  {top}")
+    elif args.command == "search":
+        hits = db.search(args.text, source=args.source, limit=args.limit)
+        for hit in hits:
+            print(f"{hit['timestamp'] or '-'}  {hit['call_id']}  [{hit['source']}]  {hit['snippet']}")
+        print(f"🔎 {len(hits)} résultat(s)")
+    else:
+        results = db.query(
+            call_id=args.call_id,
+            model=args.model,
+            agent_id=args.agent,
+            failure_tag=args.failure_tag,
+            call_tag=args.call_tag,
+            sentiment=args.sentiment,
+            call_reason=args.reason,
+            since=args.since,
+            until=args.until,
+            limit=args.limit
+        )
+        if args.json:
+            print(json.dumps(results, indent=2, ensure_ascii=False))
+        else:
+            for row in results:
+                errors = ", ".join(row["failure_reasons"]) or "-"
+                print(f"{row['timestamp']}  {row['call_id']}  {row['model']:<16} {row['agent_id'] or '-':<12} {row['call_reason'] or '-':<22} {row['user_sentiment'] or '-':<10} {errors}")
+            print(f"📊 {len(results)} résultat(s)")
@@ -0,0 +1,175 @@
+"""Stockage colonnaire (Parquet) des résultats d'analyse, partitionné par date et modèle."""
+import csv
+import uuid
+from datetime import datetime
+from typing import Iterable, List, Optional
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+# Schéma des enregistrements (voir result_records.build_result_record)
+RESULT_SCHEMA = pa.schema([
+    ("call_id", pa.string()),
+    ("analyzed_at", pa.timestamp("us")),
+    ("call_reason", pa.string()),
+    ("user_sentiment", pa.string()),
+    ("failure_reasons", pa.list_(pa.string())),
+    ("failure_description", pa.string()),
+    ("user_questions", pa.string()),
+    ("call_tags", pa.list_(pa.string())),
+    ("problem_detected", pa.bool_()),
+    ("missing_attributes", pa.list_(pa.string())),  # Analyse partielle: attributs non extraits
+    ("error", pa.string()),
+    # Colonnes de partition (répertoires hive analysis_date=.../model_used=...)
+    ("analysis_date", pa.string()),
+    ("model_used", pa.string())
+])
+
+PARTITIONING = ds.partitioning(
+    pa.schema([("analysis_date", pa.string()), ("model_used", pa.string())]),
+    flavor="hive"
+)
+
+
+class ColumnarResultsStore:
+    """Dataset Parquet des résultats, lisible avec projection de colonnes et filtres poussés.
+
+    Chaque écriture ajoute de nouveaux fichiers sans réécrire les partitions existantes.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def write(self, records: Iterable[dict]) -> int:
+        """Ajoute des enregistrements au dataset. Retourne le nombre de lignes écrites."""
+        rows = []
+        for record in records:
+            row = {name: record.get(name) for name in RESULT_SCHEMA.names}
+            row["analysis_date"] = record["analyzed_at"].strftime("%Y-%m-%d")
+            rows.append(row)
+        if not rows:
+            return 0
+
+        table = pa.Table.from_pylist(rows, schema=RESULT_SCHEMA)
+        ds.write_dataset(
+            table,
+            self.root,
+            format="parquet",
+            partitioning=PARTITIONING,
+            basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore"
+        )
+        return len(rows)
+
+    def dataset(self) -> ds.Dataset:
+        """Dataset pyarrow brut (pour des requêtes personnalisées)."""
+        return ds.dataset(self.root, format="parquet", partitioning=PARTITIONING, schema=RESULT_SCHEMA)
+
+    def read(
+        self,
+        columns: Optional[List[str]] = None,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        models: Optional[List[str]] = None,
+        filter: Optional[ds.Expression] = None
+    ) -> pa.Table:
+        """Lit le dataset en ne parcourant que les colonnes et partitions nécessaires.
+
+        Args:
+            columns: Colonnes à charger (toutes par défaut)
+            start_date: Date d'analyse minimale incluse (YYYY-MM-DD)
+            end_date: Date d'analyse maximale incluse (YYYY-MM-DD)
+            models: Modèles à conserver
+            filter: Expression pyarrow supplémentaire (ex: ds.field("call_reason") == "book_appointment")
+        """
+        expression = filter
+        if start_date:
+            expression = _and(expression, ds.field("analysis_date") >= start_date)
+        if end_date:
+            expression = _and(expression, ds.field("analysis_date") <= end_date)
+        if models:
+            expression = _and(expression, ds.field("model_used").isin(models))
+        return self.dataset().to_table(columns=columns, filter=expression)
+
+    def import_csv(self, csv_path: str, analyzed_at: Optional[datetime] = None) -> int:
+        """Importe un ancien fichier analysis_results_*.csv (listes séparées par "; ")."""
+        if analyzed_at is None:
+            analyzed_at = _timestamp_from_filename(csv_path) or datetime.now()
+
+        records = []
+        with open(csv_path, newline='', encoding='utf-8') as csvfile:
+            for row in csv.DictReader(csvfile):
+                if row.get("call_reason") == "ERROR":
+                    records.append({
+                        "call_id": row["call_id"],
+                        "model_used": row["model_used"],
+                        "analyzed_at": analyzed_at,
+                        "error": row.get("failure_description") or "ERROR"
+                    })
+                    continue
+                failure_reasons = _split_list_field(row.get("failure_reasons"))
+                records.append({
+                    "call_id": row["call_id"],
+                    "model_used": row["model_used"],
+                    "analyzed_at": analyzed_at,
+                    "call_reason": row.get("call_reason") or None,
+                    "user_sentiment": row.get("user_sentiment") or None,
+                    "failure_reasons": failure_reasons,
+                    "failure_description": row.get("failure_description") or None,
+                    "user_questions": row.get("user_questions") or None,
+                    "call_tags": _split_list_field(row.get("call_tags")) or [],
+                    "problem_detected": bool(failure_reasons),
+                    "missing_attributes": _split_list_field(row.get("missing_attributes")) or [],
+                    "error": None
+                })
+        return self.write(records)
+
+
+def _and(left: Optional[ds.Expression], right: ds.Expression) -> ds.Expression:
+    return right if left is None else left & right
+
+
+def _split_list_field(value: Optional[str]) -> Optional[list]:
+    """Inverse de format_list_field (None si la cellule est vide)."""
+    if not value:
+        return None
+    return [item.strip() for item in value.split(";") if item.strip()]
+
+
+def _timestamp_from_filename(path: str) -> Optional[datetime]:
+    """Extrait le timestamp d'un nom analysis_results_YYYYMMDD_HHMMSS.csv."""
+    stem = path.rsplit("/", 1)[-1].rsplit(".", 1)[0]
+    try:
+        return datetime.strptime(stem[-15:], "%Y%m%d_%H%M%S")
+    except ValueError:
+        return None
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Dataset colonnaire des résultats d'analyse")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import-csv", help="Importe des CSV analysis_results_*.csv")
+    import_parser.add_argument("root", help="Répertoire du dataset")
+    import_parser.add_argument("csv_files", nargs="+", help="Fichiers CSV à importer")
+
+    summary_parser = subparsers.add_parser("summary", help="Nombre de résultats par date et modèle")
+    summary_parser.add_argument("root", help="Répertoire du dataset")
+    summary_parser.add_argument("--start", default=None, help="Date minimale (YYYY-MM-DD)")
+    summary_parser.add_argument("--end", default=None, help="Date maximale (YYYY-MM-DD)")
+    summary_parser.add_argument("--model", action="append", default=None, help="Filtre sur le modèle (répétable)")
+
+    args = parser.parse_args()
+    store = ColumnarResultsStore(args.root)
+
+    if args.command == "import-csv":
+        for csv_file in args.csv_files:
+            count = store.import_csv(csv_file)
+            print(f"✅ {csv_file}: {count} résultats importés")
+    else:
+        table = store.read(columns=["analysis_date", "model_used"], start_date=args.start, end_date=args.end, models=args.model)
+        counts = table.group_by(["analysis_date", "model_used"]).aggregate([("model_used", "count")])
+        for row in sorted(counts.to_pylist(), key=lambda r: (r["analysis_date"], r["model_used"])):
+            print(f"{row['analysis_date']}  {row['model_used']:<20} {row['model_used_count']}")
+        print(f"📊 Total: {table.num_rows} résultats")
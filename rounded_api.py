@@ -1,8 +1,8 @@
 """Client API pour Call Rounded."""
-import requests
 import json
 from typing import Optional, Dict, Any
 from config import Config
+from client_registry import get_registry
 
 
 class RoundedAPIClient:
@@ -11,14 +11,16 @@ class RoundedAPIClient:
     def __init__(self):
         self.api_key = Config.ROUNDED_API_KEY
         self.base_url = Config.ROUNDED_API_URL
+        # Session keep-alive partagée entre toutes les instances
+        self.session = get_registry().get_http_session("rounded")
     
-    def get_call(self, call_id: str) -> Optional[Dict[str, Any]]:
-        """Récupère les détails d'un appel."""
+    def get_call(self, call_id: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Récupère les détails d'un appel (timeout en secondes, Config.HTTP_TIMEOUT_SECONDS par défaut)."""
         url = f"{self.base_url}/{call_id}"
         headers = {"X-Api-Key": self.api_key}
         
         try:
-            response = requests.get(url, headers=headers)
+            response = self.session.get(url, headers=headers, timeout=timeout or Config.HTTP_TIMEOUT_SECONDS)
             response.raise_for_status()
             return response.json()
         except Exception as e:
@@ -32,7 +34,7 @@ class RoundedAPIClient:
         params = {"limit": limit}
         
         try:
-            response = requests.get(url, headers=headers, params=params)
+            response = self.session.get(url, headers=headers, params=params, timeout=Config.HTTP_TIMEOUT_SECONDS)
             response.raise_for_status()
             return response.json()
         except Exception as e:
@@ -114,7 +116,7 @@ class RoundedAPIClient:
                                     tool_calls_indexed[tool_call_id]["error"] = error_message
         
         # Extraction des métadonnées
-        metadata = call_data.get("metadata", {})
+        metadata = call_data.get("metadata") or {}
         
         # Calcul de la durée
         duration = call_data.get("duration_seconds")
@@ -122,8 +124,14 @@ class RoundedAPIClient:
         # Statut
         status = call_data.get("status") or raw_call_data.get("status")
         
+        # Agent et horodatage de l'appel
+        agent_id = call_data.get("agent_id") or call_data.get("agentId") or metadata.get("agent_id")
+        started_at = call_data.get("start_time") or call_data.get("created_at") or metadata.get("timestamp")
+        
         return {
             "call_id": call_id,
+            "agent_id": agent_id,
+            "started_at": started_at,
             "metadata": metadata,
             "transcript": transcript,
             "tools": tools,
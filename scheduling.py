@@ -0,0 +1,118 @@
+"""Ordonnancement des analyses: appels suspects d'échec en premier, avec équité entre agents.
+
+La priorité d'un appel est calculée à partir de signaux peu coûteux, déjà disponibles une fois
+l'appel récupéré (outils en échec, "erreur"/"échec" dans les tours, statut, durée), pondérés par
+Config.SCHEDULER_WEIGHTS. Pour qu'un agent très bruyant n'affame pas les autres, chaque analyse
+d'avance d'un agent sur l'agent le moins servi lui retire Config.SCHEDULER_FAIRNESS points.
+"""
+import heapq
+import itertools
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+from config import Config
+from models import CallAnalysisRequest
+
+
+def mentions_error(content: str) -> bool:
+    """Vrai si un tour mentionne une erreur ou un échec."""
+    content = content.lower()
+    return "erreur" in content or "échec" in content
+
+
+def failure_signals(request: CallAnalysisRequest) -> dict:
+    """Signaux d'échec d'un appel (sans appel LLM)."""
+    status = (request.metadata.status or "").strip().lower() if request.metadata else ""
+    return {
+        "failed_tools": sum(1 for tool in request.tool_results if not tool.success),
+        "error_mentions": sum(1 for turn in request.conversation if mentions_error(turn.content)),
+        "failed_status": status in Config.SCHEDULER_FAILED_STATUSES or (status.isdigit() and int(status) >= 400),
+        "duration": request.metadata.duration if request.metadata else None
+    }
+
+
+def has_failure_signals(signals: dict) -> bool:
+    """Vrai si un outil a échoué ou si un tour mentionne une erreur (indication donnée au LLM)."""
+    return bool(signals["failed_tools"] or signals["error_mentions"])
+
+
+def priority_score(request: CallAnalysisRequest, signals: Optional[dict] = None) -> float:
+    """Priorité d'analyse d'un appel (plus élevée = analysé plus tôt)."""
+    signals = signals or failure_signals(request)
+    weights = Config.SCHEDULER_WEIGHTS
+    score = weights.get("failed_tool", 0) * signals["failed_tools"]
+    score += weights.get("error_mention", 0) * min(signals["error_mentions"], Config.SCHEDULER_MAX_ERROR_MENTIONS)
+    if signals["failed_status"]:
+        score += weights.get("failed_status", 0)
+    if signals["duration"] and signals["duration"] >= Config.SCHEDULER_LONG_CALL_SECONDS:
+        score += weights.get("long_call", 0)
+    return float(score)
+
+
+def agent_of(request: CallAnalysisRequest) -> str:
+    """Clé d'équité d'un appel: son agent (chaîne vide si inconnu)."""
+    return (request.metadata.agent_id if request.metadata else None) or ""
+
+
+def fair_choice(heads: Dict[Hashable, Tuple[float, int]], served: Dict[Hashable, int], fairness: float) -> Hashable:
+    """Groupe dont l'élément de tête doit passer en premier.
+
+    Args:
+        heads: {groupe: (priorité, rang d'arrivée)} de l'élément de tête de chaque groupe
+        served: Éléments déjà servis (ou en cours) par groupe
+        fairness: Points retirés par élément d'avance sur le groupe le moins servi
+    """
+    least_served = min(served.get(group, 0) for group in heads)
+
+    def rank(group):
+        priority, sequence = heads[group]
+        return (priority - fairness * (served.get(group, 0) - least_served), -sequence)
+
+    return max(heads, key=rank)
+
+
+class FairPriorityQueue:
+    """File bornée thread-safe servant l'élément le plus prioritaire, avec équité entre groupes.
+
+    Même interface put/get que queue.Queue; key(élément) retourne (priorité, groupe).
+    À priorité égale, l'ordre d'arrivée est conservé.
+    """
+
+    def __init__(self, key: Callable[[Any], Tuple[float, Hashable]], maxsize: int = 0, fairness: Optional[float] = None):
+        self.key = key
+        self.maxsize = maxsize
+        self.fairness = Config.SCHEDULER_FAIRNESS if fairness is None else fairness
+        self._heaps: Dict[Hashable, list] = {}
+        self._served: Dict[Hashable, int] = {}
+        self._size = 0
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    def put(self, item: Any):
+        priority, group = self.key(item)
+        with self._condition:
+            while self.maxsize > 0 and self._size >= self.maxsize:
+                self._condition.wait()
+            if not self._heaps.get(group):
+                # Un groupe qui (re)devient actif repart au niveau du moins servi: pas de crédit accumulé
+                active = [self._served.get(other, 0) for other, heap in self._heaps.items() if heap]
+                if active:
+                    self._served[group] = max(self._served.get(group, 0), min(active))
+            heapq.heappush(self._heaps.setdefault(group, []), (-priority, next(self._sequence), item))
+            self._size += 1
+            self._condition.notify_all()
+
+    def get(self) -> Any:
+        with self._condition:
+            while self._size == 0:
+                self._condition.wait()
+            heads = {group: (-heap[0][0], heap[0][1]) for group, heap in self._heaps.items() if heap}
+            group = fair_choice(heads, self._served, self.fairness)
+            _, _, item = heapq.heappop(self._heaps[group])
+            self._served[group] = self._served.get(group, 0) + 1
+            self._size -= 1
+            self._condition.notify_all()
+            return item
+
+    def qsize(self) -> int:
+        with self._condition:
+            return self._size
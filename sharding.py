@@ -0,0 +1,108 @@
+"""Exécution partitionnée du batch: répartition stable des appels en shards et fichiers partiels.
+
+Chaque appel est attribué à un shard d'après un hash stable de son call_id (indépendant du
+process, de l'ordre de la liste et de PYTHONHASHSEED): N process ou machines peuvent donc
+traiter chacun leur shard sans coordination, puis les fichiers partiels sont fusionnés.
+
+Les fichiers partiels sont au format JSON Lines et conservent les enregistrements complets
+(listes natives, date d'analyse, problem_detected) pour que la fusion puisse produire aussi
+bien le CSV que le dataset colonnaire.
+"""
+import glob
+import hashlib
+import json
+import os
+from datetime import datetime
+from typing import Iterable, List
+
+
+def shard_of(call_id: str, num_shards: int) -> int:
+    """Numéro de shard (0..num_shards-1) d'un appel."""
+    digest = hashlib.sha256(call_id.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % num_shards
+
+
+def select_shard(call_ids: Iterable[str], shard_index: int, num_shards: int) -> List[str]:
+    """Appels du shard demandé (ordre d'origine conservé)."""
+    if num_shards < 1 or not 0 <= shard_index < num_shards:
+        raise ValueError(f"Shard invalide: {shard_index}/{num_shards}")
+    return [call_id for call_id in call_ids if shard_of(call_id, num_shards) == shard_index]
+
+
+def part_filename(run_id: str, shard_index: int, num_shards: int, directory: str = ".") -> str:
+    """Chemin du fichier partiel d'un shard, ex: analysis_results_20250101_120000.part-002-of-008.jsonl"""
+    return os.path.join(directory, f"{run_id}.part-{shard_index:03d}-of-{num_shards:03d}.jsonl")
+
+
+def part_files(run_id: str, directory: str = ".") -> List[str]:
+    """Fichiers partiels existants d'une exécution (triés par shard)."""
+    return sorted(glob.glob(os.path.join(directory, f"{run_id}.part-*-of-*.jsonl")))
+
+
+def resolve_parts(arguments: Iterable[str]) -> List[str]:
+    """Fichiers partiels désignés par chemin ou par identifiant d'exécution (chemin/run-id)."""
+    paths = []
+    for argument in arguments:
+        if os.path.isfile(argument):
+            paths.append(argument)
+            continue
+        found = part_files(os.path.basename(argument), os.path.dirname(argument) or ".")
+        if not found:
+            raise FileNotFoundError(f"Aucun fichier partiel pour {argument}")
+        paths.extend(found)
+    return paths
+
+
+def write_part(records: Iterable[dict], path: str) -> int:
+    """Écrit les enregistrements d'un shard (écriture atomique: fichier temporaire puis renommage)."""
+    count = 0
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for record in records:
+            row = dict(record)
+            if isinstance(row.get("analyzed_at"), datetime):
+                row["analyzed_at"] = row["analyzed_at"].isoformat()
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            count += 1
+    os.replace(tmp_path, path)
+    return count
+
+
+def read_part(path: str) -> List[dict]:
+    """Relit un fichier partiel (analyzed_at redevient un datetime)."""
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.get("analyzed_at"):
+                record["analyzed_at"] = datetime.fromisoformat(record["analyzed_at"])
+            records.append(record)
+    return records
+
+
+def _rank(record: dict) -> tuple:
+    """Ordre de préférence d'un enregistrement: réussi, complet, puis le plus récent."""
+    return (not record.get("error"), not record.get("missing_attributes"), record.get("analyzed_at") or datetime.min)
+
+
+def merge_records(records: Iterable[dict]) -> tuple:
+    """Déduplique sur (call_id, model_used).
+
+    Un résultat complet l'emporte sur un résultat partiel (échéance atteinte), lui-même préféré
+    à une erreur (ex: shard relancé après un échec), puis le plus récent.
+    Retourne (enregistrements retenus, nombre de doublons écartés).
+    """
+    best = {}
+    duplicates = 0
+    for record in records:
+        key = (record["call_id"], record["model_used"])
+        current = best.get(key)
+        if current is None:
+            best[key] = record
+            continue
+        duplicates += 1
+        if _rank(record) > _rank(current):
+            best[key] = record
+    return list(best.values()), duplicates
@@ -0,0 +1,70 @@
+"""Regroupement des traitements identiques simultanés (single-flight)."""
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class SingleFlight:
+    """Exécute une seule fois un traitement demandé en parallèle sous la même clé.
+
+    Le premier appelant exécute la fonction; ceux qui arrivent pendant l'exécution attendent
+    et reçoivent le même résultat (ou la même exception). Rien n'est conservé après la fin:
+    un appel ultérieur avec la même clé relance le traitement.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, Tuple[Future, Any]] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, on_wait: Optional[Callable[[], None]] = None,
+           timeout: Optional[float] = None, context: Any = None, join: Optional[Callable[[Any], bool]] = None,
+           **kwargs) -> Tuple[Any, bool]:
+        """Exécute fn(*args, **kwargs) ou attend l'exécution en cours pour la même clé.
+
+        Args:
+            key: Clé identifiant le traitement
+            fn: Fonction à exécuter
+            on_wait: Appelée (avant l'attente) si un traitement identique est déjà en cours
+            timeout: Attente maximale du résultat d'une exécution en cours (None: illimitée)
+            context: Donnée associée à l'exécution lancée par cet appel (ex: son échéance)
+            join: Reçoit le context de l'exécution en cours; si elle retourne False, fn est exécutée
+                séparément, sans être partagée
+
+        Returns:
+            (résultat, partagé) - partagé vaut True si le résultat vient d'une exécution concurrente
+
+        Raises:
+            concurrent.futures.TimeoutError: si l'exécution en cours ne se termine pas dans `timeout`
+        """
+        with self._lock:
+            entry = self._in_flight.get(key)
+            leader = entry is None
+            if leader:
+                future = Future()
+                self._in_flight[key] = (future, context)
+            else:
+                future, leader_context = entry
+
+        if not leader:
+            if join is not None and not join(leader_context):
+                return fn(*args, **kwargs), False
+            if on_wait:
+                on_wait()
+            return future.result(timeout=timeout), True
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def in_flight(self) -> int:
+        """Nombre de traitements en cours."""
+        with self._lock:
+            return len(self._in_flight)
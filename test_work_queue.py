@@ -0,0 +1,197 @@
+"""Tests de la file de travail: baux, fencing, nouvelles tentatives et dead-letter.
+
+Lancement: python -m pytest test_work_queue.py (ou python -m unittest test_work_queue)
+"""
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from work_queue import DEAD, DONE, LEASED, PENDING, SQLiteWorkQueue, WorkQueue, run_worker
+
+
+class WorkQueueTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.queue = self.make_queue()
+
+    def tearDown(self):
+        self.queue.close()
+        self.directory.cleanup()
+
+    def make_queue(self, **kwargs) -> SQLiteWorkQueue:
+        options = {"max_attempts": 3, "lease_seconds": 60, "retry_delay": 0}
+        options.update(kwargs)
+        return SQLiteWorkQueue(os.path.join(self.directory.name, "queue.db"), **options)
+
+    def status(self, queue: SQLiteWorkQueue, call_id: str) -> str:
+        return queue._conn.execute("SELECT status FROM jobs WHERE call_id = ?", (call_id,)).fetchone()[0]
+
+
+class LeaseTest(WorkQueueTestCase):
+
+    def test_contract_is_abstract(self):
+        with self.assertRaises(TypeError):
+            WorkQueue()
+
+    def test_enqueue_ignores_duplicates(self):
+        self.assertEqual(self.queue.enqueue([("c1", "m"), ("c1", "m"), ("c2", "m")]), 2)
+        self.assertEqual(self.queue.enqueue([("c1", "m")]), 0)
+        self.assertEqual(self.queue.stats()[PENDING], 2)
+
+    def test_leased_job_is_invisible_to_other_workers(self):
+        self.queue.enqueue([("c1", "m")])
+        jobs = self.queue.lease("w1")
+        self.assertEqual([job.call_id for job in jobs], ["c1"])
+        self.assertEqual(jobs[0].attempts, 1)
+        self.assertEqual(self.queue.lease("w2"), [])
+
+    def test_concurrent_workers_never_share_a_job(self):
+        self.queue.enqueue([(f"c{i}", "m") for i in range(40)])
+        leased, lock = [], threading.Lock()
+
+        def worker(number):
+            queue = self.make_queue()
+            try:
+                while True:
+                    jobs = queue.lease(f"w{number}")
+                    if not jobs:
+                        return
+                    with lock:
+                        leased.append(jobs[0].call_id)
+            finally:
+                queue.close()
+
+        threads = [threading.Thread(target=worker, args=(number,)) for number in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(leased), sorted(f"c{i}" for i in range(40)))
+
+    def test_expired_lease_is_taken_over(self):
+        self.queue.enqueue([("c1", "m")])
+        first = self.queue.lease("w1", lease_seconds=0.05)[0]
+        time.sleep(0.1)
+        second = self.queue.lease("w2")[0]
+        self.assertEqual(second.id, first.id)
+        self.assertEqual(second.attempts, 2)
+
+    def test_extend_keeps_the_lease(self):
+        self.queue.enqueue([("c1", "m")])
+        job = self.queue.lease("w1", lease_seconds=0.2)[0]
+        self.assertTrue(self.queue.extend(job, lease_seconds=60))
+        time.sleep(0.3)
+        self.assertEqual(self.queue.lease("w2"), [])
+
+
+class FencingTest(WorkQueueTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.queue.enqueue([("c1", "m")])
+        self.stale = self.queue.lease("w1", lease_seconds=0.05)[0]
+        time.sleep(0.1)
+        self.current = self.queue.lease("w2")[0]
+
+    def test_stale_owner_cannot_complete(self):
+        self.assertFalse(self.queue.complete(self.stale))
+        self.assertEqual(self.status(self.queue, "c1"), LEASED)
+        self.assertTrue(self.queue.complete(self.current))
+        self.assertEqual(self.status(self.queue, "c1"), DONE)
+
+    def test_stale_owner_cannot_fail_or_extend(self):
+        self.assertEqual(self.queue.fail(self.stale, "trop tard"), LEASED)
+        self.assertFalse(self.queue.extend(self.stale))
+        self.assertEqual(self.status(self.queue, "c1"), LEASED)
+        self.assertTrue(self.queue.complete(self.current))
+
+
+class RetryTest(WorkQueueTestCase):
+
+    def test_failure_is_retried_after_a_growing_delay(self):
+        queue = self.make_queue(retry_delay=0.2)
+        try:
+            queue.enqueue([("c1", "m")])
+            job = queue.lease("w1")[0]
+            self.assertEqual(queue.fail(job, "quota"), PENDING)
+            self.assertEqual(queue.lease("w1"), [])
+            time.sleep(0.3)
+            job = queue.lease("w1")[0]
+            self.assertEqual(job.attempts, 2)
+            # Deuxième échec: délai doublé (0.4 s)
+            queue.fail(job, "quota")
+            time.sleep(0.2)
+            self.assertEqual(queue.lease("w1"), [])
+            time.sleep(0.3)
+            self.assertEqual(len(queue.lease("w1")), 1)
+        finally:
+            queue.close()
+
+    def test_dead_letter_after_max_attempts(self):
+        self.queue.enqueue([("c1", "m")])
+        for attempt in range(1, 4):
+            job = self.queue.lease("w1")[0]
+            self.assertEqual(job.attempts, attempt)
+            status = self.queue.fail(job, f"erreur {attempt}")
+        self.assertEqual(status, DEAD)
+        self.assertEqual(self.queue.lease("w1"), [])
+        dead = self.queue.dead_letters()
+        self.assertEqual([(job["call_id"], job["attempts"], job["last_error"]) for job in dead], [("c1", 3, "erreur 3")])
+
+        self.assertEqual(self.queue.requeue_dead(), 1)
+        job = self.queue.lease("w1")[0]
+        self.assertEqual(job.attempts, 1)
+
+    def test_expired_lease_on_last_attempt_is_dead(self):
+        queue = self.make_queue(max_attempts=1)
+        try:
+            queue.enqueue([("c1", "m")])
+            queue.lease("w1", lease_seconds=0.05)
+            time.sleep(0.1)
+            self.assertEqual(queue.lease("w2"), [])
+            self.assertEqual(self.status(queue, "c1"), DEAD)
+            self.assertIn("Bail expiré", queue.dead_letters()[0]["last_error"])
+        finally:
+            queue.close()
+
+    def test_reset_requeues_finished_jobs_but_not_leased_ones(self):
+        self.queue.enqueue([("c1", "m"), ("c2", "m")])
+        done = self.queue.lease("w1")[0]
+        self.queue.complete(done)
+        self.queue.lease("w1")
+        self.assertEqual(self.queue.enqueue([("c1", "m"), ("c2", "m")], reset=True), 1)
+        self.assertEqual(self.status(self.queue, done.call_id), PENDING)
+
+
+class WorkerTest(WorkQueueTestCase):
+
+    def run_worker(self, results_db):
+        analysis = mock.Mock(partial=False, missing_attributes=[])
+        with mock.patch("main.PostCallMonitoringSystem.fetch_request", return_value=mock.Mock()), \
+                mock.patch("main.PostCallMonitoringSystem.analyze_call", return_value=analysis):
+            return run_worker(self.queue, results_db, "w", threads=1, idle_exit_s=0.2)
+
+    def test_result_is_stored_before_completion(self):
+        self.queue.enqueue([("c1", "gpt-4o")])
+        results_db = mock.Mock()
+        counters = self.run_worker(results_db)
+        self.assertEqual(counters["done"], 1)
+        self.assertEqual(results_db.store.call_count, 1)
+        self.assertEqual(self.status(self.queue, "c1"), DONE)
+
+    def test_store_error_fails_the_job(self):
+        self.queue.enqueue([("c1", "gpt-4o")])
+        results_db = mock.Mock()
+        results_db.store.side_effect = RuntimeError("database is locked")
+        counters = self.run_worker(results_db)
+        self.assertEqual(counters["done"], 0)
+        self.assertEqual(counters["dead"], 1)
+        self.assertEqual(self.status(self.queue, "c1"), DEAD)
+        self.assertIn("database is locked", self.queue.dead_letters()[0]["last_error"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+"""Budgets de tokens de sortie par question, appris sur la longueur des réponses observées."""
+import contextvars
+import json
+import math
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, Optional
+import numpy as np
+from config import Config
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimation prudente du nombre de tokens d'une réponse (≈ 3 caractères par token en français)."""
+    return max(1, math.ceil(len(text) / 3))
+
+
+# Longueurs des réponses de l'analyse en cours (propagées aux threads d'extraction via in_context)
+_current_lengths: contextvars.ContextVar = contextvars.ContextVar("response_tokens", default=None)
+
+
+@contextmanager
+def collect_response_tokens() -> Iterator[Dict[str, int]]:
+    """Tokens estimés des réponses brutes enregistrées dans ce bloc: {question: plus longue réponse}."""
+    lengths: Dict[str, int] = {}
+    token = _current_lengths.set(lengths)
+    try:
+        yield lengths
+    finally:
+        _current_lengths.reset(token)
+
+
+def compute_budget(samples: Iterable[int], percentile: Optional[float] = None, margin: Optional[float] = None) -> int:
+    """Budget = percentile des longueurs observées × marge, borné par TOKEN_BUDGET_MIN/MAX."""
+    percentile = percentile or Config.TOKEN_BUDGET_PERCENTILE
+    margin = margin or Config.TOKEN_BUDGET_MARGIN
+    value = float(np.percentile(list(samples), percentile)) * margin
+    return int(min(max(math.ceil(value), Config.TOKEN_BUDGET_MIN), Config.TOKEN_BUDGET_MAX))
+
+
+class TokenBudgets:
+    """max_tokens de chaque question d'extraction.
+
+    Par ordre de priorité: budget appris en cours d'exécution (fenêtre des réponses récentes),
+    budget appris enregistré dans le fichier JSON (TOKEN_BUDGETS_PATH), puis "max_tokens"
+    de la configuration de la question.
+    """
+
+    def __init__(self, path: Optional[str] = None, window: int = 2000):
+        self.path = path or Config.TOKEN_BUDGETS_PATH
+        self._samples: Dict[str, deque] = {}
+        self._window = window
+        self._lock = threading.Lock()
+        self._learned = self._load()
+
+    def _load(self) -> Dict[str, dict]:
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Budgets de tokens illisibles ({self.path}): {e}")
+            return {}
+
+    def budget(self, question_config: dict) -> int:
+        name = question_config["name"]
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is not None and len(samples) >= Config.TOKEN_BUDGET_MIN_SAMPLES:
+                return compute_budget(samples)
+        if name in self._learned:
+            return self._learned[name]["max_tokens"]
+        return question_config.get("max_tokens", Config.TOKEN_BUDGET_MAX)
+
+    def record(self, name: str, response: str):
+        """Enregistre la longueur de la réponse finale (continuations comprises), telle que générée par le LLM."""
+        tokens = estimate_tokens(response)
+        with self._lock:
+            self._samples.setdefault(name, deque(maxlen=self._window)).append(tokens)
+            lengths = _current_lengths.get()
+            if lengths is not None:
+                lengths[name] = max(lengths.get(name, 0), tokens)
+
+    def learn(self, rows: Iterable[Dict[str, Any]], questions: Optional[list] = None) -> Dict[str, dict]:
+        """Calcule les budgets à partir d'analyses stockées (longueurs des réponses brutes, response_tokens).
+
+        Les analyses sans longueur enregistrée (antérieures, attribut prédit localement) sont ignorées.
+        """
+        questions = questions or Config.EXTRACTION_QUESTIONS
+        samples: Dict[str, list] = {q["name"]: [] for q in questions}
+        for row in rows:
+            lengths = row.get("response_tokens") or {}
+            for name, values in samples.items():
+                if name in lengths:
+                    values.append(lengths[name])
+        self._learned = {
+            name: {
+                "max_tokens": compute_budget(values),
+                "samples": len(values),
+                "p50": int(np.percentile(values, 50)),
+                "p99": int(np.percentile(values, 99)),
+                "max": int(max(values))
+            }
+            for name, values in samples.items() if len(values) >= Config.TOKEN_BUDGET_MIN_SAMPLES
+        }
+        return self._learned
+
+    def save(self, path: Optional[str] = None):
+        path = path or self.path
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self._learned, f, indent=2, ensure_ascii=False)
+
+
+_budgets: Optional[TokenBudgets] = None
+_budgets_lock = threading.Lock()
+
+
+def get_token_budgets() -> TokenBudgets:
+    """Budgets partagés par le process (le fichier est lu à la première utilisation)."""
+    global _budgets
+    with _budgets_lock:
+        if _budgets is None:
+            _budgets = TokenBudgets()
+        return _budgets
+
+
+if __name__ == "__main__":
+    import argparse
+    from results_db import ResultsDatabase
+
+    parser = argparse.ArgumentParser(description="Apprend les budgets de tokens de sortie par question")
+    parser.add_argument("--db", default=Config.RESULTS_DB_PATH, required=Config.RESULTS_DB_PATH is None, help="Chemin de la base SQLite")
+    parser.add_argument("--output", default=Config.TOKEN_BUDGETS_PATH, help="Fichier JSON des budgets")
+    parser.add_argument("--model", default=None, help="N'utilise que les réponses de ce modèle")
+    parser.add_argument("--since", default=None, help="Date/heure minimale (ISO)")
+    args = parser.parse_args()
+
+    budgets = TokenBudgets(path=args.output)
+    learned = budgets.learn(ResultsDatabase(args.db).query(model=args.model, since=args.since, limit=None))
+    if not learned:
+        print(f"⚠️  Pas assez d'analyses (minimum {Config.TOKEN_BUDGET_MIN_SAMPLES} par question)")
+    else:
+        print("   question              n      p50    p99    max    budget")
+        for name, stats in learned.items():
+            print(f"   {name:<20} {stats['samples']:>6} {stats['p50']:>6} {stats['p99']:>6} {stats['max']:>6} {stats['max_tokens']:>8}")
+        budgets.save()
+        print(f"✅ Budgets enregistrés: {args.output}")
@@ -0,0 +1,500 @@
+"""File de travail durable partagée par plusieurs workers d'analyse (jobs call_id × modèle).
+
+Un worker prend des jobs en bail (lease) pour une durée limitée: tant que le bail court, aucun
+autre worker ne les voit. Un job terminé est marqué "done"; un échec le remet en attente avec un
+délai croissant, puis en dead-letter après QUEUE_MAX_ATTEMPTS tentatives. Si un worker s'arrête
+brutalement, ses baux expirent et les jobs sont repris par les autres: les workers peuvent donc
+être ajoutés ou retirés à tout moment.
+
+Les jobs sont servis par priorité (voir scheduling: appels suspects d'échec d'abord), avec
+équité entre agents: un agent qui occupe déjà plus de workers que les autres perd des points.
+
+Implémentation locale: une base SQLite (mode WAL) partagée par les process d'une même machine
+ou d'un volume partagé.
+"""
+import os
+import socket
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional, Tuple
+from config import Config
+from scheduling import fair_choice
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    call_id TEXT NOT NULL,
+    model TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    priority INTEGER NOT NULL DEFAULT 0,
+    agent_id TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    lease_owner TEXT,
+    lease_expires REAL,
+    last_error TEXT,
+    enqueued_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    UNIQUE (call_id, model)
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs (status, priority DESC, available_at, id);
+CREATE INDEX IF NOT EXISTS idx_jobs_lease ON jobs (status, lease_expires);
+"""
+
+# Statuts d'un job
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+DEAD = "dead"
+
+
+class Job:
+    """Job pris en bail par un worker."""
+
+    def __init__(self, job_id: int, call_id: str, model: str, attempts: int, lease_owner: str, lease_expires: float,
+                 priority: int = 0, agent_id: Optional[str] = None):
+        self.id = job_id
+        self.call_id = call_id
+        self.model = model
+        self.attempts = attempts
+        self.lease_owner = lease_owner
+        self.lease_expires = lease_expires
+        self.priority = priority
+        self.agent_id = agent_id
+
+    def __repr__(self):
+        return f"Job({self.id}, {self.call_id}, {self.model}, tentative {self.attempts})"
+
+
+class WorkQueue(ABC):
+    """Contrat d'une file de travail à baux; voir SQLiteWorkQueue pour l'implémentation locale."""
+
+    @abstractmethod
+    def enqueue(self, jobs: Iterable[tuple], priority: int = 0, reset: bool = False) -> int:
+        """Ajoute des jobs (call_id, modèle) ou (call_id, modèle, priorité, agent_id).
+
+        Retourne le nombre de jobs ajoutés (ou remis en attente avec reset).
+        """
+
+    @abstractmethod
+    def lease(self, worker_id: str, limit: int = 1, lease_seconds: Optional[float] = None) -> List[Job]:
+        """Prend jusqu'à `limit` jobs prêts (en attente ou dont le bail a expiré), par priorité et équité entre agents."""
+
+    @abstractmethod
+    def extend(self, job: Job, lease_seconds: Optional[float] = None) -> bool:
+        """Prolonge le bail d'un job en cours. Faux si le bail a été perdu."""
+
+    @abstractmethod
+    def complete(self, job: Job) -> bool:
+        """Marque le job terminé. Faux si le bail a été perdu (job repris par un autre worker)."""
+
+    @abstractmethod
+    def fail(self, job: Job, error: str) -> str:
+        """Enregistre un échec: nouvelle tentative différée ou dead-letter. Retourne le nouveau statut."""
+
+    @abstractmethod
+    def stats(self) -> Dict[str, int]:
+        """Nombre de jobs par statut."""
+
+    @abstractmethod
+    def dead_letters(self, limit: int = 100) -> List[dict]:
+        """Jobs abandonnés après trop d'échecs (avec la dernière erreur)."""
+
+    @abstractmethod
+    def requeue_dead(self) -> int:
+        """Remet les jobs en dead-letter en attente (compteur de tentatives remis à zéro)."""
+
+
+class SQLiteWorkQueue(WorkQueue):
+    """File de travail stockée dans une base SQLite.
+
+    Chaque prise de bail se fait dans une transaction BEGIN IMMEDIATE: deux workers (threads
+    ou process) ne peuvent pas obtenir le même job. Les mises à jour d'un job en bail vérifient
+    le propriétaire du bail, si bien qu'un worker dont le bail a expiré ne peut plus écraser
+    le statut donné par le worker qui a repris le job.
+    """
+
+    def __init__(self, path: str, max_attempts: Optional[int] = None, lease_seconds: Optional[float] = None,
+                 retry_delay: Optional[float] = None):
+        self.path = path
+        self.max_attempts = max_attempts or Config.QUEUE_MAX_ATTEMPTS
+        self.lease_seconds = lease_seconds or Config.QUEUE_LEASE_SECONDS
+        self.retry_delay = Config.QUEUE_RETRY_DELAY_SECONDS if retry_delay is None else retry_delay
+        self._lock = threading.RLock()
+        # Transactions explicites (isolation_level=None) pour contrôler le verrouillage
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.execute("PRAGMA synchronous = NORMAL")
+        with self._lock:
+            self._conn.executescript(SCHEMA)
+            # Files créées avant l'ordonnancement par agent
+            columns = [row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")]
+            if "agent_id" not in columns:
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN agent_id TEXT")
+
+    def close(self):
+        """Ferme la connexion."""
+        with self._lock:
+            self._conn.close()
+
+    def _transaction(self, sql_steps):
+        """Exécute sql_steps(conn) dans une transaction d'écriture immédiate."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = sql_steps(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def enqueue(self, jobs: Iterable[tuple], priority: int = 0, reset: bool = False) -> int:
+        now = time.time()
+        rows = []
+        for job in dict.fromkeys(tuple(job) for job in jobs):
+            call_id, model, *extra = job
+            job_priority = extra[0] if extra else priority
+            agent_id = extra[1] if len(extra) > 1 else None
+            rows.append((call_id, model, job_priority, agent_id, now, now, now))
+
+        def steps(conn):
+            added = 0
+            for row in rows:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO jobs (call_id, model, priority, agent_id, available_at, enqueued_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)", row
+                )
+                if cursor.rowcount == 0 and reset:
+                    # Job déjà connu: remis en attente sauf s'il est en cours de traitement
+                    cursor = conn.execute(
+                        "UPDATE jobs SET status = ?, priority = ?, agent_id = ?, attempts = 0, available_at = ?, "
+                        "lease_owner = NULL, lease_expires = NULL, last_error = NULL, updated_at = ? "
+                        "WHERE call_id = ? AND model = ? AND status != ?",
+                        (PENDING, row[2], row[3], now, now, row[0], row[1], LEASED)
+                    )
+                added += cursor.rowcount
+            return added
+
+        return self._transaction(steps)
+
+    def lease(self, worker_id: str, limit: int = 1, lease_seconds: Optional[float] = None) -> List[Job]:
+        lease_seconds = lease_seconds or self.lease_seconds
+
+        def steps(conn):
+            now = time.time()
+            # Bail expiré sur la dernière tentative autorisée: le worker a disparu en plein traitement
+            conn.execute(
+                "UPDATE jobs SET status = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ?, "
+                "last_error = COALESCE(last_error, 'Bail expiré (worker arrêté ?)') "
+                "WHERE status = ? AND lease_expires <= ? AND attempts >= ?",
+                (DEAD, now, LEASED, now, self.max_attempts)
+            )
+            candidates = conn.execute(
+                "SELECT id, call_id, model, attempts, priority, agent_id FROM jobs "
+                "WHERE (status = ? AND available_at <= ?) OR (status = ? AND lease_expires <= ?) "
+                "ORDER BY priority DESC, id LIMIT ?",
+                (PENDING, now, LEASED, now, max(limit, Config.SCHEDULER_WINDOW))
+            ).fetchall()
+            # Équité: jobs en cours par agent, tous workers confondus
+            in_flight = dict(conn.execute(
+                "SELECT COALESCE(agent_id, ''), COUNT(*) FROM jobs WHERE status = ? AND lease_expires > ? GROUP BY 1",
+                (LEASED, now)
+            ).fetchall())
+            by_agent = {}
+            for row in candidates:
+                by_agent.setdefault(row["agent_id"] or "", []).append(row)
+            rows = []
+            while len(rows) < limit and by_agent:
+                heads = {agent: (queued[0]["priority"], queued[0]["id"]) for agent, queued in by_agent.items()}
+                agent = fair_choice(heads, in_flight, Config.SCHEDULER_FAIRNESS)
+                rows.append(by_agent[agent].pop(0))
+                in_flight[agent] = in_flight.get(agent, 0) + 1
+                if not by_agent[agent]:
+                    del by_agent[agent]
+
+            expires = now + lease_seconds
+            jobs = []
+            for row in rows:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_owner = ?, lease_expires = ?, updated_at = ? "
+                    "WHERE id = ?",
+                    (LEASED, worker_id, expires, now, row["id"])
+                )
+                jobs.append(Job(row["id"], row["call_id"], row["model"], row["attempts"] + 1, worker_id, expires,
+                                row["priority"], row["agent_id"]))
+            return jobs
+
+        return self._transaction(steps)
+
+    def extend(self, job: Job, lease_seconds: Optional[float] = None) -> bool:
+        now = time.time()
+        expires = now + (lease_seconds or self.lease_seconds)
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE id = ? AND status = ? AND lease_owner = ?",
+                (expires, now, job.id, LEASED, job.lease_owner)
+            )
+        if cursor.rowcount:
+            job.lease_expires = expires
+        return cursor.rowcount == 1
+
+    def complete(self, job: Job) -> bool:
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, lease_owner = NULL, lease_expires = NULL, last_error = NULL, updated_at = ? "
+                "WHERE id = ? AND status = ? AND lease_owner = ?",
+                (DONE, now, job.id, LEASED, job.lease_owner)
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, job: Job, error: str) -> str:
+        now = time.time()
+        if job.attempts >= self.max_attempts:
+            status, available_at = DEAD, now
+        else:
+            # Délai exponentiel entre tentatives (erreurs de quota, API indisponible...)
+            status, available_at = PENDING, now + self.retry_delay * 2 ** (job.attempts - 1)
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, available_at = ?, lease_owner = NULL, lease_expires = NULL, "
+                "last_error = ?, updated_at = ? WHERE id = ? AND status = ? AND lease_owner = ?",
+                (status, available_at, error, now, job.id, LEASED, job.lease_owner)
+            )
+        return status if cursor.rowcount else LEASED
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, DEAD: 0}
+        counts.update({status: count for status, count in rows})
+        return counts
+
+    def dead_letters(self, limit: int = 100) -> List[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT call_id, model, attempts, last_error, updated_at FROM jobs WHERE status = ? ORDER BY updated_at DESC LIMIT ?",
+                (DEAD, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def requeue_dead(self) -> int:
+        now = time.time()
+
+        def steps(conn):
+            return conn.execute(
+                "UPDATE jobs SET status = ?, attempts = 0, available_at = ?, updated_at = ? WHERE status = ?",
+                (PENDING, now, now, DEAD)
+            ).rowcount
+
+        return self._transaction(steps)
+
+
+def default_worker_id() -> str:
+    """Identifiant de worker unique sur le réseau: hôte et pid."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def score_calls(call_ids: List[str], fetch_request, workers: Optional[int] = None) -> Dict[str, Tuple[int, Optional[str]]]:
+    """Priorité (signes d'échec) et agent de chaque appel, en récupérant les appels en parallèle.
+
+    Un appel impossible à récupérer garde la priorité 0: le worker le retentera.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from scheduling import agent_of, priority_score
+
+    def score(call_id: str):
+        try:
+            request = fetch_request(call_id)
+        except Exception as e:
+            print(f"⚠️  Priorité non calculée pour {call_id}: {e}")
+            return 0, None
+        if request is None:
+            return 0, None
+        return int(round(priority_score(request))), agent_of(request) or None
+
+    with ThreadPoolExecutor(max_workers=workers or Config.PIPELINE_FETCH_WORKERS) as executor:
+        return dict(zip(call_ids, executor.map(score, call_ids)))
+
+
+def run_worker(work_queue: WorkQueue, results_db, worker_id: Optional[str] = None, threads: int = 4,
+               deadline_s: Optional[float] = None, idle_exit_s: Optional[float] = None,
+               stop_event: Optional[threading.Event] = None) -> Dict[str, int]:
+    """Traite les jobs de la file jusqu'à arrêt (stop_event) ou inactivité (idle_exit_s).
+
+    Chaque thread prend un job à la fois; les baux des jobs en cours sont prolongés
+    périodiquement tant que le worker est vivant. Les résultats sont enregistrés dans
+    results_db (partagée par tous les workers) avant que le job soit marqué terminé: une
+    erreur d'enregistrement (ex: base verrouillée) est un échec du job, qui sera retenté.
+
+    Returns:
+        Compteurs {"done", "retried", "dead", "lost"}
+    """
+    # Import local: la file peut être alimentée sans charger les clients LLM
+    from deadline import Deadline
+    from main import PostCallMonitoringSystem
+
+    worker_id = worker_id or default_worker_id()
+    stop_event = stop_event or threading.Event()
+    systems: Dict[str, PostCallMonitoringSystem] = {}
+    systems_lock = threading.Lock()
+    active: Dict[int, Job] = {}
+    active_lock = threading.Lock()
+    counters = {"done": 0, "retried": 0, "dead": 0, "lost": 0}
+    counters_lock = threading.Lock()
+    last_activity = [time.time()]
+
+    def get_system(model: str) -> PostCallMonitoringSystem:
+        with systems_lock:
+            if model not in systems:
+                # Sans results_db: le worker enregistre lui-même, sans que les erreurs soient ignorées
+                systems[model] = PostCallMonitoringSystem(model_name=model)
+            return systems[model]
+
+    def count(name: str):
+        with counters_lock:
+            counters[name] += 1
+
+    def process(job: Job):
+        system = get_system(job.model)
+        request = system.fetch_request(job.call_id)
+        if request is None:
+            raise LookupError("Impossible de récupérer l'appel depuis l'API Call Rounded")
+        analysis = system.analyze_call(request, None, Deadline(deadline_s))
+        if analysis.partial:
+            # Analyse partielle (délai dépassé): non enregistrée en base, donc à refaire
+            raise TimeoutError(f"Analyse partielle, attributs manquants: {', '.join(analysis.missing_attributes)}")
+        results_db.store(analysis, job.model, request, config_hash=Config.get_config_hash())
+
+    def loop(number: int):
+        thread_worker_id = f"{worker_id}/{number}"
+        while not stop_event.is_set():
+            jobs = work_queue.lease(thread_worker_id)
+            if not jobs:
+                if idle_exit_s is not None and time.time() - last_activity[0] >= idle_exit_s:
+                    break
+                stop_event.wait(Config.QUEUE_POLL_SECONDS)
+                continue
+            job = jobs[0]
+            last_activity[0] = time.time()
+            with active_lock:
+                active[job.id] = job
+            try:
+                process(job)
+            except Exception as e:
+                status = work_queue.fail(job, f"{type(e).__name__}: {e}")
+                count({PENDING: "retried", DEAD: "dead"}.get(status, "lost"))
+                print(f"❌ {job.call_id} × {job.model} (tentative {job.attempts}): {e} → {status}")
+            else:
+                if work_queue.complete(job):
+                    count("done")
+                    print(f"✅ {job.call_id} × {job.model}")
+                else:
+                    count("lost")
+                    print(f"⚠️  Bail perdu pour {job.call_id} × {job.model} (repris par un autre worker)")
+            finally:
+                with active_lock:
+                    active.pop(job.id, None)
+                last_activity[0] = time.time()
+
+    def heartbeat():
+        # Prolonge les baux en cours bien avant leur expiration
+        interval = max(1.0, getattr(work_queue, "lease_seconds", Config.QUEUE_LEASE_SECONDS) / 3)
+        while not stop_event.wait(interval):
+            with active_lock:
+                jobs = list(active.values())
+            for job in jobs:
+                work_queue.extend(job)
+
+    workers = [threading.Thread(target=loop, args=(number,), name=f"queue-worker-{number}", daemon=True)
+               for number in range(max(1, threads))]
+    for thread in workers:
+        thread.start()
+    heartbeat_thread = threading.Thread(target=heartbeat, name="queue-heartbeat", daemon=True)
+    heartbeat_thread.start()
+    try:
+        for thread in workers:
+            while thread.is_alive():
+                thread.join(timeout=1.0)
+    finally:
+        stop_event.set()
+    return counters
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="File de travail durable des analyses (call_id × modèle)")
+    parser.add_argument("--queue", default=Config.QUEUE_DB_PATH, help="Chemin de la base SQLite de la file (défaut: QUEUE_DB_PATH)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    enqueue_parser = subparsers.add_parser("enqueue", help="Ajoute des jobs (défaut: CALL_IDS × MODELS de generate_csv)")
+    enqueue_parser.add_argument("--call-id", nargs="+", default=None, help="call_ids à ajouter")
+    enqueue_parser.add_argument("--file", default=None, help="Fichier d'un call_id par ligne")
+    enqueue_parser.add_argument("--model", nargs="+", default=None, help="Modèles (défaut: MODELS de generate_csv)")
+    enqueue_parser.add_argument("--priority", type=int, default=0, help="Priorité (les plus élevées sont traitées d'abord)")
+    enqueue_parser.add_argument("--reset", action="store_true", help="Remet en attente les jobs déjà terminés ou abandonnés")
+    enqueue_parser.add_argument("--prioritize", action="store_true",
+                                help="Récupère chaque appel pour calculer sa priorité (signes d'échec) et son agent")
+
+    worker_parser = subparsers.add_parser("worker", help="Traite les jobs de la file")
+    worker_parser.add_argument("--db", default=Config.RESULTS_DB_PATH, help="Base des résultats (défaut: RESULTS_DB_PATH)")
+    worker_parser.add_argument("--threads", type=int, default=Config.BATCH_MAX_WORKERS, help="Jobs traités en parallèle")
+    worker_parser.add_argument("--deadline", type=float, metavar="SECONDES", default=Config.CALL_DEADLINE_SECONDS)
+    worker_parser.add_argument("--idle-exit", type=float, metavar="SECONDES", default=None,
+                               help="S'arrête après cette durée sans job (défaut: attend indéfiniment)")
+    worker_parser.add_argument("--worker-id", default=None, help="Identifiant du worker (défaut: hôte:pid)")
+
+    subparsers.add_parser("stats", help="Nombre de jobs par statut")
+    dead_parser = subparsers.add_parser("dead", help="Liste les jobs en dead-letter")
+    dead_parser.add_argument("--limit", type=int, default=100)
+    subparsers.add_parser("requeue-dead", help="Remet les jobs en dead-letter en attente")
+
+    args = parser.parse_args()
+    work_queue = SQLiteWorkQueue(args.queue)
+
+    if args.command == "enqueue":
+        import generate_csv
+        call_ids = list(args.call_id or [])
+        if args.file:
+            with open(args.file, encoding="utf-8") as f:
+                call_ids.extend(line.strip() for line in f if line.strip())
+        call_ids = call_ids or generate_csv.CALL_IDS
+        models = args.model or generate_csv.MODELS
+        call_ids = list(dict.fromkeys(call_ids))
+        if args.prioritize:
+            scores = score_calls(call_ids, generate_csv.get_system(models[0]).fetch_request)
+            jobs = [(call_id, model, scores[call_id][0] + args.priority, scores[call_id][1])
+                    for call_id in call_ids for model in models]
+        else:
+            jobs = [(call_id, model) for call_id in call_ids for model in models]
+        added = work_queue.enqueue(jobs, priority=args.priority, reset=args.reset)
+        print(f"📥 {added} jobs ajoutés ({len(call_ids)} appels × {len(models)} modèles)")
+    elif args.command == "worker":
+        if not args.db:
+            parser.error("Base des résultats manquante (--db ou RESULTS_DB_PATH)")
+        from anomaly_detector import attach_detector
+        from results_db import ResultsDatabase
+        results_db = ResultsDatabase(args.db)
+        attach_detector(results_db)
+        print(f"👷 Worker {args.worker_id or default_worker_id()}: {args.threads} threads sur {args.queue}")
+        try:
+            counters = run_worker(work_queue, results_db, args.worker_id, args.threads, args.deadline, args.idle_exit)
+        except KeyboardInterrupt:
+            print("\n⚠️  Arrêt du worker (les jobs en cours seront repris à l'expiration de leur bail)")
+            sys.exit(1)
+        print(f"📊 {counters['done']} terminés, {counters['retried']} à retenter, {counters['dead']} abandonnés, {counters['lost']} baux perdus")
+    elif args.command == "stats":
+        for status, count in work_queue.stats().items():
+            print(f"{status:<8} {count}")
+    elif args.command == "dead":
+        for job in work_queue.dead_letters(args.limit):
+            print(f"{job['call_id']}  {job['model']}  {job['attempts']} tentatives  {job['last_error']}")
+    else:
+        print(f"🔁 {work_queue.requeue_dead()} jobs remis en attente")